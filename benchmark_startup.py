@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Measures how long a fresh interpreter takes to import our flask app, which is
+what every uWSGI worker pays on scale-out. Runs each import in a new process
+and reports the median plus the slowest modules from -X importtime.
+"""
+import argparse, os, statistics, subprocess, sys
+
+IMPORT_SNIPPET = 'import time; start = time.perf_counter(); import grubstack; print(time.perf_counter() - start)'
+
+def time_import(env):
+  result = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], env=env, capture_output=True, text=True, check=True)
+  return float(result.stdout.strip().splitlines()[-1])
+
+def slowest_modules(env, count):
+  result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import grubstack'], env=env, capture_output=True, text=True, check=True)
+  modules = []
+  for line in result.stderr.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    own, cumulative, name = line[len('import time:'):].split('|')
+    modules.append((int(cumulative), int(own), name.strip()))
+  return sorted(modules, reverse=True)[:count]
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-c', '--config', dest='config', help='full path to GrubStack API config file')
+  parser.add_argument('-n', '--runs', dest='runs', type=int, default=10, help='number of fresh imports to time')
+  parser.add_argument('-t', '--top', dest='top', type=int, default=15, help='number of slowest modules to list')
+  args = parser.parse_args()
+
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.path.dirname(os.path.realpath(__file__)) + os.pathsep + env.get('PYTHONPATH', '')
+  if args.config is not None:
+    env['GRUBSTACK_CONFIG_FILE'] = args.config
+
+  timings = [time_import(env) for _ in range(args.runs)]
+  print(f'import grubstack: median {statistics.median(timings) * 1000:.1f} ms, '
+        f'min {min(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms over {args.runs} runs')
+
+  print(f'\n{"cumulative ms":>14} {"self ms":>9}  module')
+  for cumulative, own, name in slowest_modules(env, args.top):
+    print(f'{cumulative / 1000:>14.1f} {own / 1000:>9.1f}  {name}')
@@ -60,12 +60,14 @@ ALTER TABLE public.gs_location_order_type OWNER TO grubstack;
 CREATE TABLE public.gs_location_working_hour (
     tenant_id UUID NOT NULL REFERENCES gs_tenant (tenant_id) ON DELETE RESTRICT,
     location_id INT NOT NULL,
+    working_hour_type_id integer NOT NULL,
     day integer NOT NULL,
     open_hour smallint NOT NULL,
     open_minute smallint NOT NULL,
     close_hour smallint NOT NULL,
     close_minute smallint NOT NULL,
-    is_open boolean DEFAULT 'f'
+    is_open boolean DEFAULT 'f',
+    UNIQUE (tenant_id, location_id, working_hour_type_id, day)
 );
 ALTER TABLE public.gs_location_working_hour OWNER TO grubstack;
 
@@ -0,0 +1,29 @@
+-- migrate: no-transaction
+-- Tenant-leading indexes for the access patterns in the services. Every query
+-- on these tables is filtered by tenant_isolation_policy (tenant_id = ...)
+-- plus one or two foreign keys, so tenant_id leads every index. Built
+-- concurrently so writes keep flowing while they build.
+
+-- Reverse lookups on the join tables; the forward direction is covered by
+-- the unique keys in 0002
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_menu_item_tenant_item_idx ON gs_menu_item (tenant_id, item_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_item_ingredient_tenant_ingredient_idx ON gs_item_ingredient (tenant_id, ingredient_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_item_variety_tenant_variety_idx ON gs_item_variety (tenant_id, variety_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_variety_ingredient_tenant_ingredient_idx ON gs_variety_ingredient (tenant_id, ingredient_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_location_menu_tenant_menu_idx ON gs_location_menu (tenant_id, menu_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_location_order_type_tenant_order_type_idx ON gs_location_order_type (tenant_id, order_type_id);
+
+-- Listings ordered by name or date within a tenant
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_menu_tenant_name_idx ON gs_menu (tenant_id, name);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_item_tenant_name_idx ON gs_item (tenant_id, name);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_variety_tenant_name_idx ON gs_variety (tenant_id, name);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_ingredient_tenant_name_idx ON gs_ingredient (tenant_id, name);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_location_tenant_create_date_idx ON gs_location (tenant_id, create_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_employee_tenant_hire_date_idx ON gs_employee (tenant_id, hire_date);
+
+-- Slug lookups when creating and renaming menus and items
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_menu_tenant_slug_idx ON gs_menu (tenant_id, slug);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_item_tenant_slug_idx ON gs_item (tenant_id, slug);
+
+-- Log viewer pages through a tenant's newest records
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_log_tenant_created_idx ON gs_log (tenant_id, log_created DESC);
@@ -0,0 +1,58 @@
+-- migrate: no-transaction
+-- Unique tenant-leading keys on the join tables. They double as the lookup
+-- index for the (tenant, parent) side and let inserts use ON CONFLICT instead
+-- of a separate existence check. Duplicate rows left by the old
+-- check-then-insert code are removed first, keeping one copy of each. The
+-- keys are built concurrently so writes to these tables keep flowing.
+--
+-- The DELETEs need to see every tenant's rows: run as a role with BYPASSRLS,
+-- since FORCE ROW LEVEL SECURITY applies to the table owner as well.
+
+DELETE FROM gs_menu_item a USING gs_menu_item b
+ WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.menu_id = b.menu_id AND a.item_id = b.item_id;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS gs_menu_item_tenant_menu_item_key ON gs_menu_item (tenant_id, menu_id, item_id);
+
+DELETE FROM gs_item_ingredient a USING gs_item_ingredient b
+ WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.item_id = b.item_id AND a.ingredient_id = b.ingredient_id;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS gs_item_ingredient_tenant_item_ingredient_key ON gs_item_ingredient (tenant_id, item_id, ingredient_id);
+
+DELETE FROM gs_item_variety a USING gs_item_variety b
+ WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.item_id = b.item_id AND a.variety_id = b.variety_id;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS gs_item_variety_tenant_item_variety_key ON gs_item_variety (tenant_id, item_id, variety_id);
+
+DELETE FROM gs_variety_ingredient a USING gs_variety_ingredient b
+ WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.variety_id = b.variety_id AND a.ingredient_id = b.ingredient_id;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS gs_variety_ingredient_tenant_variety_ingredient_key ON gs_variety_ingredient (tenant_id, variety_id, ingredient_id);
+
+DELETE FROM gs_location_menu a USING gs_location_menu b
+ WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.location_id = b.location_id AND a.menu_id = b.menu_id;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS gs_location_menu_tenant_location_menu_key ON gs_location_menu (tenant_id, location_id, menu_id);
+
+DELETE FROM gs_location_order_type a USING gs_location_order_type b
+ WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.location_id = b.location_id AND a.order_type_id = b.order_type_id;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS gs_location_order_type_tenant_location_order_type_key ON gs_location_order_type (tenant_id, location_id, order_type_id);
+
+DELETE FROM gs_location_property a USING gs_location_property b
+ WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.location_id = b.location_id AND a.key = b.key;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS gs_location_property_tenant_location_key_key ON gs_location_property (tenant_id, location_id, key);
+
+-- Older databases were created before the working hours upsert and lack the
+-- (tenant_id, location_id, working_hour_type_id, day) key it relies on. The
+-- check needs a DO block, where CONCURRENTLY is not allowed; the table holds a
+-- handful of rows per location, so the plain build is over in milliseconds.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_index i
+                  WHERE i.indrelid = 'gs_location_working_hour'::regclass AND i.indisunique
+                    AND i.indkey::int2[] = (SELECT array_agg(attnum ORDER BY array_position(ARRAY['tenant_id', 'location_id', 'working_hour_type_id', 'day'], attname::text))
+                                              FROM pg_attribute
+                                             WHERE attrelid = 'gs_location_working_hour'::regclass
+                                               AND attname IN ('tenant_id', 'location_id', 'working_hour_type_id', 'day'))) THEN
+    DELETE FROM gs_location_working_hour a USING gs_location_working_hour b
+     WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.location_id = b.location_id
+       AND a.working_hour_type_id = b.working_hour_type_id AND a.day = b.day;
+    CREATE UNIQUE INDEX gs_location_working_hour_tenant_location_type_day_key
+        ON gs_location_working_hour (tenant_id, location_id, working_hour_type_id, day);
+  END IF;
+END
+$$;
@@ -0,0 +1,22 @@
+-- Published menu document per location, rebuilt by the publishing service
+-- whenever a menu, item, ingredient or variety it contains changes. Storefront
+-- reads are a single primary key lookup instead of a join across six tables.
+--
+-- The rebuild runs after the writing request has answered. pending_at is set
+-- by that request so reads fall back to the live query until a publish that
+-- started after it has landed.
+
+CREATE TABLE IF NOT EXISTS public.gs_location_menu_snapshot (
+    tenant_id UUID NOT NULL REFERENCES gs_tenant (tenant_id) ON DELETE RESTRICT,
+    location_id integer NOT NULL,
+    menus jsonb NOT NULL DEFAULT '[]'::jsonb,
+    version integer NOT NULL DEFAULT 1,
+    published_at timestamp with time zone NOT NULL DEFAULT now(),
+    pending_at timestamp with time zone,
+    PRIMARY KEY (tenant_id, location_id)
+);
+ALTER TABLE public.gs_location_menu_snapshot OWNER TO grubstack;
+
+ALTER TABLE gs_location_menu_snapshot ENABLE ROW LEVEL SECURITY;
+ALTER TABLE gs_location_menu_snapshot FORCE ROW LEVEL SECURITY;
+CREATE POLICY tenant_isolation_policy ON gs_location_menu_snapshot USING (tenant_id = current_setting('app.tenant_id')::UUID);
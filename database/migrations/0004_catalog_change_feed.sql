@@ -0,0 +1,200 @@
+-- Change tracking for catalog sync clients (/changes?since=<version>).
+--
+-- Every insert or update of a menu, item, ingredient or variety stamps the row
+-- with the next version of its tenant's catalog and updated_at; deletes leave a
+-- tombstone carrying a version of their own. Changes to the join tables bump the
+-- parent row, so a client re-fetches a menu when its items or prices change.
+--
+-- Versions come from one counter row per tenant that stays locked until the
+-- writing transaction commits, so they become visible in order and a client
+-- that has seen version N can never later miss a change numbered below N.
+
+CREATE TABLE IF NOT EXISTS public.gs_catalog_version (
+    tenant_id UUID PRIMARY KEY NOT NULL REFERENCES gs_tenant (tenant_id) ON DELETE RESTRICT,
+    version bigint NOT NULL DEFAULT 0
+);
+ALTER TABLE public.gs_catalog_version OWNER TO grubstack;
+
+CREATE TABLE IF NOT EXISTS public.gs_catalog_tombstone (
+    tenant_id UUID NOT NULL REFERENCES gs_tenant (tenant_id) ON DELETE RESTRICT,
+    entity character varying(32) NOT NULL,
+    entity_id integer NOT NULL,
+    version bigint NOT NULL,
+    deleted_at timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (tenant_id, entity, entity_id)
+);
+ALTER TABLE public.gs_catalog_tombstone OWNER TO grubstack;
+
+ALTER TABLE gs_catalog_version ENABLE ROW LEVEL SECURITY;
+ALTER TABLE gs_catalog_version FORCE ROW LEVEL SECURITY;
+CREATE POLICY tenant_isolation_policy ON gs_catalog_version USING (tenant_id = current_setting('app.tenant_id')::UUID);
+
+ALTER TABLE gs_catalog_tombstone ENABLE ROW LEVEL SECURITY;
+ALTER TABLE gs_catalog_tombstone FORCE ROW LEVEL SECURITY;
+CREATE POLICY tenant_isolation_policy ON gs_catalog_tombstone USING (tenant_id = current_setting('app.tenant_id')::UUID);
+
+ALTER TABLE gs_menu ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 0;
+ALTER TABLE gs_menu ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone NOT NULL DEFAULT now();
+ALTER TABLE gs_item ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 0;
+ALTER TABLE gs_item ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone NOT NULL DEFAULT now();
+ALTER TABLE gs_ingredient ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 0;
+ALTER TABLE gs_ingredient ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone NOT NULL DEFAULT now();
+ALTER TABLE gs_variety ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 0;
+ALTER TABLE gs_variety ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone NOT NULL DEFAULT now();
+
+-- Existing rows get distinct versions too, so a full sync can be paged with
+-- the same cursor as incremental ones
+DO $$
+DECLARE
+  t record;
+BEGIN
+  FOR t IN SELECT * FROM (VALUES ('gs_menu', 'menu_id'), ('gs_item', 'item_id'),
+                                 ('gs_ingredient', 'ingredient_id'), ('gs_variety', 'variety_id')) AS v (tbl, id) LOOP
+    EXECUTE format('UPDATE %1$I r
+                       SET version = COALESCE(cv.version, 0) + n.rn
+                      FROM (SELECT tenant_id, %2$I AS id, row_number() OVER (PARTITION BY tenant_id ORDER BY %2$I) AS rn
+                              FROM %1$I) n
+                      LEFT JOIN gs_catalog_version cv ON cv.tenant_id = n.tenant_id
+                     WHERE r.%2$I = n.id AND r.version = 0', t.tbl, t.id);
+    EXECUTE format('INSERT INTO gs_catalog_version (tenant_id, version)
+                    SELECT tenant_id, MAX(version) FROM %1$I GROUP BY tenant_id
+                        ON CONFLICT (tenant_id) DO UPDATE SET version = GREATEST(gs_catalog_version.version, EXCLUDED.version)', t.tbl);
+  END LOOP;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS gs_menu_tenant_version_idx ON gs_menu (tenant_id, version);
+CREATE INDEX IF NOT EXISTS gs_item_tenant_version_idx ON gs_item (tenant_id, version);
+CREATE INDEX IF NOT EXISTS gs_ingredient_tenant_version_idx ON gs_ingredient (tenant_id, version);
+CREATE INDEX IF NOT EXISTS gs_variety_tenant_version_idx ON gs_variety (tenant_id, version);
+CREATE INDEX IF NOT EXISTS gs_catalog_tombstone_tenant_version_idx ON gs_catalog_tombstone (tenant_id, version);
+
+CREATE OR REPLACE FUNCTION gs_next_catalog_version(p_tenant_id UUID) RETURNS bigint AS $$
+  INSERT INTO gs_catalog_version AS cv (tenant_id, version)
+  VALUES (p_tenant_id, 1)
+      ON CONFLICT (tenant_id) DO UPDATE SET version = cv.version + 1
+  RETURNING version;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION gs_catalog_stamp() RETURNS trigger AS $$
+BEGIN
+  NEW.version := gs_next_catalog_version(NEW.tenant_id);
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- TG_ARGV[0] is the entity name reported by the feed, TG_ARGV[1] its id column
+CREATE OR REPLACE FUNCTION gs_catalog_tombstone() RETURNS trigger AS $$
+DECLARE
+  v_entity_id integer := (to_jsonb(OLD) ->> TG_ARGV[1])::integer;
+BEGIN
+  INSERT INTO gs_catalog_tombstone (tenant_id, entity, entity_id, version, deleted_at)
+  VALUES (OLD.tenant_id, TG_ARGV[0], v_entity_id, gs_next_catalog_version(OLD.tenant_id), now())
+      ON CONFLICT (tenant_id, entity, entity_id) DO UPDATE
+     SET version = EXCLUDED.version,
+         deleted_at = EXCLUDED.deleted_at;
+  RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+-- TG_ARGV[0] is the parent table, TG_ARGV[1] the id column it shares with the
+-- join table. Touching the parent fires its stamp trigger. Runs once per
+-- statement over its transition tables, so a bulk write to a join table bumps
+-- each parent it touched once rather than once per row.
+CREATE OR REPLACE FUNCTION gs_catalog_touch_parent() RETURNS trigger AS $$
+DECLARE
+  v_changed text;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    v_changed := format('SELECT %I FROM new_rows', TG_ARGV[1]);
+  ELSIF TG_OP = 'DELETE' THEN
+    v_changed := format('SELECT %I FROM old_rows', TG_ARGV[1]);
+  ELSE
+    v_changed := format('SELECT %1$I FROM new_rows UNION SELECT %1$I FROM old_rows', TG_ARGV[1]);
+  END IF;
+
+  EXECUTE format('UPDATE %I SET updated_at = now() WHERE %I IN (%s)', TG_ARGV[0], TG_ARGV[1], v_changed);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS gs_menu_stamp ON gs_menu;
+CREATE TRIGGER gs_menu_stamp BEFORE INSERT OR UPDATE ON gs_menu
+  FOR EACH ROW EXECUTE FUNCTION gs_catalog_stamp();
+DROP TRIGGER IF EXISTS gs_item_stamp ON gs_item;
+CREATE TRIGGER gs_item_stamp BEFORE INSERT OR UPDATE ON gs_item
+  FOR EACH ROW EXECUTE FUNCTION gs_catalog_stamp();
+DROP TRIGGER IF EXISTS gs_ingredient_stamp ON gs_ingredient;
+CREATE TRIGGER gs_ingredient_stamp BEFORE INSERT OR UPDATE ON gs_ingredient
+  FOR EACH ROW EXECUTE FUNCTION gs_catalog_stamp();
+DROP TRIGGER IF EXISTS gs_variety_stamp ON gs_variety;
+CREATE TRIGGER gs_variety_stamp BEFORE INSERT OR UPDATE ON gs_variety
+  FOR EACH ROW EXECUTE FUNCTION gs_catalog_stamp();
+
+DROP TRIGGER IF EXISTS gs_menu_tombstone ON gs_menu;
+CREATE TRIGGER gs_menu_tombstone AFTER DELETE ON gs_menu
+  FOR EACH ROW EXECUTE FUNCTION gs_catalog_tombstone('menu', 'menu_id');
+DROP TRIGGER IF EXISTS gs_item_tombstone ON gs_item;
+CREATE TRIGGER gs_item_tombstone AFTER DELETE ON gs_item
+  FOR EACH ROW EXECUTE FUNCTION gs_catalog_tombstone('item', 'item_id');
+DROP TRIGGER IF EXISTS gs_ingredient_tombstone ON gs_ingredient;
+CREATE TRIGGER gs_ingredient_tombstone AFTER DELETE ON gs_ingredient
+  FOR EACH ROW EXECUTE FUNCTION gs_catalog_tombstone('ingredient', 'ingredient_id');
+DROP TRIGGER IF EXISTS gs_variety_tombstone ON gs_variety;
+CREATE TRIGGER gs_variety_tombstone AFTER DELETE ON gs_variety
+  FOR EACH ROW EXECUTE FUNCTION gs_catalog_tombstone('variety', 'variety_id');
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS gs_menu_item_touch ON gs_menu_item;
+DROP TRIGGER IF EXISTS gs_menu_item_touch_insert ON gs_menu_item;
+CREATE TRIGGER gs_menu_item_touch_insert AFTER INSERT ON gs_menu_item
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_menu', 'menu_id');
+DROP TRIGGER IF EXISTS gs_menu_item_touch_update ON gs_menu_item;
+CREATE TRIGGER gs_menu_item_touch_update AFTER UPDATE ON gs_menu_item
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_menu', 'menu_id');
+DROP TRIGGER IF EXISTS gs_menu_item_touch_delete ON gs_menu_item;
+CREATE TRIGGER gs_menu_item_touch_delete AFTER DELETE ON gs_menu_item
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_menu', 'menu_id');
+DROP TRIGGER IF EXISTS gs_item_ingredient_touch ON gs_item_ingredient;
+DROP TRIGGER IF EXISTS gs_item_ingredient_touch_insert ON gs_item_ingredient;
+CREATE TRIGGER gs_item_ingredient_touch_insert AFTER INSERT ON gs_item_ingredient
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_item', 'item_id');
+DROP TRIGGER IF EXISTS gs_item_ingredient_touch_update ON gs_item_ingredient;
+CREATE TRIGGER gs_item_ingredient_touch_update AFTER UPDATE ON gs_item_ingredient
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_item', 'item_id');
+DROP TRIGGER IF EXISTS gs_item_ingredient_touch_delete ON gs_item_ingredient;
+CREATE TRIGGER gs_item_ingredient_touch_delete AFTER DELETE ON gs_item_ingredient
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_item', 'item_id');
+DROP TRIGGER IF EXISTS gs_item_variety_touch ON gs_item_variety;
+DROP TRIGGER IF EXISTS gs_item_variety_touch_insert ON gs_item_variety;
+CREATE TRIGGER gs_item_variety_touch_insert AFTER INSERT ON gs_item_variety
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_item', 'item_id');
+DROP TRIGGER IF EXISTS gs_item_variety_touch_update ON gs_item_variety;
+CREATE TRIGGER gs_item_variety_touch_update AFTER UPDATE ON gs_item_variety
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_item', 'item_id');
+DROP TRIGGER IF EXISTS gs_item_variety_touch_delete ON gs_item_variety;
+CREATE TRIGGER gs_item_variety_touch_delete AFTER DELETE ON gs_item_variety
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_item', 'item_id');
+DROP TRIGGER IF EXISTS gs_variety_ingredient_touch ON gs_variety_ingredient;
+DROP TRIGGER IF EXISTS gs_variety_ingredient_touch_insert ON gs_variety_ingredient;
+CREATE TRIGGER gs_variety_ingredient_touch_insert AFTER INSERT ON gs_variety_ingredient
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_variety', 'variety_id');
+DROP TRIGGER IF EXISTS gs_variety_ingredient_touch_update ON gs_variety_ingredient;
+CREATE TRIGGER gs_variety_ingredient_touch_update AFTER UPDATE ON gs_variety_ingredient
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_variety', 'variety_id');
+DROP TRIGGER IF EXISTS gs_variety_ingredient_touch_delete ON gs_variety_ingredient;
+CREATE TRIGGER gs_variety_ingredient_touch_delete AFTER DELETE ON gs_variety_ingredient
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_catalog_touch_parent('gs_variety', 'variety_id');
@@ -0,0 +1,22 @@
+-- migrate: no-transaction
+-- Indexes behind GET /search. Full-text matching (with prefixes) uses an
+-- expression index on name and description with the 'simple' configuration,
+-- which keeps brand and dish names unstemmed; typo tolerance uses trigram
+-- indexes on name. The expressions must stay identical to the ones in
+-- catalog_constants.SEARCH_BRANCH or the planner cannot use them.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_menu_name_trgm_idx ON gs_menu USING gin (name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_item_name_trgm_idx ON gs_item USING gin (name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_ingredient_name_trgm_idx ON gs_ingredient USING gin (name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_variety_name_trgm_idx ON gs_variety USING gin (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_menu_search_idx ON gs_menu
+  USING gin (to_tsvector('simple', COALESCE(name, '') || ' ' || COALESCE(description, '')));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_item_search_idx ON gs_item
+  USING gin (to_tsvector('simple', COALESCE(name, '') || ' ' || COALESCE(description, '')));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_ingredient_search_idx ON gs_ingredient
+  USING gin (to_tsvector('simple', COALESCE(name, '') || ' ' || COALESCE(description, '')));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gs_variety_search_idx ON gs_variety
+  USING gin (to_tsvector('simple', COALESCE(name, '') || ' ' || COALESCE(description, '')));
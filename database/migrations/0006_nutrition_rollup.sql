@@ -0,0 +1,101 @@
+-- Nutrition totals per item and variety, maintained by the nutrition service
+-- whenever an ingredient or an ingredient link they depend on changes. Rows go
+-- away with their item or variety.
+--
+-- The recompute runs after the request, so the writes themselves discard the
+-- rows they make stale in their own transaction. If the recompute fails the
+-- totals are computed again on the next read instead of being served stale.
+--
+-- Items carry three totals: standard (as served, optional ingredients
+-- included), minimum (optional ingredients removed) and maximum (every add-on
+-- and extra added).
+
+CREATE TABLE IF NOT EXISTS public.gs_item_nutrition (
+    tenant_id UUID NOT NULL REFERENCES gs_tenant (tenant_id) ON DELETE RESTRICT,
+    item_id integer NOT NULL REFERENCES gs_item (item_id) ON DELETE CASCADE,
+    standard jsonb NOT NULL,
+    minimum jsonb NOT NULL,
+    maximum jsonb NOT NULL,
+    computed_at timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (tenant_id, item_id)
+);
+ALTER TABLE public.gs_item_nutrition OWNER TO grubstack;
+
+CREATE TABLE IF NOT EXISTS public.gs_variety_nutrition (
+    tenant_id UUID NOT NULL REFERENCES gs_tenant (tenant_id) ON DELETE RESTRICT,
+    variety_id integer NOT NULL REFERENCES gs_variety (variety_id) ON DELETE CASCADE,
+    total jsonb NOT NULL,
+    computed_at timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (tenant_id, variety_id)
+);
+ALTER TABLE public.gs_variety_nutrition OWNER TO grubstack;
+
+CREATE INDEX IF NOT EXISTS gs_item_nutrition_item_idx ON gs_item_nutrition (item_id);
+CREATE INDEX IF NOT EXISTS gs_variety_nutrition_variety_idx ON gs_variety_nutrition (variety_id);
+
+ALTER TABLE gs_item_nutrition ENABLE ROW LEVEL SECURITY;
+ALTER TABLE gs_item_nutrition FORCE ROW LEVEL SECURITY;
+CREATE POLICY tenant_isolation_policy ON gs_item_nutrition USING (tenant_id = current_setting('app.tenant_id')::UUID);
+
+ALTER TABLE gs_variety_nutrition ENABLE ROW LEVEL SECURITY;
+ALTER TABLE gs_variety_nutrition FORCE ROW LEVEL SECURITY;
+CREATE POLICY tenant_isolation_policy ON gs_variety_nutrition USING (tenant_id = current_setting('app.tenant_id')::UUID);
+
+CREATE OR REPLACE FUNCTION gs_nutrition_discard() RETURNS trigger AS $$
+DECLARE
+  v_changed text;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    v_changed := format('SELECT %I FROM new_rows', TG_ARGV[1]);
+  ELSIF TG_OP = 'DELETE' THEN
+    v_changed := format('SELECT %I FROM old_rows', TG_ARGV[1]);
+  ELSE
+    v_changed := format('SELECT %1$I FROM new_rows UNION SELECT %1$I FROM old_rows', TG_ARGV[1]);
+  END IF;
+
+  EXECUTE format('DELETE FROM %I WHERE %I IN (%s)', TG_ARGV[0], TG_ARGV[1], v_changed);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION gs_nutrition_discard_ingredient() RETURNS trigger AS $$
+BEGIN
+  DELETE FROM gs_item_nutrition
+   WHERE item_id IN (SELECT item_id FROM gs_item_ingredient WHERE ingredient_id = OLD.ingredient_id);
+  DELETE FROM gs_variety_nutrition
+   WHERE variety_id IN (SELECT variety_id FROM gs_variety_ingredient WHERE ingredient_id = OLD.ingredient_id);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS gs_item_ingredient_nutrition_insert ON gs_item_ingredient;
+CREATE TRIGGER gs_item_ingredient_nutrition_insert AFTER INSERT ON gs_item_ingredient
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_nutrition_discard('gs_item_nutrition', 'item_id');
+DROP TRIGGER IF EXISTS gs_item_ingredient_nutrition_update ON gs_item_ingredient;
+CREATE TRIGGER gs_item_ingredient_nutrition_update AFTER UPDATE ON gs_item_ingredient
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_nutrition_discard('gs_item_nutrition', 'item_id');
+DROP TRIGGER IF EXISTS gs_item_ingredient_nutrition_delete ON gs_item_ingredient;
+CREATE TRIGGER gs_item_ingredient_nutrition_delete AFTER DELETE ON gs_item_ingredient
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_nutrition_discard('gs_item_nutrition', 'item_id');
+DROP TRIGGER IF EXISTS gs_variety_ingredient_nutrition_insert ON gs_variety_ingredient;
+CREATE TRIGGER gs_variety_ingredient_nutrition_insert AFTER INSERT ON gs_variety_ingredient
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_nutrition_discard('gs_variety_nutrition', 'variety_id');
+DROP TRIGGER IF EXISTS gs_variety_ingredient_nutrition_update ON gs_variety_ingredient;
+CREATE TRIGGER gs_variety_ingredient_nutrition_update AFTER UPDATE ON gs_variety_ingredient
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_nutrition_discard('gs_variety_nutrition', 'variety_id');
+DROP TRIGGER IF EXISTS gs_variety_ingredient_nutrition_delete ON gs_variety_ingredient;
+CREATE TRIGGER gs_variety_ingredient_nutrition_delete AFTER DELETE ON gs_variety_ingredient
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION gs_nutrition_discard('gs_variety_nutrition', 'variety_id');
+
+DROP TRIGGER IF EXISTS gs_ingredient_nutrition ON gs_ingredient;
+CREATE TRIGGER gs_ingredient_nutrition
+  AFTER UPDATE OF calories, fat, saturated_fat, trans_fat, cholesterol, sodium, carbs, protein, sugar, fiber OR DELETE
+  ON gs_ingredient
+  FOR EACH ROW EXECUTE FUNCTION gs_nutrition_discard_ingredient();
@@ -0,0 +1,14 @@
+-- Optional sale window per menu item, set by the bulk pricing endpoint. The
+-- sale price applies while is_onsale is set and now() falls inside the window;
+-- an open end means no limit on that side. API responses report is_onsale
+-- with the window applied (items_utilities.is_sale_active); the published
+-- static files and the change feed carry the stored flag and the window for
+-- clients to apply.
+
+ALTER TABLE gs_menu_item ADD COLUMN IF NOT EXISTS sale_start timestamp with time zone;
+ALTER TABLE gs_menu_item ADD COLUMN IF NOT EXISTS sale_end timestamp with time zone;
+
+ALTER TABLE gs_menu_item DROP CONSTRAINT IF EXISTS gs_menu_item_sale_window_check;
+ALTER TABLE gs_menu_item ADD CONSTRAINT gs_menu_item_sale_window_check
+  CHECK (sale_start IS NULL OR sale_end IS NULL OR sale_end > sale_start) NOT VALID;
+ALTER TABLE gs_menu_item VALIDATE CONSTRAINT gs_menu_item_sale_window_check;
@@ -0,0 +1,33 @@
+-- Tables behind the Square catalog sync (POST /square/sync). gs_square_object
+-- maps each Square category, item and item variation to the menu, item or
+-- variety it became, with the Square version last applied; gs_square_sync
+-- keeps the catalog time of the last completed run per tenant.
+
+CREATE TABLE IF NOT EXISTS public.gs_square_object (
+    tenant_id UUID NOT NULL REFERENCES gs_tenant (tenant_id) ON DELETE RESTRICT,
+    square_object_id text NOT NULL,
+    object_type text NOT NULL,
+    parent_object_id text,
+    local_id integer NOT NULL,
+    version bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant_id, square_object_id)
+);
+ALTER TABLE public.gs_square_object OWNER TO grubstack;
+
+CREATE TABLE IF NOT EXISTS public.gs_square_sync (
+    tenant_id UUID PRIMARY KEY NOT NULL REFERENCES gs_tenant (tenant_id) ON DELETE RESTRICT,
+    begin_time text,
+    synced_at timestamp with time zone
+);
+ALTER TABLE public.gs_square_sync OWNER TO grubstack;
+
+-- The sync looks up mapped objects by type
+CREATE INDEX IF NOT EXISTS gs_square_object_tenant_type_idx ON gs_square_object (tenant_id, object_type, local_id);
+
+ALTER TABLE gs_square_object ENABLE ROW LEVEL SECURITY;
+ALTER TABLE gs_square_object FORCE ROW LEVEL SECURITY;
+CREATE POLICY tenant_isolation_policy ON gs_square_object USING (tenant_id = current_setting('app.tenant_id')::UUID);
+
+ALTER TABLE gs_square_sync ENABLE ROW LEVEL SECURITY;
+ALTER TABLE gs_square_sync FORCE ROW LEVEL SECURITY;
+CREATE POLICY tenant_isolation_policy ON gs_square_sync USING (tenant_id = current_setting('app.tenant_id')::UUID);
@@ -16,15 +16,17 @@ configfile = os.path.dirname(os.path.realpath(__file__)) + '/grubstack.ini'
 
 load_dotenv()
 
+args = None
 if len(sys.argv) > 1:
-  parser = argparse.ArgumentParser()
+  parser = argparse.ArgumentParser(allow_abbrev=False)
   parser.add_argument('-c', '--config', dest='config', help='full path to GrubStack API config file')
   args, extra = parser.parse_known_args()
   if args.config is not None:
     configfile = args.config
     print('INFO: Using config file from command line argument.')
-    
-elif os.environ.get('GRUBSTACK_CONFIG_FILE') is not None:
+
+# Hosts with arguments of their own (uWSGI, pytest) still honor the variable
+if (args is None or args.config is None) and os.environ.get('GRUBSTACK_CONFIG_FILE') is not None:
   configfile = os.environ.get('GRUBSTACK_CONFIG_FILE')
   print('INFO: Using config file from environment variable.')
 
@@ -84,7 +86,8 @@ jwt = JWTManager(app)
 
 # Initialize globals
 mail = Mail(app)
-gsdb = GrubDatabase(config)
+replicas = os.environ.get('DATABASE_REPLICAS') or config.get('database', 'replicas', fallback='')
+gsdb = GrubDatabase(config, replicas=[dsn.strip() for dsn in replicas.split(',') if dsn.strip() != ''])
 gsprod = GrubDatabase(config, os.environ.get('DATABASE_HOST'), os.environ.get('CORPORATE_DB'))
 cors = CORS(app, supports_credentials=True)
 
@@ -117,7 +120,9 @@ if config.getboolean('logging', 'log_to_console', fallback=True):
   logger.addHandler(consolehandler)
 
 if config.getboolean('logging', 'log_to_database', fallback=False):
-  gshandler = GrubStackLogHandler()
+  gshandler = GrubStackLogHandler(capacity=config.getint('logging', 'log_to_database_queue_size', fallback=10000),
+                                  batch_size=config.getint('logging', 'log_to_database_batch_size', fallback=200),
+                                  flush_interval=config.getfloat('logging', 'log_to_database_flush_interval', fallback=2.0))
   gshandler.setFormatter(logformatter)
   logger.addHandler(gshandler)
 
@@ -6,4 +6,6 @@ from . import locations
 from . import restaurant
 from . import logging
 from . import square
-from . import orders
\ No newline at end of file
+from . import orders
+from . import publishing
+from . import catalog
\ No newline at end of file
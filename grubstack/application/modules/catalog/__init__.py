@@ -0,0 +1 @@
+from . import catalog
\ No newline at end of file
@@ -0,0 +1,113 @@
+import logging
+
+from flask import Blueprint, Response, request
+
+from grubstack import app, config
+from grubstack.utilities import gs_make_response
+from grubstack.envelope import GStatusCode
+from grubstack.authentication import jwt_required, requires_permission, get_permissions
+
+from grubstack.application.utilities.filters import create_pagination_params
+
+from .catalog_constants import CHANGES_MAX_LIMIT, SEARCH_TYPES, SEARCH_PERMISSIONS, AUTOCOMPLETE_MAX_LIMIT
+from .catalog_service import CatalogService
+from .catalog_autocomplete import autocomplete_service
+
+catalog = Blueprint('catalog', __name__)
+logger = logging.getLogger('grubstack')
+
+catalog_service = CatalogService()
+
+@app.after_request
+def check_autocomplete(response: Response) -> Response:
+  # A write served by this worker may have changed names; the next lookup
+  # compares the catalog version instead of waiting for check_interval
+  if request.method != 'GET':
+    autocomplete_service.check()
+  return response
+
+@catalog.route('/changes', methods=['GET'])
+@jwt_required()
+@requires_permission("ViewMenus", "MaintainMenus")
+def get_changes():
+  try:
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', CHANGES_MAX_LIMIT, type=int)
+
+    if since < 0:
+      return gs_make_response(message='since must be a catalog version returned by a previous sync',
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+
+    changes, version, has_more, reset = catalog_service.get_changes(since, limit)
+
+    return gs_make_response(data={'changes': changes, 'version': version, 'has_more': has_more, 'reset': reset})
+
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to retrieve catalog changes. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+@catalog.route('/search', methods=['GET'])
+@jwt_required()
+@requires_permission("ViewMenus", "MaintainMenus", "ViewItems", "MaintainItems",
+                     "ViewIngredients", "MaintainIngredients", "ViewVarieties", "MaintainVarieties")
+def search():
+  try:
+    q = request.args.get('q', '').strip()
+    page, limit = create_pagination_params(request.args)
+
+    permissions = get_permissions()
+    allowed = [entity for entity in SEARCH_TYPES
+               if any(permission in permissions for permission in SEARCH_PERMISSIONS[entity])]
+    types = request.args.get('types', ','.join(allowed)).split(',')
+
+    unknown = [entity for entity in types if entity not in SEARCH_TYPES]
+    if len(unknown) > 0:
+      return gs_make_response(message='Unknown search types: ' + ', '.join(unknown),
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+
+    forbidden = [entity for entity in types if entity not in allowed]
+    if len(forbidden) > 0:
+      return gs_make_response(message='Forbidden search types: ' + ', '.join(forbidden),
+                              status=GStatusCode.ERROR,
+                              httpstatus=403)
+
+    if q == '':
+      return gs_make_response(message='A search query is required',
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+
+    json_data, total_rows, total_pages = catalog_service.search(q, types, page, limit)
+
+    return gs_make_response(data=json_data, totalrowcount=total_rows, totalpages=total_pages)
+
+  except ValueError:
+    return gs_make_response(message='Invalid pagination parameters',
+                            status=GStatusCode.ERROR,
+                            httpstatus=400)
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to search the catalog. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+@catalog.route('/autocomplete', methods=['GET'])
+@jwt_required()
+@requires_permission("ViewMenus", "ViewItems", "ViewIngredients")
+def autocomplete():
+  try:
+    q = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), AUTOCOMPLETE_MAX_LIMIT))
+
+    return gs_make_response(data=autocomplete_service.lookup(q, ['menu', 'item', 'ingredient'], limit))
+
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to retrieve suggestions. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+app.register_blueprint(catalog, url_prefix=config.get('general', 'urlprefix', fallback='/'))
@@ -0,0 +1,145 @@
+import heapq, logging, threading, time
+
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from grubstack import config, gsdb
+from grubstack.tenant import get_tenant_id
+
+from .catalog_utilities import normalize_name
+from .catalog_constants import AUTOCOMPLETE_TYPES, AUTOCOMPLETE_MAX_WORDS, AUTOCOMPLETE_NAMES, CATALOG_VERSION
+
+logger = logging.getLogger('grubstack')
+
+class AutocompleteIndex:
+  """
+  Normalized names of one tenant as sorted arrays of keys, one per word
+  start, kept apart by entity and by whether the key is the first word. Each
+  key carries the rank of its entry (shortest names first), so a lookup is a
+  bisect to the range of keys with the prefix and a pick of the lowest ranks
+  in it; the best names are found however many keys share a short prefix.
+  """
+  def __init__(self, rows: list, version: int):
+    entries = sorted((len(row['name']), row['name'], row['entity'], row['entity_id']) for row in rows)
+    self.entries = [(entity, entity_id, name) for length, name, entity, entity_id in entries]
+
+    keys = {}
+    for rank, (entity, entity_id, name) in enumerate(self.entries):
+      words = normalize_name(name).split(' ')
+      for position in range(min(len(words), AUTOCOMPLETE_MAX_WORDS)):
+        if words[position] != '':
+          keys.setdefault((entity, position == 0), []).append((' '.join(words[position:]), rank))
+
+    self.groups = {}
+    for group, group_keys in keys.items():
+      group_keys.sort()
+      self.groups[group] = ([key for key, rank in group_keys], array('I', [rank for key, rank in group_keys]))
+
+    self.version = version
+    self.built_at = time.monotonic()
+    self.checked_at = self.built_at
+
+  def ranks(self, prefix: str, entity: str, first: bool, count: int):
+    group = self.groups.get((entity, first))
+    if group is None:
+      return []
+
+    keys, ranks = group
+    lo = bisect_left(keys, prefix)
+    hi = bisect_left(keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+    return heapq.nsmallest(count, ranks[lo:hi])
+
+  def lookup(self, prefix: str, types: list, limit: int):
+    # Names starting with the prefix come before names with a later word
+    # starting with it. A name has up to AUTOCOMPLETE_MAX_WORDS - 1 later
+    # word keys and may already be taken as a first word match, so that many
+    # ranks per limit are enough to fill it
+    results, seen = [], set()
+    for first, count in ((True, limit), (False, limit * AUTOCOMPLETE_MAX_WORDS)):
+      ranks = set()
+      for entity in types:
+        ranks.update(self.ranks(prefix, entity, first, count))
+
+      for rank in sorted(ranks):
+        if rank not in seen:
+          seen.add(rank)
+          entity, entity_id, name = self.entries[rank]
+          results.append({'entity': entity, 'id': entity_id, 'name': name})
+          if len(results) >= limit:
+            return results
+
+    return results
+
+class AutocompleteService:
+  """
+  Per process, per tenant autocomplete indexes, built on first use. Catalog
+  writes from any worker bump the tenant's catalog version, which is checked
+  at most every check_interval seconds (and right after a write served by
+  this worker); employees are not versioned and are picked up on local
+  writes or after rebuild_interval. Only the max_tenants most recently used
+  tenants are kept, each with at most max_entries names.
+  """
+  def __init__(self):
+    self.indexes = OrderedDict()
+    self.lock = threading.Lock()
+    self.max_tenants = config.getint('autocomplete', 'max_tenants', fallback=64)
+    self.max_entries = config.getint('autocomplete', 'max_entries', fallback=50000)
+    self.check_interval = config.getfloat('autocomplete', 'check_interval', fallback=2)
+    self.rebuild_interval = config.getfloat('autocomplete', 'rebuild_interval', fallback=300)
+
+  def get_version(self):
+    row = gsdb.fetchone(CATALOG_VERSION)
+    return row['version'] if row is not None else 0
+
+  def build(self, tenant_id: str):
+    # The version is read first; a write landing in between is caught by the
+    # next check instead of being lost
+    version = self.get_version()
+    rows = gsdb.fetchall(AUTOCOMPLETE_NAMES, (self.max_entries + 1,)) or []
+    if len(rows) > self.max_entries:
+      logger.warning(f"[autocomplete] [tenant:{tenant_id}] more than {self.max_entries} names, index truncated")
+      rows = rows[:self.max_entries]
+
+    return AutocompleteIndex(rows, version)
+
+  def get_index(self, tenant_id: str):
+    now = time.monotonic()
+    index = self.indexes.get(tenant_id)
+
+    if index is not None and now - index.built_at >= self.rebuild_interval:
+      index = None
+    elif index is not None and now - index.checked_at >= self.check_interval:
+      if self.get_version() != index.version:
+        index = None
+      else:
+        index.checked_at = now
+
+    if index is None:
+      index = self.build(tenant_id)
+
+    with self.lock:
+      self.indexes[tenant_id] = index
+      self.indexes.move_to_end(tenant_id)
+      while len(self.indexes) > self.max_tenants:
+        self.indexes.popitem(last=False)
+
+    return index
+
+  def lookup(self, q: str, types: list = AUTOCOMPLETE_TYPES, limit: int = 10):
+    prefix = normalize_name(q)
+    if prefix == '':
+      return []
+
+    return self.get_index(get_tenant_id()).lookup(prefix, types, limit)
+
+  def check(self, tenant_id: str = None):
+    index = self.indexes.get(tenant_id or get_tenant_id())
+    if index is not None:
+      index.checked_at = 0
+
+  def invalidate(self, tenant_id: str = None):
+    with self.lock:
+      self.indexes.pop(tenant_id or get_tenant_id(), None)
+
+autocomplete_service = AutocompleteService()
@@ -0,0 +1,129 @@
+from grubstack import app
+
+PER_PAGE = app.config['PER_PAGE']
+
+CHANGES_MAX_LIMIT = 1000
+
+# Everything changed after %(since)s in version order, documents shaped like
+# the ones the product endpoints return. A full sync (since 0) has nothing to
+# delete, so tombstones are left out. Each branch is limited on its own
+# (tenant_id, version) index before the union is ordered and cut again.
+CATALOG_CHANGES = """
+(SELECT 'menu' AS entity, m.menu_id AS entity_id, m.version, m.updated_at, false AS deleted,
+        jsonb_build_object('id', m.menu_id, 'name', m.name, 'description', m.description,
+                           'thumbnail_url', m.thumbnail_url, 'slug', m.slug,
+                           'items', COALESCE((SELECT jsonb_agg(jsonb_build_object('id', mi.item_id, 'price', mi.price,
+                                                                                  'sale_price', mi.sale_price,
+                                                                                  'is_onsale', mi.is_onsale,
+                                                                                  'sale_start', mi.sale_start,
+                                                                                  'sale_end', mi.sale_end)
+                                                               ORDER BY mi.item_id)
+                                                FROM gs_menu_item mi
+                                               WHERE mi.menu_id = m.menu_id), '[]'::jsonb)) AS data
+   FROM gs_menu m
+  WHERE m.version > %(since)s
+  ORDER BY m.version
+  LIMIT %(limit)s)
+UNION ALL
+(SELECT 'item', it.item_id, it.version, it.updated_at, false,
+        jsonb_build_object('id', it.item_id, 'name', it.name, 'description', it.description,
+                           'thumbnail_url', it.thumbnail_url, 'slug', it.slug,
+                           'ingredients', COALESCE((SELECT jsonb_agg(jsonb_build_object('id', ii.ingredient_id,
+                                                                                        'is_optional', ii.is_optional,
+                                                                                        'is_addon', ii.is_addon,
+                                                                                        'is_extra', ii.is_extra)
+                                                                     ORDER BY ii.ingredient_id)
+                                                      FROM gs_item_ingredient ii
+                                                     WHERE ii.item_id = it.item_id), '[]'::jsonb),
+                           'varieties', COALESCE((SELECT jsonb_agg(iv.variety_id ORDER BY iv.variety_id)
+                                                    FROM gs_item_variety iv
+                                                   WHERE iv.item_id = it.item_id), '[]'::jsonb))
+   FROM gs_item it
+  WHERE it.version > %(since)s
+  ORDER BY it.version
+  LIMIT %(limit)s)
+UNION ALL
+(SELECT 'ingredient', i.ingredient_id, i.version, i.updated_at, false,
+        jsonb_build_object('id', i.ingredient_id, 'name', i.name, 'description', i.description,
+                           'thumbnail_url', i.thumbnail_url, 'calories', i.calories, 'fat', i.fat,
+                           'saturated_fat', i.saturated_fat, 'trans_fat', i.trans_fat,
+                           'cholesterol', i.cholesterol, 'sodium', i.sodium, 'carbs', i.carbs,
+                           'protein', i.protein, 'sugar', i.sugar, 'fiber', i.fiber, 'price', i.price)
+   FROM gs_ingredient i
+  WHERE i.version > %(since)s
+  ORDER BY i.version
+  LIMIT %(limit)s)
+UNION ALL
+(SELECT 'variety', v.variety_id, v.version, v.updated_at, false,
+        jsonb_build_object('id', v.variety_id, 'name', v.name, 'description', v.description,
+                           'thumbnail_url', v.thumbnail_url,
+                           'ingredients', COALESCE((SELECT jsonb_agg(vi.ingredient_id ORDER BY vi.ingredient_id)
+                                                      FROM gs_variety_ingredient vi
+                                                     WHERE vi.variety_id = v.variety_id), '[]'::jsonb))
+   FROM gs_variety v
+  WHERE v.version > %(since)s
+  ORDER BY v.version
+  LIMIT %(limit)s)
+UNION ALL
+(SELECT t.entity, t.entity_id, t.version, t.deleted_at, true, NULL
+   FROM gs_catalog_tombstone t
+  WHERE t.version > %(since)s
+    AND %(since)s > 0
+  ORDER BY t.version
+  LIMIT %(limit)s)
+ORDER BY version
+LIMIT %(limit)s"""
+
+CATALOG_VERSION = "SELECT COALESCE(MAX(version), 0) AS version FROM gs_catalog_version"
+
+SEARCH_MAX_LIMIT = 100
+SEARCH_TYPES = ['menu', 'item', 'ingredient', 'variety']
+
+# Any one of these lets a caller see an entity type in search results
+SEARCH_PERMISSIONS = {
+  'menu': ['ViewMenus', 'MaintainMenus'],
+  'item': ['ViewItems', 'MaintainItems'],
+  'ingredient': ['ViewIngredients', 'MaintainIngredients'],
+  'variety': ['ViewVarieties', 'MaintainVarieties'],
+}
+
+# One branch per searchable table; the to_tsvector expression and the trigram
+# operator on name match the indexes in migration 0005. Full-text hits rank
+# above fuzzy ones, word_similarity orders the typos among themselves.
+SEARCH_BRANCH = """
+SELECT '{entity}' AS entity, {id} AS entity_id, name, description, thumbnail_url,
+       ts_rank(to_tsvector('simple', COALESCE(name, '') || ' ' || COALESCE(description, '')), query) * 2
+         + word_similarity(%(q)s, name) AS rank
+  FROM {table}, to_tsquery('simple', %(tsquery)s) query
+ WHERE to_tsvector('simple', COALESCE(name, '') || ' ' || COALESCE(description, '')) @@ query
+    OR %(q)s <%% name"""
+
+SEARCH_TABLES = {
+  'menu': ('gs_menu', 'menu_id'),
+  'item': ('gs_item', 'item_id'),
+  'ingredient': ('gs_ingredient', 'ingredient_id'),
+  'variety': ('gs_variety', 'variety_id'),
+}
+
+SEARCH = """
+SELECT entity, entity_id, name, description, thumbnail_url, rank, COUNT(*) OVER () AS total
+  FROM ({branches}) results
+ ORDER BY rank DESC, name, entity, entity_id
+ LIMIT %(limit)s OFFSET %(offset)s"""
+
+AUTOCOMPLETE_TYPES = ['menu', 'item', 'ingredient', 'employee']
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# Word starts indexed per name, so 'sand' finds 'Chicken Sandwich' without
+# every long description-like name multiplying the index
+AUTOCOMPLETE_MAX_WORDS = 4
+
+AUTOCOMPLETE_NAMES = """
+SELECT 'menu' AS entity, menu_id AS entity_id, name FROM gs_menu
+UNION ALL
+SELECT 'item', item_id, name FROM gs_item
+UNION ALL
+SELECT 'ingredient', ingredient_id, name FROM gs_ingredient
+UNION ALL
+SELECT 'employee', employee_id, first_name || ' ' || last_name FROM gs_employee
+LIMIT %s"""
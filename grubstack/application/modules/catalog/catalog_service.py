@@ -0,0 +1,48 @@
+from math import ceil
+
+from grubstack import gsdb
+
+from .catalog_utilities import format_change, format_search_result, to_prefix_tsquery
+from .catalog_constants import PER_PAGE, CHANGES_MAX_LIMIT, CATALOG_CHANGES, CATALOG_VERSION, SEARCH_MAX_LIMIT, SEARCH_TYPES, SEARCH_BRANCH, SEARCH_TABLES, SEARCH
+
+class CatalogService:
+  def __init__(self):
+    pass
+
+  def get_version(self):
+    row = gsdb.fetchone(CATALOG_VERSION)
+    return row['version'] if row is not None else 0
+
+  def get_changes(self, since: int = 0, limit: int = PER_PAGE):
+    limit = max(1, min(limit, CHANGES_MAX_LIMIT))
+
+    # A cursor from the future means the catalog was restored or the client
+    # talked to another deployment; it has to start over with a full sync
+    current_version = self.get_version()
+    if since > current_version:
+      return ([], current_version, False, True)
+
+    # One row past the page tells whether the client should keep pulling
+    rows = gsdb.fetchall(CATALOG_CHANGES, {'since': since, 'limit': limit + 1}) or []
+    has_more = len(rows) > limit
+    changes = [format_change(row) for row in rows[:limit]]
+
+    version = changes[-1]['version'] if len(changes) > 0 else since
+
+    return (changes, version, has_more, False)
+
+  def search(self, q: str, types: list = SEARCH_TYPES, page: int = 1, limit: int = PER_PAGE):
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    page = max(1, page)
+
+    tsquery = to_prefix_tsquery(q)
+    if tsquery is None or len(types) <= 0:
+      return ([], 0, 0)
+
+    branches = ' UNION ALL '.join(SEARCH_BRANCH.format(entity=entity, table=SEARCH_TABLES[entity][0], id=SEARCH_TABLES[entity][1])
+                                  for entity in SEARCH_TYPES if entity in types)
+    rows = gsdb.fetchall(SEARCH.format(branches=branches),
+                         {'q': q, 'tsquery': tsquery, 'limit': limit, 'offset': (page - 1) * limit}) or []
+
+    total_rows = rows[0]['total'] if len(rows) > 0 else 0
+    return ([format_search_result(row) for row in rows], total_rows, ceil(total_rows / limit))
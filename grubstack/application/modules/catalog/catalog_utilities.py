@@ -0,0 +1,42 @@
+import re, unicodedata
+
+def format_change(change: dict):
+  json_data = {
+    "entity": change['entity'],
+    "id": change['entity_id'],
+    "version": change['version'],
+    "updated_at": change['updated_at'].isoformat() if change['updated_at'] is not None else None,
+    "deleted": change['deleted']
+  }
+
+  if not change['deleted']:
+    json_data['data'] = change['data']
+
+  return json_data
+
+def format_search_result(result: dict):
+  json_data = {
+    "entity": result['entity'],
+    "id": result['entity_id'],
+    "name": result['name'],
+    "description": result['description'],
+    "thumbnail_url": result['thumbnail_url'],
+    "rank": round(result['rank'], 4)
+  }
+
+  return json_data
+
+def to_prefix_tsquery(q: str):
+  # Every word has to match the start of a word, so 'chick sand' finds
+  # 'Chicken Sandwich'
+  words = re.findall(r'\w+', q.lower())
+  if len(words) <= 0:
+    return None
+
+  return ' & '.join(word + ':*' for word in words)
+
+def normalize_name(name: str):
+  # Accents, case and punctuation are ignored, 'Jalapeño-Lime' is 'jalapeno lime'
+  decomposed = unicodedata.normalize('NFKD', name or '')
+  stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+  return ' '.join(re.sub(r'[\W_]+', ' ', stripped.casefold()).split())
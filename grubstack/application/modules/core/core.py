@@ -1,6 +1,9 @@
 import logging, json, requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from flask import Blueprint, url_for, request
 from grubstack import app, config, gsprod
+from grubstack.tenant import get_tenant_id
 from grubstack.utilities import gs_make_response
 from grubstack.envelope import GStatusCode
 from grubstack.authentication import jwt_required
@@ -8,6 +11,15 @@ from grubstack.authentication import jwt_required
 core = Blueprint('core', __name__)
 logger = logging.getLogger('grubstack')
 
+RESTART_URL = 'https://api.grubstack.app/v1/products/app/restart'
+MAX_WORKERS = config.getint('core', 'update_workers', fallback=8)
+
+# Shared across requests so restarts reuse pooled keep-alive connections
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='GrubStackUpdateApps')
+jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='GrubStackUpdateAppsJob')
+
 @core.route('/core/versions', methods=['GET'])
 def get_versions():
   try:
@@ -26,25 +38,55 @@ def get_versions():
                             status=GStatusCode.ERROR,
                             httpstatus=500)
 
+def restart_app(product: dict, tenant_id: str, authorization: str) -> dict:
+  result = { "app_id": product['app_id'], "name": product['name'] }
+  try:
+    resp = session.post(RESTART_URL,
+                        json={ "app_id": product['app_id'], "tenant_id": tenant_id },
+                        headers={ 'Authorization': authorization, 'Content-Type': 'application/json' },
+                        timeout=(config.getfloat('core', 'connect_timeout', fallback=3.0),
+                                 config.getfloat('core', 'read_timeout', fallback=15.0)))
+    result['status'] = 'success' if resp.ok else 'error'
+    result['http_status'] = resp.status_code
+
+  except requests.RequestException as e:
+    logger.error(f"[update-apps] [app:{product['app_id']}] {e}")
+    result['status'] = 'error'
+    result['error'] = e.__class__.__name__
+
+  return result
+
+def restart_apps(products: list, tenant_id: str, authorization: str) -> list:
+  futures = [executor.submit(restart_app, product, tenant_id, authorization)
+             for product in products if product['name'] != 'GrubStack API']
+  results = [future.result() for future in futures]
+
+  failed = len([result for result in results if result['status'] != 'success'])
+  logger.info(f'[update-apps] [tenant:{tenant_id}] [apps:{len(results)}] [failed:{failed}]')
+  return results
+
 @core.route('/core/updateApps', methods=['POST'])
 @jwt_required()
 def update_apps():
   try:
-    products = gsprod.fetchall("SELECT app_id, app_url, c.tenant_id, c.product_id, p.is_front_end_app, p.name, p.description FROM gs_tenant_app c INNER JOIN gs_product p on p.product_id = c.product_id WHERE c.tenant_id = %s", (app.config['TENANT_ID'],))
+    products = gsprod.fetchall("SELECT app_id, app_url, c.tenant_id, c.product_id, p.is_front_end_app, p.name, p.description FROM gs_tenant_app c INNER JOIN gs_product p on p.product_id = c.product_id WHERE c.tenant_id = %s", (get_tenant_id(),))
 
     access_token = request.cookies.get('_grubstack_access_token')
+    authorization = 'Bearer ' + access_token if access_token is not None else request.headers.get('Authorization')
 
-    for product in products:
-      if product['name'] != 'GrubStack API':
-        url = 'https://api.grubstack.app/v1/products/app/restart'
-        data = {"app_id": product['app_id'], "tenant_id": app.config['TENANT_ID'] }
-        headers = {
-          'Authorization': 'Bearer ' + access_token,
-          'Content-Type': 'application/json'
-        }
-        resp = requests.post(url, json=data, headers=headers)
+    background = request.args.get('background', 'false').lower() == 'true'
+    if background:
+      jobs.submit(restart_apps, products, get_tenant_id(), authorization)
+      return gs_make_response(message='App update started', httpstatus=202)
 
-    return gs_make_response(message='Apps updated successfully')
+    results = restart_apps(products, get_tenant_id(), authorization)
+    if any(result['status'] != 'success' for result in results):
+      return gs_make_response(message='One or more apps failed to update',
+                              status=GStatusCode.ERROR,
+                              data=results,
+                              httpstatus=502)
+
+    return gs_make_response(message='Apps updated successfully', data=results)
 
   except Exception as e:
     logger.exception(e)
@@ -52,5 +94,4 @@ def update_apps():
                             status=GStatusCode.ERROR,
                             httpstatus=500)
 
-
 app.register_blueprint(core, url_prefix=config.get('general', 'urlprefix', fallback='/'))
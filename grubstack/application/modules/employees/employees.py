@@ -13,6 +13,9 @@ from grubstack.application.utilities.filters import generate_filters, create_pag
 from .employees_utilities import format_params
 from .employees_constants import REQUIRED_FIELDS, EMPLOYEE_FILTERS
 
+from grubstack.application.modules.catalog.catalog_constants import AUTOCOMPLETE_MAX_LIMIT
+from grubstack.application.modules.catalog.catalog_autocomplete import autocomplete_service
+
 from .employees_service import EmployeeService
 
 employee = Blueprint('employee', __name__)
@@ -37,6 +40,22 @@ def get_all():
                             status=GStatusCode.ERROR,
                             httpstatus=500)
 
+@employee.route('/employees/autocomplete', methods=['GET'])
+@jwt_required()
+@requires_permission("ViewEmployees", "MaintainEmployees")
+def autocomplete():
+  try:
+    q = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), AUTOCOMPLETE_MAX_LIMIT))
+
+    return gs_make_response(data=autocomplete_service.lookup(q, ['employee'], limit))
+
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to retrieve suggestions. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
 @employee.route('/employees', methods=['POST'])
 @jwt_required()
 @requires_permission("MaintainEmployees")
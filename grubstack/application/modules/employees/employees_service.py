@@ -1,7 +1,9 @@
 from pypika import Query, Table, Order, Parameter
 
 from grubstack import app, gsdb
+from grubstack.tenant import get_tenant_id
 from grubstack.application.utilities.filters import generate_paginated_data
+from grubstack.application.modules.catalog.catalog_autocomplete import autocomplete_service
 
 from .employees_constants import PER_PAGE
 from .employees_utilities import format_employee
@@ -66,7 +68,7 @@ class EmployeeService:
       gs_employee.employment_status,
       gs_employee.job_title
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s'),
       Parameter('%s'),
@@ -82,7 +84,10 @@ class EmployeeService:
       Parameter('%s'),
     )
     
-    return gsdb.execute(str(qry), (first_name, last_name, gender, address1, city, state, postal, phone, email, profile_thumbnail_url, hire_date, employment_status, job_title,))
+    result = gsdb.execute(str(qry), (first_name, last_name, gender, address1, city, state, postal, phone, email, profile_thumbnail_url, hire_date, employment_status, job_title,))
+    autocomplete_service.invalidate()
+
+    return result
 
   def update(self, employee_id: int, params: tuple = ()):
     first_name, last_name, gender, address1, city, state, postal, phone, email, profile_thumbnail_url, hire_date, employment_status, job_title = params
@@ -120,7 +125,10 @@ class EmployeeService:
       gs_employee.employee_id == Parameter('%s')
     )
 
-    return gsdb.execute(str(qry), (first_name, last_name, gender, address1, city, state, postal, phone, email, profile_thumbnail_url, hire_date, employment_status, job_title, employee_id,))
+    result = gsdb.execute(str(qry), (first_name, last_name, gender, address1, city, state, postal, phone, email, profile_thumbnail_url, hire_date, employment_status, job_title, employee_id,))
+    autocomplete_service.invalidate()
+
+    return result
 
   def delete(self, employee_id: int):
     gs_employee = Table('gs_employee')
@@ -131,6 +139,7 @@ class EmployeeService:
     )
 
     gsdb.execute(str(qry), (employee_id,))
+    autocomplete_service.invalidate()
 
   def search(self, first_name: str, last_name: str):
     gs_employee = Table('gs_employee')
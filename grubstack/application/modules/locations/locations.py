@@ -2,7 +2,7 @@ import logging, json
 
 from flask import Blueprint, url_for, request
 
-from grubstack import app, config
+from grubstack import app, config, gsdb
 from grubstack.utilities import gs_make_response
 from grubstack.envelope import GStatusCode
 from grubstack.authentication import jwt_required, requires_permission, requires_all_permissions
@@ -12,8 +12,8 @@ from grubstack.application.utilities.filters import generate_filters, create_pag
 from grubstack.application.modules.products.menus.menus_service import MenuService
 from grubstack.application.modules.restaurant.restaurant_service import RestaurantService
 
-from .locations_utilities import format_params, format_work_hour_params
-from .locations_constants import LOCATION_FILTERS, REQUIRED_FIELDS, REQUIRED_WORK_HOUR_FIELDS
+from .locations_utilities import format_params, format_work_hour_params, format_work_hours_params
+from .locations_constants import LOCATION_FILTERS, REQUIRED_FIELDS, REQUIRED_WORK_HOUR_FIELDS, ASSIGNMENT_MAX_LOCATIONS
 
 from .locations_service import LocationService
 
@@ -67,8 +67,10 @@ def create():
                                 status=GStatusCode.ERROR,
                                 httpstatus=400)
       else:
-        location_id = location_service.create(format_params(params))[0]
-        location_service.initialize_work_hours(location_id)
+        with gsdb.transaction() as tx:
+          location_id = location_service.create(format_params(params), tx)[0]
+          location_service.initialize_work_hours(location_id, tx)
+
         location = location_service.get(location_id)
 
         headers = {'Location': url_for('location.get', location_id=location_id)}
@@ -377,6 +379,157 @@ def update_work_hour(location_id: int, working_hour_type_id: str):
                             status=GStatusCode.ERROR,
                             httpstatus=500)
 
+@location.route('/locations/<int:location_id>/working-hours', methods=['PUT'])
+@jwt_required()
+@requires_all_permissions("MaintainLocations", "MaintainRestaurants")
+def update_work_hours(location_id: int):
+  try:
+    if request.json:
+      data = json.loads(request.data)
+      params = data['params']
+
+      verify_params(params, ['working_hours'])
+
+      location = location_service.get(location_id)
+
+      if location is None:
+        return gs_make_response(message='Location not found',
+                                status=GStatusCode.ERROR,
+                                httpstatus=404)
+
+      work_hours = format_work_hours_params(params['working_hours'])
+      hour_type_ids = [hour_type['id'] for hour_type in restaurant_service.get_working_hour_types()]
+
+      if not set(work_hours[0]).issubset(hour_type_ids):
+        return gs_make_response(message='Working Hour type not found',
+                                status=GStatusCode.ERROR,
+                                httpstatus=404)
+      else:
+        location_service.update_work_hours([location_id], work_hours)
+        return gs_make_response(message='Location work hours updated', httpstatus=204)
+    else:
+      return gs_make_response(message='Invalid request',
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+  except ValueError as e:
+    return gs_make_response(message=e,
+                            status=GStatusCode.ERROR,
+                            httpstatus=400)
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Error processing request',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+@location.route('/locations/working-hours', methods=['PUT'])
+@jwt_required()
+@requires_all_permissions("MaintainLocations", "MaintainRestaurants")
+def bulk_update_work_hours():
+  try:
+    if request.json:
+      data = json.loads(request.data)
+      params = data['params']
+
+      verify_params(params, ['location_ids', 'working_hours'])
+
+      location_ids = [int(location_id) for location_id in params['location_ids']]
+      existing_ids = location_service.get_existing_ids(location_ids)
+      missing_ids = set(location_ids) - set(existing_ids)
+
+      if len(location_ids) <= 0 or len(missing_ids) > 0:
+        return gs_make_response(message='Location not found',
+                                status=GStatusCode.ERROR,
+                                data={'location_ids': sorted(missing_ids)},
+                                httpstatus=404)
+
+      work_hours = format_work_hours_params(params['working_hours'])
+      hour_type_ids = [hour_type['id'] for hour_type in restaurant_service.get_working_hour_types()]
+
+      if not set(work_hours[0]).issubset(hour_type_ids):
+        return gs_make_response(message='Working Hour type not found',
+                                status=GStatusCode.ERROR,
+                                httpstatus=404)
+      else:
+        location_service.update_work_hours(existing_ids, work_hours)
+        return gs_make_response(message=f'Work hours updated on {len(existing_ids)} locations', httpstatus=204)
+    else:
+      return gs_make_response(message='Invalid request',
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+  except ValueError as e:
+    return gs_make_response(message=e,
+                            status=GStatusCode.ERROR,
+                            httpstatus=400)
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Error processing request',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+@location.route('/locations/assignments', methods=['POST'])
+@jwt_required()
+@requires_all_permissions("MaintainLocations", "MaintainRestaurants")
+def bulk_assign():
+  try:
+    if request.json:
+      data = json.loads(request.data)
+      params = data['params']
+
+      verify_params(params, ['location_ids'])
+
+      location_ids = [int(location_id) for location_id in params['location_ids']]
+      menu_ids = [int(menu_id) for menu_id in params.get('menu_ids', [])]
+      order_type_ids = [int(order_type_id) for order_type_id in params.get('order_type_ids', [])]
+
+      if len(location_ids) <= 0 or len(location_ids) > ASSIGNMENT_MAX_LOCATIONS:
+        return gs_make_response(message=f'Provide between 1 and {ASSIGNMENT_MAX_LOCATIONS} location_ids',
+                                status=GStatusCode.ERROR,
+                                httpstatus=400)
+
+      if len(menu_ids) <= 0 and len(order_type_ids) <= 0:
+        return gs_make_response(message='Provide menu_ids, order_type_ids or both',
+                                status=GStatusCode.ERROR,
+                                httpstatus=400)
+
+      missing_ids = set(location_ids) - set(location_service.get_existing_ids(location_ids))
+      if len(missing_ids) > 0:
+        return gs_make_response(message='Location not found',
+                                status=GStatusCode.ERROR,
+                                data={'location_ids': sorted(missing_ids)},
+                                httpstatus=404)
+
+      missing_ids = set(menu_ids) - set(menu_service.get_existing_ids(menu_ids))
+      if len(missing_ids) > 0:
+        return gs_make_response(message='Menu not found',
+                                status=GStatusCode.ERROR,
+                                data={'menu_ids': sorted(missing_ids)},
+                                httpstatus=404)
+
+      missing_ids = set(order_type_ids) - set(order_type['id'] for order_type in restaurant_service.get_order_types())
+      if len(missing_ids) > 0:
+        return gs_make_response(message='Order type not found',
+                                status=GStatusCode.ERROR,
+                                data={'order_type_ids': sorted(missing_ids)},
+                                httpstatus=404)
+
+      menus_added, order_types_added = location_service.assign(location_ids, menu_ids, order_type_ids)
+
+      return gs_make_response(message=f'Assignments updated on {len(location_ids)} locations',
+                              data={'menus_added': menus_added, 'order_types_added': order_types_added})
+    else:
+      return gs_make_response(message='Invalid request',
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+  except ValueError as e:
+    return gs_make_response(message=str(e),
+                            status=GStatusCode.ERROR,
+                            httpstatus=400)
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Error processing request',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
 @location.route('/locations/<int:location_id>/working-hours', methods=['GET'])
 @jwt_required()
 @requires_permission("ViewLocations", "MaintainLocations", "ViewRestaurants", "MaintainRestaurants")
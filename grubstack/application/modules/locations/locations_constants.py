@@ -24,4 +24,24 @@ LOCATION_FILTERS = ['showMenus', 'showItems', 'isActive']
 DEFAULT_FILTERS = {
   'showMenus': False,
   'showItems': False,
-}
\ No newline at end of file
+}
+ASSIGNMENT_MAX_LOCATIONS = 1000
+
+# Every (location, menu) and (location, order type) pair not yet assigned,
+# relying on the unique keys from migration 0002
+ASSIGN_MENUS = """INSERT INTO gs_location_menu (tenant_id, location_id, menu_id)
+                  SELECT %(tenant_id)s::uuid, l.location_id, m.menu_id
+                    FROM gs_location l
+                   CROSS JOIN gs_menu m
+                   WHERE l.location_id = ANY(%(location_ids)s::integer[])
+                     AND m.menu_id = ANY(%(menu_ids)s::integer[])
+                      ON CONFLICT (tenant_id, location_id, menu_id) DO NOTHING
+                  RETURNING location_id, menu_id"""
+ASSIGN_ORDER_TYPES = """INSERT INTO gs_location_order_type (tenant_id, location_id, order_type_id)
+                        SELECT %(tenant_id)s::uuid, l.location_id, o.order_type_id
+                          FROM gs_location l
+                         CROSS JOIN gs_order_type o
+                         WHERE l.location_id = ANY(%(location_ids)s::integer[])
+                           AND o.order_type_id = ANY(%(order_type_ids)s::integer[])
+                            ON CONFLICT (tenant_id, location_id, order_type_id) DO NOTHING
+                        RETURNING location_id, order_type_id"""
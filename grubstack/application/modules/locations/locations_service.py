@@ -3,6 +3,8 @@ import datetime
 from pypika import PostgreSQLQuery, Query, Table, Tables, Order, functions, Parameter
 
 from grubstack import app, gsdb, gsprod
+from grubstack.tenant import get_tenant_id
+from grubstack.application.modules.publishing.publishing_service import PublishingService
 
 from grubstack.application.modules.products.menus.menus_utilities import format_menu
 from grubstack.application.modules.products.items.items_utilities import format_item
@@ -12,10 +14,11 @@ from grubstack.application.modules.products.items.items_service import ItemServi
 from grubstack.application.modules.restaurant.restaurant_utilities import format_order_type
 from grubstack.application.utilities.filters import generate_paginated_data
 
-from .locations_utilities import format_location, format_work_hour, format_property, format_work_hour_params
-from .locations_constants import PER_PAGE, DEFAULT_FILTERS, DEFAULT_LOCATION_LIMIT
+from .locations_utilities import format_location, format_work_hour, format_property
+from .locations_constants import PER_PAGE, DEFAULT_FILTERS, DEFAULT_LOCATION_LIMIT, ASSIGN_MENUS, ASSIGN_ORDER_TYPES
 
 item_service = ItemService()
+publishing_service = PublishingService()
 
 class LocationService:
   def __init__(self):
@@ -74,7 +77,7 @@ class LocationService:
 
     return (json_data, total_rows, total_pages)
 
-  def create(self, params: dict = ()):
+  def create(self, params: dict = (), db = gsdb):
     name, address1, city, state, postal, location_type, phone_number, is_active, merchant_location_id = params
 
     gs_location = Table('gs_location')
@@ -92,7 +95,7 @@ class LocationService:
       gs_location.is_active,
       gs_location.merchant_location_id
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s'),
       Parameter('%s'),
@@ -104,7 +107,7 @@ class LocationService:
       Parameter('%s')
     ).returning('location_id')
 
-    return gsdb.fetchone(str(qry), (name, address1, city, state, postal, location_type, phone_number, is_active, merchant_location_id,))
+    return db.fetchone(str(qry), (name, address1, city, state, postal, location_type, phone_number, is_active, merchant_location_id,))
 
   def search(self, name: str, filters: dict = {}):
     if len(filters) <= 0:
@@ -151,50 +154,53 @@ class LocationService:
       return None
 
   def delete(self, location_id: int):
-    gs_location = Table('gs_location')
-    qry = Query.from_(
-      gs_location
-    ).delete().where(
-      gs_location.location_id == Parameter('%s')
-    )
+    publishing_service.invalidate('location', [location_id])
+
+    with gsdb.transaction() as tx:
+      gs_location = Table('gs_location')
+      qry = Query.from_(
+        gs_location
+      ).delete().where(
+        gs_location.location_id == Parameter('%s')
+      )
 
-    gsdb.execute(str(qry), (location_id,))
+      tx.execute(str(qry), (location_id,))
 
-    gs_location_employee = Table('gs_location_employee')
-    qry = Query.from_(
-      gs_location_employee
-    ).delete().where(
-      gs_location_employee.location_id == Parameter('%s')
-    )
+      gs_location_employee = Table('gs_location_employee')
+      qry = Query.from_(
+        gs_location_employee
+      ).delete().where(
+        gs_location_employee.location_id == Parameter('%s')
+      )
 
-    gsdb.execute(str(qry), (location_id,))
+      tx.execute(str(qry), (location_id,))
 
-    gs_location_menu = Table('gs_location_menu')
-    qry = Query.from_(
-      gs_location_menu
-    ).delete().where(
-      gs_location_menu.location_id == Parameter('%s')
-    )
+      gs_location_menu = Table('gs_location_menu')
+      qry = Query.from_(
+        gs_location_menu
+      ).delete().where(
+        gs_location_menu.location_id == Parameter('%s')
+      )
 
-    gsdb.execute(str(qry), (location_id,))
+      tx.execute(str(qry), (location_id,))
 
-    gs_location_order_type = Table('gs_location_order_type')
-    qry = Query.from_(
-      gs_location_order_type
-    ).delete().where(
-      gs_location_order_type.location_id == Parameter('%s')
-    )
+      gs_location_order_type = Table('gs_location_order_type')
+      qry = Query.from_(
+        gs_location_order_type
+      ).delete().where(
+        gs_location_order_type.location_id == Parameter('%s')
+      )
 
-    gsdb.execute(str(qry), (location_id,))
+      tx.execute(str(qry), (location_id,))
 
-    gs_location_working_hour = Table('gs_location_working_hour')
-    qry = Query.from_(
-      gs_location_working_hour
-    ).delete().where(
-      gs_location_working_hour.location_id == Parameter('%s')
-    )
+      gs_location_working_hour = Table('gs_location_working_hour')
+      qry = Query.from_(
+        gs_location_working_hour
+      ).delete().where(
+        gs_location_working_hour.location_id == Parameter('%s')
+      )
 
-    gsdb.execute(str(qry), (location_id,))
+      tx.execute(str(qry), (location_id,))
 
   def update(self, location_id: int, params: dict = ()):
     name, address1, city, state, postal, location_type, phone_number, is_active, merchant_location_id = params
@@ -249,6 +255,10 @@ class LocationService:
     return gsdb.fetchall(str(qry), (location_id,))
 
   def get_menus_paginated(self, location_id: int, page: int = 1, limit: int = PER_PAGE):
+    published = publishing_service.get_menus(location_id)
+    if published is not None:
+      return generate_paginated_data(published, page, limit)
+
     json_data = []
     menus = self.get_menus(location_id)
 
@@ -296,22 +306,30 @@ class LocationService:
     return False
 
   def add_menu(self, location_id: int, menu_id: int):
+    publishing_service.invalidate('location', [location_id])
+
     gs_location_menu = Table('gs_location_menu')
-    qry = Query.into(
+    qry = PostgreSQLQuery.into(
       gs_location_menu
     ).columns(
       gs_location_menu.tenant_id,
       gs_location_menu.location_id,
       gs_location_menu.menu_id
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s')
-    )
+    ).on_conflict(
+      gs_location_menu.tenant_id,
+      gs_location_menu.location_id,
+      gs_location_menu.menu_id
+    ).do_nothing()
 
     gsdb.execute(str(qry), (location_id, menu_id,))
 
   def delete_menu(self, location_id: int, menu_id: int):
+    publishing_service.invalidate('location', [location_id])
+
     gs_location_menu = Table('gs_location_menu')
     qry = Query.from_(
       gs_location_menu
@@ -337,6 +355,8 @@ class LocationService:
       gs_menu_item.price,
       gs_menu_item.sale_price,
       gs_menu_item.is_onsale,
+      gs_menu_item.sale_start,
+      gs_menu_item.sale_end,
       gs_item.name,
       gs_item.description,
       gs_item.thumbnail_url,
@@ -372,7 +392,7 @@ class LocationService:
     ).select(
       gs_tenant_feature.location_count
     ).where(
-      gs_tenant_feature.tenant_id == app.config['TENANT_ID']
+      gs_tenant_feature.tenant_id == get_tenant_id()
     )
     
     result = gsprod.fetchone(str(qry))
@@ -442,114 +462,95 @@ class LocationService:
 
   def add_order_type(self, location_id: int, order_type_id: int):
     gs_location_order_type = Table('gs_location_order_type')
-    qry = Query.into(
+    qry = PostgreSQLQuery.into(
       gs_location_order_type
     ).columns(
       gs_location_order_type.tenant_id,
       gs_location_order_type.location_id,
       gs_location_order_type.order_type_id
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s')
-    )
+    ).on_conflict(
+      gs_location_order_type.tenant_id,
+      gs_location_order_type.location_id,
+      gs_location_order_type.order_type_id
+    ).do_nothing()
 
     gsdb.execute(str(qry), (location_id, order_type_id,))
   
-  def initialize_work_hours(self, location_id: int):
-    gs_working_hour_type = Table('gs_working_hour_type')
+  def assign(self, location_ids: list, menu_ids: list = [], order_type_ids: list = []):
+    if len(menu_ids) > 0:
+      publishing_service.invalidate('location', location_ids)
 
-    qry = Query.from_(
-      gs_working_hour_type
-    ).select(
-      '*'
-    )
+    params = {'tenant_id': get_tenant_id(), 'location_ids': list(location_ids),
+              'menu_ids': list(menu_ids), 'order_type_ids': list(order_type_ids)}
 
-    working_hour_types = gsdb.fetchall(str(qry))
+    menus, order_types = [], []
+    with gsdb.transaction() as tx:
+      if len(menu_ids) > 0:
+        menus = tx.fetchall(ASSIGN_MENUS, params)
+      if len(order_type_ids) > 0:
+        order_types = tx.fetchall(ASSIGN_ORDER_TYPES, params)
 
-    for working_hour_type in working_hour_types:
-      days = [0, 1, 2, 3, 4, 5, 6]
+    return (len(menus), len(order_types))
 
-      for day in days: 
-        params = {
-          'day': day,
-          'open_hour': 8,
-          'open_minute': 0,
-          'close_hour': 17,
-          'close_minute': 0,
-          'is_open': False
-        }
-        
-        self.update_work_hour(location_id, working_hour_type['working_hour_type_id'], format_work_hour_params(params))
+  def initialize_work_hours(self, location_id: int, db = gsdb):
+    qry = """INSERT INTO gs_location_working_hour (tenant_id, location_id, working_hour_type_id, day,
+                                                   open_hour, open_minute, close_hour, close_minute, is_open)
+             SELECT %s::uuid, %s, t.working_hour_type_id, d.day, 8, 0, 17, 0, 'f'
+               FROM gs_working_hour_type t
+              CROSS JOIN generate_series(0, 6) AS d(day)
+             ON CONFLICT (tenant_id, location_id, working_hour_type_id, day) DO NOTHING"""
+
+    db.execute(qry, (get_tenant_id(), location_id,))
 
   def update_work_hour(self, location_id: int, working_hour_type_id: int, params: dict = ()):  
     day, open_hour, open_minute, close_hour, close_minute, is_open = params
 
-    gs_location_working_hour = Table('gs_location_working_hour')
+    self.update_work_hours([location_id], ([working_hour_type_id], [day], [open_hour], [open_minute], [close_hour], [close_minute], [is_open]))
+
+  def update_work_hours(self, location_ids: list, params: tuple = ()):
+    working_hour_type_ids, days, open_hours, open_minutes, close_hours, close_minutes, is_opens = params
+
+    # Every (location, working hour) pair is written by a single upsert so a
+    # whole week, or a week copied across many locations, is one statement.
+    qry = """INSERT INTO gs_location_working_hour (tenant_id, location_id, working_hour_type_id, day,
+                                                   open_hour, open_minute, close_hour, close_minute, is_open)
+             SELECT %s::uuid, l.location_id, h.working_hour_type_id, h.day,
+                    h.open_hour, h.open_minute, h.close_hour, h.close_minute, h.is_open
+               FROM unnest(%s::int[]) AS l(location_id)
+              CROSS JOIN unnest(%s::int[], %s::int[], %s::smallint[], %s::smallint[], %s::smallint[], %s::smallint[], %s::boolean[])
+                    AS h(working_hour_type_id, day, open_hour, open_minute, close_hour, close_minute, is_open)
+             ON CONFLICT (tenant_id, location_id, working_hour_type_id, day) DO UPDATE
+                SET open_hour = EXCLUDED.open_hour,
+                    open_minute = EXCLUDED.open_minute,
+                    close_hour = EXCLUDED.close_hour,
+                    close_minute = EXCLUDED.close_minute,
+                    is_open = EXCLUDED.is_open"""
+
+    gsdb.execute(qry, (get_tenant_id(), list(location_ids), working_hour_type_ids, days, open_hours, open_minutes, close_hours, close_minutes, is_opens,))
+
+  def get_existing_ids(self, location_ids: list):
+    if len(location_ids) <= 0:
+      return []
 
+    gs_location = Table('gs_location')
     qry = Query.from_(
-      gs_location_working_hour
+      gs_location
     ).select(
-      '*'
-    ).where(
-      gs_location_working_hour.location_id == Parameter('%s')
-    ).where(
-      gs_location_working_hour.day == Parameter('%s')
+      gs_location.location_id
     ).where(
-      gs_location_working_hour.working_hour_type_id == Parameter('%s')
+      gs_location.location_id.isin(Parameter('%s'))
     )
 
-    working_hour = gsdb.fetchone(str(qry), (location_id, day, working_hour_type_id,))
+    locations = gsdb.fetchall(str(qry), (tuple(location_ids),))
 
-    if working_hour is not None:
-      qry = Query.update(
-        gs_location_working_hour
-      ).set(
-        gs_location_working_hour.open_hour, Parameter('%s')
-      ).set(
-        gs_location_working_hour.open_minute, Parameter('%s')
-      ).set(
-        gs_location_working_hour.close_hour, Parameter('%s')
-      ).set(
-        gs_location_working_hour.close_minute, Parameter('%s')
-      ).set(
-        gs_location_working_hour.is_open, Parameter('%s')
-      ).where(
-        gs_location_working_hour.location_id == Parameter('%s')
-      ).where(
-        gs_location_working_hour.day == Parameter('%s')
-      ).where(
-        gs_location_working_hour.working_hour_type_id == Parameter('%s')
-      )
-
-      gsdb.execute(str(qry), (open_hour, open_minute, close_hour, close_minute, is_open, location_id, day, working_hour_type_id,))
-
-    else:
-      qry = Query.into(
-        gs_location_working_hour
-      ).columns(
-        gs_location_working_hour.tenant_id,
-        gs_location_working_hour.location_id,
-        gs_location_working_hour.day,
-        gs_location_working_hour.open_hour,
-        gs_location_working_hour.open_minute,
-        gs_location_working_hour.close_hour,
-        gs_location_working_hour.close_minute,
-        gs_location_working_hour.is_open,
-        gs_location_working_hour.working_hour_type_id
-      ).insert(
-        app.config['TENANT_ID'],
-        Parameter('%s'),
-        Parameter('%s'),
-        Parameter('%s'),
-        Parameter('%s'),
-        Parameter('%s'),
-        Parameter('%s'),
-        Parameter('%s'),
-        Parameter('%s')
-      )
+    if locations is None:
+      return []
 
-      gsdb.execute(str(qry), (location_id, day, open_hour, open_minute, close_hour, close_minute, is_open, working_hour_type_id,))
+    return [location['location_id'] for location in locations]
   
   def get_work_hours(self, location_id: int):
     gs_location_working_hour = Table('gs_location_working_hour')
@@ -653,36 +654,27 @@ class LocationService:
 
   def update_property(self, location_id: int, key: str, value: str):
     gs_location_property = Table('gs_location_property')
+    qry = PostgreSQLQuery.into(
+      gs_location_property
+    ).columns(
+      gs_location_property.tenant_id,
+      gs_location_property.location_id,
+      gs_location_property.key,
+      gs_location_property.value,
+    ).insert(
+      get_tenant_id(),
+      Parameter('%s'),
+      Parameter('%s'),
+      Parameter('%s'),
+    ).on_conflict(
+      gs_location_property.tenant_id,
+      gs_location_property.location_id,
+      gs_location_property.key
+    ).do_update(
+      gs_location_property.value
+    )
 
-    if self.property_exists(location_id, key):
-      qry = Query.update(
-        gs_location_property
-      ).set(
-        gs_location_property.value, Parameter('%s')
-      ).where(
-        gs_location_property.key == Parameter('%s')
-      ).where(
-        gs_location_property.location_id == Parameter('%s')
-      )
-
-      return gsdb.execute(str(qry), (value, key, location_id,))
-
-    else:
-      qry = Query.into(
-        gs_location_property
-      ).columns(
-        gs_location_property.tenant_id,
-        gs_location_property.location_id,
-        gs_location_property.key,
-        gs_location_property.value,
-      ).insert(
-        app.config['TENANT_ID'],
-        Parameter('%s'),
-        Parameter('%s'),
-        Parameter('%s'),
-      )
-
-      return gsdb.execute(str(qry), (location_id, key, value,))
+    return gsdb.execute(str(qry), (location_id, key, value,))
 
   def verify_is_open(self, location_id: int, working_hour_type_id: int):
     working_hours = self.get_work_hour(location_id, working_hour_type_id)
@@ -1,5 +1,8 @@
 from grubstack import app
 from grubstack.application.utilities.reducers import field_reducer
+from grubstack.application.utilities.request import verify_params
+
+from .locations_constants import REQUIRED_WORK_HOUR_FIELDS
 
 def format_location(location: dict, menus_list: list = [], filters: dict = {}):
   json_data = {
@@ -57,6 +60,28 @@ def format_work_hour_params(params: dict):
 
   return (day, open_hour, open_minute, close_hour, close_minute, is_open)
 
+def format_work_hours_params(work_hours: list, working_hour_type_id: int = None):
+  # Keyed by (working_hour_type_id, day) so a repeated day keeps the last value,
+  # a single upsert statement cannot touch the same row twice
+  rows = {}
+
+  for work_hour in work_hours:
+    verify_params(work_hour, REQUIRED_WORK_HOUR_FIELDS)
+    if working_hour_type_id is None:
+      verify_params(work_hour, ['working_hour_type_id'])
+
+    day, open_hour, open_minute, close_hour, close_minute, is_open = format_work_hour_params(work_hour)
+    hour_type_id = int(work_hour.get('working_hour_type_id', working_hour_type_id))
+
+    rows[(hour_type_id, int(day))] = (hour_type_id, int(day), int(open_hour), int(open_minute), int(close_hour), int(close_minute), is_open in (True, 't', 'true'))
+
+  if len(rows) <= 0:
+    raise ValueError('Missing required fields: working_hours')
+
+  working_hour_type_ids, days, open_hours, open_minutes, close_hours, close_minutes, is_opens = (list(column) for column in zip(*rows.values()))
+
+  return (working_hour_type_ids, days, open_hours, open_minutes, close_hours, close_minutes, is_opens)
+
 def format_property(location_property: dict = {}):
   json_data = {
     "location_id": location_property['location_id'],
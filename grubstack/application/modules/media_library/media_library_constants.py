@@ -1,5 +1,9 @@
 from grubstack import app
+from grubstack.tenant import get_tenant_id
 
 PER_PAGE = app.config['PER_PAGE']
 
-UPLOAD_FOLDER = '/uploads/' + app.config['TENANT_ID']
+UPLOAD_ROOT = '/uploads/'
+
+def upload_folder() -> str:
+  return UPLOAD_ROOT + get_tenant_id()
@@ -6,10 +6,11 @@ from pypika import Query, Table
 from werkzeug.utils import secure_filename
 
 from grubstack import app, gsdb
+from grubstack.tenant import get_tenant_id
 
 from grubstack.application.utilities.filters import generate_paginated_data
 
-from .media_library_constants import PER_PAGE, UPLOAD_FOLDER
+from .media_library_constants import PER_PAGE, upload_folder
 from .media_library_utilities import format_file_data
 
 class MediaLibraryService:
@@ -59,8 +60,8 @@ class MediaLibraryService:
       return None
 
   def upload(self, file):
-    if os.path.exists(UPLOAD_FOLDER) == False:
-      os.mkdir(UPLOAD_FOLDER) 
+    if os.path.exists(upload_folder()) == False:
+      os.mkdir(upload_folder()) 
 
     now = datetime.now()
     timestamp = now.strftime("-%m_%d_%Y_%H:%M:%S")
@@ -68,7 +69,7 @@ class MediaLibraryService:
     filename = secure_filename(file.filename)
     formatted_filename = os.path.splitext(filename)[0] + timestamp + os.path.splitext(filename)[1]
 
-    full_path = os.path.join(UPLOAD_FOLDER, formatted_filename)
+    full_path = os.path.join(upload_folder(), formatted_filename)
 
     file.save(os.path.join(full_path))
 
@@ -85,7 +86,7 @@ class MediaLibraryService:
       gs_media_library.file_size,
       gs_media_library.file_type
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       formatted_filename,
       file_size,
       file_type
@@ -95,7 +96,7 @@ class MediaLibraryService:
   def delete(self, file_id: int):
     file_data = self.get(file_id)
 
-    full_path = os.path.join(UPLOAD_FOLDER, file_data['name'])
+    full_path = os.path.join(upload_folder(), file_data['name'])
     if full_path != '/':
       os.remove(full_path)
 
@@ -106,7 +107,7 @@ class MediaLibraryService:
     ).delete().where(
       gs_media_library.file_id == file_data['id']
     ).where(
-      gs_media_library.tenant_id == app.config['TENANT_ID']
+      gs_media_library.tenant_id == get_tenant_id()
     )
 
     qry = gsdb.execute(str(qry))
\ No newline at end of file
@@ -1,4 +1,5 @@
 from . import menus
 from . import ingredients
 from . import items
-from . import varieties
\ No newline at end of file
+from . import varieties
+from . import nutrition
\ No newline at end of file
@@ -1,11 +1,17 @@
 from pypika import PostgreSQLQuery, Query, Table, Order, Parameter
 
 from grubstack import app, gsdb
+from grubstack.tenant import get_tenant_id
+from grubstack.application.modules.publishing.publishing_service import PublishingService
+from grubstack.application.modules.products.nutrition.nutrition_service import NutritionService
 from grubstack.application.utilities.filters import generate_paginated_data
 
 from .ingredients_utilities import format_ingredient
 from .ingredients_constants import PER_PAGE
 
+publishing_service = PublishingService()
+nutrition_service = NutritionService()
+
 class IngredientService:
   def __init__(self):
     pass
@@ -54,6 +60,26 @@ class IngredientService:
     else:
       return None
 
+  def get_existing_ids(self, ingredient_ids: list):
+    if len(ingredient_ids) <= 0:
+      return []
+
+    gs_ingredient = Table('gs_ingredient')
+    qry = Query.from_(
+      gs_ingredient
+    ).select(
+      gs_ingredient.ingredient_id
+    ).where(
+      gs_ingredient.ingredient_id.isin(Parameter('%s'))
+    )
+
+    ingredients = gsdb.fetchall(str(qry), (tuple(ingredient_ids),))
+
+    if ingredients is None:
+      return []
+
+    return [ingredient['ingredient_id'] for ingredient in ingredients]
+
   def search(self, name: str, filters: dict = {}):
     gs_ingredient = Table('gs_ingredient')
     qry = Query.from_(
@@ -74,25 +100,32 @@ class IngredientService:
       return None
 
   def delete(self, ingredient_id: int):
-    gs_ingredient = Table('gs_ingredient')
-    qry = Query.from_(
-      gs_ingredient
-    ).delete().where(
-      gs_ingredient.ingredient_id == Parameter('%s')
-    )
+    publishing_service.invalidate('ingredient', [ingredient_id])
+    nutrition_service.invalidate('ingredient', [ingredient_id])
 
-    gsdb.execute(str(qry), (ingredient_id,))
+    with gsdb.transaction() as tx:
+      gs_ingredient = Table('gs_ingredient')
+      qry = Query.from_(
+        gs_ingredient
+      ).delete().where(
+        gs_ingredient.ingredient_id == Parameter('%s')
+      )
 
-    gs_item_ingredient = Table('gs_item_ingredient')
-    qry = Query.from_(
-      gs_item_ingredient
-    ).delete().where(
-      gs_item_ingredient.ingredient_id == Parameter('%s')
-    )
+      tx.execute(str(qry), (ingredient_id,))
+
+      gs_item_ingredient = Table('gs_item_ingredient')
+      qry = Query.from_(
+        gs_item_ingredient
+      ).delete().where(
+        gs_item_ingredient.ingredient_id == Parameter('%s')
+      )
+
+      tx.execute(str(qry), (ingredient_id,))
 
-    gsdb.execute(str(qry), (ingredient_id,))
-  
   def update(self, ingredient_id: int, params: dict = ()):
+    publishing_service.invalidate('ingredient', [ingredient_id])
+    nutrition_service.invalidate('ingredient', [ingredient_id])
+
     name, description, thumbnail_url, calories, fat, saturated_fat, trans_fat, cholesterol, sodium, carbs, protein, sugar, fiber, price = params
 
     gs_ingredient = Table('gs_ingredient')
@@ -155,7 +188,7 @@ class IngredientService:
       gs_ingredient.fiber,
       gs_ingredient.price
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s'),
       Parameter('%s'),
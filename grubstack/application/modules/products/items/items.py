@@ -214,6 +214,10 @@ def add_ingredient(item_id: int):
     if request.json:
       data = json.loads(request.data)
       params = data['params']
+
+      if 'ingredient_ids' in params:
+        return add_ingredients(item_id, params['ingredient_ids'])
+
       ingredient_id = params['ingredient_id']
 
       if ingredient_id is not None and item_id is not None:
@@ -249,6 +253,36 @@ def add_ingredient(item_id: int):
                             status=GStatusCode.ERROR,
                             httpstatus=500)
 
+def add_ingredients(item_id: int, ingredient_ids: list):
+  ingredient_ids = list(dict.fromkeys(int(ingredient_id) for ingredient_id in ingredient_ids))
+  if len(ingredient_ids) <= 0:
+    return gs_make_response(message='ingredient_ids must list at least one ingredient',
+                            status=GStatusCode.ERROR,
+                            httpstatus=400)
+
+  item = item_service.get(item_id, {'showIngredients': True})
+
+  if item is None:
+    return gs_make_response(message='Item not found',
+                            status=GStatusCode.ERROR,
+                            httpstatus=404)
+
+  missing_ids = set(ingredient_ids) - set(ingredient_service.get_existing_ids(ingredient_ids))
+  if len(missing_ids) > 0:
+    return gs_make_response(message='Ingredient not found',
+                            status=GStatusCode.ERROR,
+                            data={'ingredient_ids': sorted(missing_ids)},
+                            httpstatus=404)
+
+  existing_ids = set(ingredient['id'] for ingredient in item['ingredients'])
+  new_ids = [ingredient_id for ingredient_id in ingredient_ids if ingredient_id not in existing_ids]
+
+  item_service.add_ingredients(item_id, new_ids)
+
+  return gs_make_response(message=f'{len(new_ids)} ingredients added to item',
+                          data={'ingredient_ids': new_ids},
+                          httpstatus=201)
+
 @item.route('/items/<int:item_id>/ingredients/<int:ingredient_id>', methods=['PATCH'])
 @jwt_required()
 @requires_permission("MaintainItems")
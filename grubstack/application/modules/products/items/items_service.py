@@ -1,6 +1,9 @@
 from pypika import PostgreSQLQuery, Query, Table, Tables, Order, Parameter
 
 from grubstack import app, gsdb
+from grubstack.tenant import get_tenant_id
+from grubstack.application.modules.publishing.publishing_service import PublishingService
+from grubstack.application.modules.products.nutrition.nutrition_service import NutritionService
 from grubstack.application.utilities.filters import generate_paginated_data
 from grubstack.application.modules.products.ingredients.ingredients_utilities import format_ingredient
 from grubstack.application.modules.products.varieties.varieties_utilities import format_variety
@@ -8,6 +11,9 @@ from grubstack.application.modules.products.varieties.varieties_utilities import
 from .items_utilities import format_item
 from .items_constants import PER_PAGE, DEFAULT_FILTERS
 
+publishing_service = PublishingService()
+nutrition_service = NutritionService()
+
 class ItemService:
   def __init__(self):
     pass
@@ -105,23 +111,26 @@ class ItemService:
       return None
 
   def delete(self, item_id: int):
-    gs_item = Table('gs_item')
-    qry = Query.from_(
-      gs_item
-    ).delete().where(
-      gs_item.item_id == Parameter('%s')
-    )
+    publishing_service.invalidate('item', [item_id])
 
-    gsdb.execute(str(qry), (item_id,))
+    with gsdb.transaction() as tx:
+      gs_item = Table('gs_item')
+      qry = Query.from_(
+        gs_item
+      ).delete().where(
+        gs_item.item_id == Parameter('%s')
+      )
 
-    gs_menu_item = Table('gs_menu_item')
-    qry = Query.from_(
-      gs_menu_item
-    ).delete().where(
-      gs_menu_item.item_id == Parameter('%s')
-    )
+      tx.execute(str(qry), (item_id,))
+
+      gs_menu_item = Table('gs_menu_item')
+      qry = Query.from_(
+        gs_menu_item
+      ).delete().where(
+        gs_menu_item.item_id == Parameter('%s')
+      )
 
-    gsdb.execute(str(qry), (item_id,))
+      tx.execute(str(qry), (item_id,))
 
   def create(self, params: dict = ()):
     name, description, thumbnail_url, slug = params
@@ -136,7 +145,7 @@ class ItemService:
       gs_item.thumbnail_url,
       gs_item.slug
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s'),
       Parameter('%s'),
@@ -146,6 +155,8 @@ class ItemService:
     return gsdb.fetchone(str(qry), (name, description, thumbnail_url, slug,))
 
   def update(self, item_id: int, params: dict = ()):
+    publishing_service.invalidate('item', [item_id])
+
     name, description, thumbnail_url, slug = params
 
     gs_item = Table('gs_item')
@@ -233,8 +244,11 @@ class ItemService:
     return False
 
   def add_ingredient(self, item_id: int, ingredient_id: int):
+    publishing_service.invalidate('item', [item_id])
+    nutrition_service.invalidate('item', [item_id])
+
     gs_item_ingredient = Table('gs_item_ingredient')
-    qry = Query.into(
+    qry = PostgreSQLQuery.into(
       gs_item_ingredient
     ).columns(
       gs_item_ingredient.tenant_id,
@@ -244,17 +258,37 @@ class ItemService:
       gs_item_ingredient.is_addon,
       gs_item_ingredient.is_extra
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s'),
       'f',
       'f',
       'f'
-    )
+    ).on_conflict(
+      gs_item_ingredient.tenant_id,
+      gs_item_ingredient.item_id,
+      gs_item_ingredient.ingredient_id
+    ).do_nothing()
 
     gsdb.execute(str(qry), (item_id, ingredient_id,))
 
+  def add_ingredients(self, item_id: int, ingredient_ids: list):
+    publishing_service.invalidate('item', [item_id])
+    nutrition_service.invalidate('item', [item_id])
+
+    qry = """INSERT INTO gs_item_ingredient (tenant_id, item_id, ingredient_id, is_optional, is_addon, is_extra)
+                   VALUES %s
+             ON CONFLICT (tenant_id, item_id, ingredient_id) DO NOTHING"""
+
+    # Through a transaction rather than gsdb.execute_values, which logs and
+    # swallows errors, so a failed insert reaches the caller
+    with gsdb.transaction() as tx:
+      tx.execute_values(qry, [(get_tenant_id(), item_id, ingredient_id, 'f', 'f', 'f') for ingredient_id in ingredient_ids])
+
   def delete_ingredient(self, item_id: int, ingredient_id: int):
+    publishing_service.invalidate('item', [item_id])
+    nutrition_service.invalidate('item', [item_id])
+
     gs_item_ingredient = Table('gs_item_ingredient')
     qry = Query.from_(
       gs_item_ingredient
@@ -267,6 +301,9 @@ class ItemService:
     gsdb.execute(str(qry), (item_id, ingredient_id,))
 
   def update_ingredient(self, item_id: int, ingredient_id: int, params: dict):
+    publishing_service.invalidate('item', [item_id])
+    nutrition_service.invalidate('item', [item_id])
+
     is_optional, is_addon, is_extra = params
 
     gs_item_ingredient = Table('gs_item_ingredient')
@@ -354,22 +391,30 @@ class ItemService:
     return False
 
   def add_variety(self, item_id: int, variety_id: int):
+    publishing_service.invalidate('item', [item_id])
+
     gs_item_variety = Table('gs_item_variety')
-    qry = Query.into(
+    qry = PostgreSQLQuery.into(
       gs_item_variety
     ).columns(
       gs_item_variety.tenant_id,
       gs_item_variety.item_id,
       gs_item_variety.variety_id,
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s')
-    )
+    ).on_conflict(
+      gs_item_variety.tenant_id,
+      gs_item_variety.item_id,
+      gs_item_variety.variety_id
+    ).do_nothing()
 
     gsdb.execute(str(qry), (item_id, variety_id,))
 
   def delete_variety(self, item_id: int, variety_id: int):
+    publishing_service.invalidate('item', [item_id])
+
     gs_item_variety = Table('gs_item_variety')
     qry = Query.from_(
       gs_item_variety
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 from grubstack import app
 
 from grubstack.application.utilities.reducers import field_reducer
@@ -17,11 +19,17 @@ def format_item(item: dict, ingredients_list = [], varieties_list: list = [], fi
     json_data['price'] = item['price']
 
   if 'is_onsale' in item:
-    json_data['is_onsale'] = item['is_onsale']
+    json_data['is_onsale'] = is_sale_active(item)
 
   if 'sale_price' in item:
     json_data['sale_price'] = item['sale_price']
 
+  if 'sale_start' in item:
+    json_data['sale_start'] = item['sale_start'].isoformat() if item['sale_start'] is not None else None
+
+  if 'sale_end' in item:
+    json_data['sale_end'] = item['sale_end'].isoformat() if item['sale_end'] is not None else None
+
   if 'showIngredients' in filters and filters['showIngredients']:
     json_data['ingredients'] = ingredients_list
 
@@ -30,6 +38,21 @@ def format_item(item: dict, ingredients_list = [], varieties_list: list = [], fi
 
   return json_data
 
+def is_sale_active(item: dict, now: datetime = None):
+  # is_onsale only holds inside the sale window, an open end is no limit on
+  # that side; published documents carry the window as ISO 8601 strings
+  if not item.get('is_onsale'):
+    return False
+
+  now = now or datetime.now(timezone.utc)
+  sale_start, sale_end = item.get('sale_start'), item.get('sale_end')
+  if isinstance(sale_start, str):
+    sale_start = datetime.fromisoformat(sale_start)
+  if isinstance(sale_end, str):
+    sale_end = datetime.fromisoformat(sale_end)
+
+  return (sale_start is None or sale_start <= now) and (sale_end is None or now < sale_end)
+
 def format_params(params: dict, item: dict = {}):
   name = field_reducer('name', params, item, '')
   description = field_reducer('description', params, item, '')
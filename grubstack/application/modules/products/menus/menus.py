@@ -5,14 +5,14 @@ from flask import Blueprint, url_for, request
 from grubstack import app, config, gsdb
 from grubstack.utilities import gs_make_response
 from grubstack.envelope import GStatusCode
-from grubstack.authentication import AuthError, jwt_required, requires_permission
+from grubstack.authentication import AuthError, jwt_required, requires_permission, get_permissions
 
 from grubstack.application.utilities.request import verify_params
 from grubstack.application.utilities.filters import generate_filters, create_pagination_params
 
 from grubstack.application.modules.products.items.items_service import ItemService
 
-from .menus_utilities import format_menu, format_params, format_item_params
+from .menus_utilities import format_menu, format_params, format_item_params, format_pricing_rule, format_price_list
 from .menus_constants import MENU_FILTERS, PER_PAGE, DEFAULT_FILTERS, REQUIRED_FIELDS
 from .menus_service import MenuService
 
@@ -308,4 +308,117 @@ def update_item(menu_id: str, item_id: str):
                             status=GStatusCode.ERROR,
                             httpstatus=500)
 
+@menu.route('/menus/<int:menu_id>/clone', methods=['POST'])
+@jwt_required()
+@requires_permission("MaintainMenus")
+def clone(menu_id: int):
+  try:
+    if request.json:
+      data = json.loads(request.data)
+      params = data['params']
+
+      verify_params(params, REQUIRED_FIELDS)
+
+      source = menu_service.get(menu_id)
+      if source is None:
+        return gs_make_response(message='Menu not found',
+                                status=GStatusCode.ERROR,
+                                httpstatus=404)
+
+      name, description, thumbnail_url, slug = format_params(params, source)
+      location_ids = [int(location_id) for location_id in params.get('location_ids', [])]
+
+      # Assigning the copy to locations needs what /locations/assignments needs
+      if len(location_ids) > 0:
+        permissions = get_permissions()
+        if 'MaintainLocations' not in permissions or 'MaintainRestaurants' not in permissions:
+          return gs_make_response(message='MaintainLocations and MaintainRestaurants are required to assign the menu to locations',
+                                  status=GStatusCode.ERROR,
+                                  httpstatus=403)
+
+      if menu_service.search(name) is not None:
+        return gs_make_response(message='A menu with that name already exists. Try a different name',
+                                status=GStatusCode.ERROR,
+                                httpstatus=400)
+
+      if menu_service.get_by_slug(slug) is not None:
+        return gs_make_response(message='A menu with that slug already exists. Try a different slug',
+                                status=GStatusCode.ERROR,
+                                httpstatus=400)
+
+      cloned = menu_service.clone(menu_id, (name, description, thumbnail_url, slug), location_ids)
+      if cloned is None:
+        return gs_make_response(message='Menu not found',
+                                status=GStatusCode.ERROR,
+                                httpstatus=404)
+
+      headers = {'Location': url_for('menu.get', menu_id=cloned['menu_id'])}
+      return gs_make_response(message=f"Menu #{menu_id} cloned with {cloned['item_count']} items",
+                              httpstatus=201,
+                              headers=headers,
+                              data={'menu': menu_service.get(cloned['menu_id']),
+                                    'location_ids': cloned['location_ids'],
+                                    'missing_location_ids': sorted(set(location_ids) - set(cloned['location_ids']))})
+    else:
+      return gs_make_response(message='Invalid request',
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+
+  except ValueError as e:
+    return gs_make_response(message=str(e),
+                            status=GStatusCode.ERROR,
+                            httpstatus=400)
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to clone menu',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+@menu.route('/menus/items/pricing', methods=['POST'])
+@jwt_required()
+@requires_permission("MaintainMenus")
+def update_pricing():
+  try:
+    if request.json:
+      data = json.loads(request.data)
+      params = data['params']
+      dry_run = params.get('dry_run', False) == True
+
+      if 'prices' in params:
+        prices = format_price_list(params['prices'])
+        changes = menu_service.set_item_prices(prices, dry_run)
+      else:
+        prices = None
+        changes = menu_service.reprice_items(format_pricing_rule(params), dry_run)
+
+      json_data = {
+        'dry_run': dry_run,
+        'updated': len(changes),
+        'changes': changes
+      }
+
+      # Explicit entries that matched no menu item are reported, not an error
+      if prices is not None:
+        matched = set((change['menu_id'], change['item_id']) for change in changes)
+        json_data['not_found'] = [{'menu_id': price['menu_id'], 'item_id': price['item_id']}
+                                  for price in prices if (price['menu_id'], price['item_id']) not in matched]
+
+      message = f'{len(changes)} menu items would be repriced' if dry_run else f'{len(changes)} menu items repriced'
+      return gs_make_response(message=message, data=json_data)
+
+    else:
+      return gs_make_response(message='Invalid request',
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+
+  except ValueError as e:
+    return gs_make_response(message=str(e),
+                            status=GStatusCode.ERROR,
+                            httpstatus=400)
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to update pricing. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
 app.register_blueprint(menu, url_prefix=config.get('general', 'urlprefix', fallback='/'))
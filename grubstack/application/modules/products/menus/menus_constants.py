@@ -9,4 +9,83 @@ REQUIRED_FIELDS = [
 MENU_FILTERS = ['showItems']
 DEFAULT_FILTERS = {
   'showItems': True,
-}
\ No newline at end of file
+}
+
+PRICING_MAX_ITEMS = 5000
+
+# How a pricing rule may change the price, and the sale price relative to the
+# new price
+PRICE_CHANGES = {
+  'set': "%(price_value)s",
+  'percent': "mi.price * (1 + %(price_value)s / 100.0)",
+  'amount': "mi.price + %(price_value)s"
+}
+SALE_CHANGES = {
+  'price': "%(sale_value)s",
+  'percent_off': "({price}) * (1 - %(sale_value)s / 100.0)",
+  'amount_off': "({price}) - %(sale_value)s"
+}
+
+# The self join on old exposes the values before the update to RETURNING,
+# which is what a dry run reports before it is rolled back
+PRICING_RETURNING = """RETURNING mi.menu_id, mi.item_id, old.price AS old_price, mi.price, old.sale_price AS old_sale_price,
+          mi.sale_price, old.is_onsale AS old_is_onsale, mi.is_onsale, mi.sale_start, mi.sale_end"""
+
+# Entries are read as raw jsonb so a key that is present but null (clear the
+# sale window) is told apart from a key that is left out (keep it)
+SET_PRICES = """
+UPDATE gs_menu_item mi
+   SET price = COALESCE((v.value->>'price')::double precision, mi.price),
+       sale_price = COALESCE((v.value->>'sale_price')::double precision, mi.sale_price),
+       is_onsale = COALESCE((v.value->>'is_onsale')::boolean, mi.is_onsale),
+       sale_start = CASE WHEN v.value ? 'sale_start' THEN (v.value->>'sale_start')::timestamp with time zone ELSE mi.sale_start END,
+       sale_end = CASE WHEN v.value ? 'sale_end' THEN (v.value->>'sale_end')::timestamp with time zone ELSE mi.sale_end END
+  FROM jsonb_array_elements(%(prices)s::jsonb) AS v,
+       gs_menu_item old
+ WHERE mi.menu_id = (v.value->>'menu_id')::integer AND mi.item_id = (v.value->>'item_id')::integer
+   AND old.tenant_id = mi.tenant_id AND old.menu_id = mi.menu_id AND old.item_id = mi.item_id
+""" + PRICING_RETURNING
+
+REPRICE = """
+UPDATE gs_menu_item mi
+   SET price = {price},
+       sale_price = {sale_price},
+       is_onsale = {is_onsale},
+       sale_start = {sale_start},
+       sale_end = {sale_end}
+  FROM gs_menu_item old
+ WHERE old.tenant_id = mi.tenant_id AND old.menu_id = mi.menu_id AND old.item_id = mi.item_id
+   AND (%(menu_ids)s::integer[] IS NULL OR mi.menu_id = ANY(%(menu_ids)s::integer[]))
+   AND (%(item_ids)s::integer[] IS NULL OR mi.item_id = ANY(%(item_ids)s::integer[]))
+""" + PRICING_RETURNING
+
+# The copy, its items and its locations in one statement; the items keep their
+# prices and sale windows
+CLONE_MENU = """
+WITH new_menu AS (
+  INSERT INTO gs_menu (tenant_id, name, description, thumbnail_url, slug)
+  SELECT %(tenant_id)s::uuid, %(name)s, %(description)s, %(thumbnail_url)s, %(slug)s
+    FROM gs_menu
+   WHERE menu_id = %(menu_id)s
+  RETURNING menu_id
+), items AS (
+  INSERT INTO gs_menu_item (tenant_id, menu_id, item_id, price, sale_price, is_onsale, sale_start, sale_end)
+  SELECT %(tenant_id)s::uuid, n.menu_id, mi.item_id, mi.price, mi.sale_price, mi.is_onsale, mi.sale_start, mi.sale_end
+    FROM gs_menu_item mi
+   CROSS JOIN new_menu n
+   WHERE mi.menu_id = %(menu_id)s
+      ON CONFLICT (tenant_id, menu_id, item_id) DO NOTHING
+  RETURNING item_id
+), locations AS (
+  INSERT INTO gs_location_menu (tenant_id, location_id, menu_id)
+  SELECT %(tenant_id)s::uuid, l.location_id, n.menu_id
+    FROM gs_location l
+   CROSS JOIN new_menu n
+   WHERE l.location_id = ANY(%(location_ids)s::integer[])
+      ON CONFLICT (tenant_id, location_id, menu_id) DO NOTHING
+  RETURNING location_id
+)
+SELECT n.menu_id,
+       (SELECT COUNT(*) FROM items) AS item_count,
+       COALESCE((SELECT array_agg(location_id ORDER BY location_id) FROM locations), '{}') AS location_ids
+  FROM new_menu n"""
@@ -1,12 +1,19 @@
+import json
+import psycopg2.errors
+
 from math import ceil
 from pypika import PostgreSQLQuery, Query, Table, Tables, Order, functions, Parameter
 
 from grubstack import app, gsdb, gsprod
+from grubstack.tenant import get_tenant_id
+from grubstack.application.modules.publishing.publishing_service import PublishingService
 from grubstack.application.modules.products.items.items_utilities import format_item
 from grubstack.application.utilities.filters import generate_paginated_data
 
-from .menus_utilities import format_menu
-from .menus_constants import PER_PAGE, DEFAULT_FILTERS
+from .menus_utilities import format_menu, format_price_change
+from .menus_constants import PER_PAGE, DEFAULT_FILTERS, PRICE_CHANGES, SALE_CHANGES, SET_PRICES, REPRICE, CLONE_MENU
+
+publishing_service = PublishingService()
 
 class MenuService:
   def __init__(self):
@@ -117,7 +124,7 @@ class MenuService:
       gs_menu.thumbnail_url,
       gs_menu.slug
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s'),
       Parameter('%s'),
@@ -126,7 +133,40 @@ class MenuService:
 
     return gsdb.fetchone(str(qry), (name, description, thumbnail_url, slug,))
 
+  def clone(self, menu_id: int, params: dict = (), location_ids: list = []):
+    name, description, thumbnail_url, slug = params
+
+    if len(location_ids) > 0:
+      publishing_service.invalidate('location', location_ids)
+
+    with gsdb.transaction() as tx:
+      return tx.fetchone(CLONE_MENU, {'tenant_id': get_tenant_id(), 'menu_id': menu_id, 'name': name,
+                                      'description': description, 'thumbnail_url': thumbnail_url, 'slug': slug,
+                                      'location_ids': list(location_ids)})
+
+  def get_existing_ids(self, menu_ids: list):
+    if len(menu_ids) <= 0:
+      return []
+
+    gs_menu = Table('gs_menu')
+    qry = Query.from_(
+      gs_menu
+    ).select(
+      gs_menu.menu_id
+    ).where(
+      gs_menu.menu_id.isin(Parameter('%s'))
+    )
+
+    menus = gsdb.fetchall(str(qry), (tuple(menu_ids),))
+
+    if menus is None:
+      return []
+
+    return [menu['menu_id'] for menu in menus]
+
   def update(self, menu_id: int, params: dict = ()):
+    publishing_service.invalidate('menu', [menu_id])
+
     name, description, thumbnail_url, slug = params
 
     gs_menu = Table('gs_menu')
@@ -147,23 +187,26 @@ class MenuService:
     return gsdb.execute(str(qry), (name, description, thumbnail_url, slug, menu_id,))
 
   def delete(self, menu_id: int):
-    gs_menu = Table('gs_menu')
-    qry = Query.from_(
-      gs_menu
-    ).delete().where(
-      gs_menu.menu_id == Parameter('%s')
-    )
+    publishing_service.invalidate('menu', [menu_id])
 
-    gsdb.execute(str(qry), (menu_id,))
+    with gsdb.transaction() as tx:
+      gs_menu = Table('gs_menu')
+      qry = Query.from_(
+        gs_menu
+      ).delete().where(
+        gs_menu.menu_id == Parameter('%s')
+      )
 
-    gs_menu_item = Table('gs_menu_item')
-    qry = Query.from_(
-      gs_menu_item
-    ).delete().where(
-      gs_menu_item.menu_id == Parameter('%s')
-    )
+      tx.execute(str(qry), (menu_id,))
+
+      gs_menu_item = Table('gs_menu_item')
+      qry = Query.from_(
+        gs_menu_item
+      ).delete().where(
+        gs_menu_item.menu_id == Parameter('%s')
+      )
 
-    gsdb.execute(str(qry), (menu_id,))
+      tx.execute(str(qry), (menu_id,))
 
   def get_items(self, menu_id: int):
     gs_item, gs_menu_item = Tables('gs_item', 'gs_menu_item')
@@ -181,7 +224,9 @@ class MenuService:
       gs_item.slug,
       gs_menu_item.price,
       gs_menu_item.sale_price,
-      gs_menu_item.is_onsale
+      gs_menu_item.is_onsale,
+      gs_menu_item.sale_start,
+      gs_menu_item.sale_end
     ).where(
       gs_menu_item.menu_id == Parameter('%s')
     ).orderby(
@@ -191,8 +236,10 @@ class MenuService:
     return gsdb.fetchall(str(qry), (menu_id,))
 
   def add_item(self, menu_id: int, item_id: int, params: dict):
+    publishing_service.invalidate('menu', [menu_id])
+
     gs_menu_item = Table('gs_menu_item')
-    qry = Query.into(
+    qry = PostgreSQLQuery.into(
       gs_menu_item
     ).columns(
       gs_menu_item.tenant_id,
@@ -200,19 +247,25 @@ class MenuService:
       gs_menu_item.item_id,
       gs_menu_item.price,
       gs_menu_item.sale_price,
-      gs_menu_item.is_onsale,
+      gs_menu_item.is_onsale
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s'),
       0,
       0,
       'f'
-    )
+    ).on_conflict(
+      gs_menu_item.tenant_id,
+      gs_menu_item.menu_id,
+      gs_menu_item.item_id
+    ).do_nothing()
 
     gsdb.execute(str(qry), (menu_id, item_id,))
 
   def delete_item(self, menu_id: int, item_id: int):
+    publishing_service.invalidate('menu', [menu_id])
+
     gs_menu_item = Table('gs_menu_item')
     qry = Query.from_(
       gs_menu_item
@@ -225,6 +278,8 @@ class MenuService:
     gsdb.execute(str(qry), (menu_id, item_id,))
 
   def update_item(self, menu_id: int, item_id: int, params: dict):
+    publishing_service.invalidate('menu', [menu_id])
+
     price, sale_price, is_onsale = params
 
     gs_menu_item = Table('gs_menu_item')
@@ -289,3 +344,57 @@ class MenuService:
     )
 
     return gsdb.fetchone(str(qry), (menu_id, item_id,))
+
+  def apply_pricing(self, qry: str, params: dict, dry_run: bool = False):
+    # A dry run performs the exact same update and rolls it back, so the
+    # preview can never disagree with what a real run would do
+    try:
+      with gsdb.transaction() as tx:
+        changes = tx.fetchall(qry, params)
+        if dry_run:
+          tx.rollback()
+    except psycopg2.errors.CheckViolation:
+      # A new end before the existing start (or the other way round)
+      raise ValueError('sale_end must be after sale_start')
+
+    if not dry_run and len(changes) > 0:
+      publishing_service.invalidate('menu', sorted(set(change['menu_id'] for change in changes)))
+
+    return [format_price_change(change) for change in sorted(changes, key=lambda change: (change['menu_id'], change['item_id']))]
+
+  def set_item_prices(self, prices: list, dry_run: bool = False):
+    # All rows travel as one jsonb parameter instead of a VALUES list, so the
+    # statement stays the same size however many entries are repriced
+    return self.apply_pricing(SET_PRICES, {'prices': json.dumps(prices)}, dry_run)
+
+  def reprice_items(self, rule: dict, dry_run: bool = False):
+    price_kind, price_value = rule['price']
+    sale_kind, sale_value = rule['sale_price']
+
+    price = 'mi.price'
+    if price_kind is not None:
+      price = f'GREATEST(ROUND(({PRICE_CHANGES[price_kind]})::numeric, 2), 0)::double precision'
+
+    sale_price = 'mi.sale_price'
+    if sale_kind is not None:
+      sale_price = f'GREATEST(ROUND(({SALE_CHANGES[sale_kind].format(price=price)})::numeric, 2), 0)::double precision'
+
+    is_onsale = 'mi.is_onsale'
+    if rule['is_onsale'] is not None:
+      is_onsale = '%(is_onsale)s'
+    elif sale_kind is not None:
+      is_onsale = 'true'
+
+    qry = REPRICE.format(price=price,
+                         sale_price=sale_price,
+                         is_onsale=is_onsale,
+                         sale_start='%(sale_start)s::timestamp with time zone' if 'sale_start' in rule else 'mi.sale_start',
+                         sale_end='%(sale_end)s::timestamp with time zone' if 'sale_end' in rule else 'mi.sale_end')
+
+    return self.apply_pricing(qry, {'menu_ids': rule['menu_ids'],
+                                    'item_ids': rule['item_ids'],
+                                    'price_value': price_value,
+                                    'sale_value': sale_value,
+                                    'is_onsale': rule['is_onsale'],
+                                    'sale_start': rule.get('sale_start'),
+                                    'sale_end': rule.get('sale_end')}, dry_run)
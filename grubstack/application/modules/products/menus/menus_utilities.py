@@ -1,8 +1,10 @@
+from datetime import datetime
+
 from grubstack import app
 
 from grubstack.application.utilities.reducers import field_reducer
 
-from .menus_constants import PER_PAGE
+from .menus_constants import PER_PAGE, PRICING_MAX_ITEMS, PRICE_CHANGES, SALE_CHANGES
 
 def format_menu(menu: dict, items_list: list = [], filters: dict = {}):
   json_data = {
@@ -31,4 +33,119 @@ def format_item_params(params: dict, item: dict = {}):
   sale_price = field_reducer('sale_price', params, item, 'f')
   is_onsale = field_reducer('is_onsale', params, item, 'f')
 
-  return (price, sale_price, is_onsale)
\ No newline at end of file
+  return (price, sale_price, is_onsale)
+
+def format_price_change(change: dict):
+  json_data = {
+    "menu_id": change['menu_id'],
+    "item_id": change['item_id'],
+    "old_price": change['old_price'],
+    "price": change['price'],
+    "old_sale_price": change['old_sale_price'],
+    "sale_price": change['sale_price'],
+    "old_is_onsale": change['old_is_onsale'],
+    "is_onsale": change['is_onsale'],
+    "sale_start": change['sale_start'].isoformat() if change['sale_start'] is not None else None,
+    "sale_end": change['sale_end'].isoformat() if change['sale_end'] is not None else None
+  }
+
+  return json_data
+
+def format_id_list(params: dict, field: str):
+  if field not in params or params[field] is None:
+    return None
+
+  if not isinstance(params[field], list) or not all(isinstance(value, int) for value in params[field]):
+    raise ValueError(f'{field} must be a list of ids')
+
+  return params[field]
+
+def format_change(params: dict, field: str, kinds: dict):
+  # {"percent": 5} -> ('percent', 5.0)
+  if field not in params or params[field] is None:
+    return (None, None)
+
+  change = params[field]
+  if not isinstance(change, dict) or len(change) != 1 or next(iter(change)) not in kinds:
+    raise ValueError(f'{field} must be one of: ' + ', '.join('{"' + kind + '": <number>}' for kind in kinds))
+
+  kind, value = next(iter(change.items()))
+  if isinstance(value, bool) or not isinstance(value, (int, float)):
+    raise ValueError(f'{field}.{kind} must be a number')
+
+  return (kind, float(value))
+
+def format_sale_window(params: dict):
+  sale_start = params.get('sale_start')
+  sale_end = params.get('sale_end')
+
+  try:
+    start = datetime.fromisoformat(sale_start) if sale_start is not None else None
+    end = datetime.fromisoformat(sale_end) if sale_end is not None else None
+  except (TypeError, ValueError):
+    raise ValueError('sale_start and sale_end must be ISO 8601 timestamps')
+
+  try:
+    if start is not None and end is not None and end <= start:
+      raise ValueError('sale_end must be after sale_start')
+  except TypeError:
+    raise ValueError('sale_start and sale_end must both include a timezone or both omit it')
+
+  return (sale_start, sale_end)
+
+def format_pricing_rule(params: dict):
+  rule = {
+    'menu_ids': format_id_list(params, 'menu_ids'),
+    'item_ids': format_id_list(params, 'item_ids'),
+    'price': format_change(params, 'price', PRICE_CHANGES),
+    'sale_price': format_change(params, 'sale_price', SALE_CHANGES),
+    'is_onsale': params.get('is_onsale')
+  }
+
+  if rule['menu_ids'] is None and rule['item_ids'] is None:
+    raise ValueError('A pricing rule needs menu_ids, item_ids or both')
+
+  if rule['is_onsale'] is not None and not isinstance(rule['is_onsale'], bool):
+    raise ValueError('is_onsale must be true or false')
+
+  sale_start, sale_end = format_sale_window(params)
+  for field, value in (('sale_start', sale_start), ('sale_end', sale_end)):
+    if field in params:
+      rule[field] = value
+
+  if rule['price'][0] is None and rule['sale_price'][0] is None and rule['is_onsale'] is None and 'sale_start' not in rule and 'sale_end' not in rule:
+    raise ValueError('A pricing rule needs at least one of price, sale_price, is_onsale, sale_start or sale_end')
+
+  return rule
+
+def format_price_list(prices: list):
+  if not isinstance(prices, list) or len(prices) <= 0 or len(prices) > PRICING_MAX_ITEMS:
+    raise ValueError(f'prices must be a list of 1 to {PRICING_MAX_ITEMS} entries')
+
+  formatted, seen = [], set()
+  for entry in prices:
+    if not isinstance(entry, dict) or not isinstance(entry.get('menu_id'), int) or not isinstance(entry.get('item_id'), int):
+      raise ValueError('Every price needs a menu_id and an item_id')
+
+    key = (entry['menu_id'], entry['item_id'])
+    if key in seen:
+      raise ValueError(f'Item #{key[1]} is listed twice for menu #{key[0]}')
+    seen.add(key)
+
+    for field in ('price', 'sale_price'):
+      value = entry.get(field)
+      if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+        raise ValueError(f'{field} must be a non-negative number')
+
+    if entry.get('is_onsale') is not None and not isinstance(entry['is_onsale'], bool):
+      raise ValueError('is_onsale must be true or false')
+
+    sale_start, sale_end = format_sale_window(entry)
+    price = {'menu_id': entry['menu_id'], 'item_id': entry['item_id'], 'price': entry.get('price'),
+             'sale_price': entry.get('sale_price'), 'is_onsale': entry.get('is_onsale')}
+    for field, value in (('sale_start', sale_start), ('sale_end', sale_end)):
+      if field in entry:
+        price[field] = value
+    formatted.append(price)
+
+  return formatted
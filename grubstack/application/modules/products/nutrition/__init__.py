@@ -0,0 +1 @@
+from . import nutrition
\ No newline at end of file
@@ -0,0 +1,86 @@
+import logging
+
+from flask import Blueprint, Response, request
+
+from grubstack import app, config
+from grubstack.utilities import gs_make_response
+from grubstack.envelope import GStatusCode
+from grubstack.authentication import jwt_required, requires_permission
+
+from .nutrition_service import NutritionService
+
+nutrition = Blueprint('nutrition', __name__)
+logger = logging.getLogger('grubstack')
+
+nutrition_service = NutritionService()
+
+@app.after_request
+def refresh_stale(response: Response) -> Response:
+  nutrition_service.refresh_stale(200 <= response.status_code < 300)
+  return response
+
+@nutrition.route('/items/nutrition', methods=['GET'])
+@jwt_required()
+@requires_permission("ViewItems", "MaintainItems")
+def get_items_nutrition():
+  try:
+    item_ids = [int(item_id) for item_id in request.args.get('item_ids', '').split(',') if item_id.strip() != '']
+
+    if len(item_ids) <= 0 or len(item_ids) > 500:
+      return gs_make_response(message='Provide between 1 and 500 item_ids',
+                              status=GStatusCode.ERROR,
+                              httpstatus=400)
+
+    return gs_make_response(data=nutrition_service.get_items(item_ids))
+
+  except ValueError:
+    return gs_make_response(message='item_ids must be a comma separated list of ids',
+                            status=GStatusCode.ERROR,
+                            httpstatus=400)
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to retrieve nutrition. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+@nutrition.route('/items/<int:item_id>/nutrition', methods=['GET'])
+@jwt_required()
+@requires_permission("ViewItems", "MaintainItems")
+def get_item_nutrition(item_id: int):
+  try:
+    json_data = nutrition_service.get_item(item_id)
+
+    if json_data is None:
+      return gs_make_response(message='Item not found',
+                              status=GStatusCode.ERROR,
+                              httpstatus=404)
+
+    return gs_make_response(data=json_data)
+
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to retrieve item nutrition. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+@nutrition.route('/varieties/<int:variety_id>/nutrition', methods=['GET'])
+@jwt_required()
+@requires_permission("ViewVarieties", "MaintainVarieties")
+def get_variety_nutrition(variety_id: int):
+  try:
+    json_data = nutrition_service.get_variety(variety_id)
+
+    if json_data is None:
+      return gs_make_response(message='Variety not found',
+                              status=GStatusCode.ERROR,
+                              httpstatus=404)
+
+    return gs_make_response(data=json_data)
+
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to retrieve variety nutrition. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+app.register_blueprint(nutrition, url_prefix=config.get('general', 'urlprefix', fallback='/'))
@@ -0,0 +1,55 @@
+NUTRIENTS = [
+  'calories',
+  'fat',
+  'saturated_fat',
+  'trans_fat',
+  'cholesterol',
+  'sodium',
+  'carbs',
+  'protein',
+  'sugar',
+  'fiber'
+]
+
+def nutrient_totals(condition: str = None):
+  # jsonb object summing every nutrient over the grouped ingredient rows,
+  # optionally only over the rows matching condition
+  aggregate = f"SUM(i.{{0}}) FILTER (WHERE {condition})" if condition is not None else "SUM(i.{0})"
+  return 'jsonb_build_object(' + ', '.join(f"'{nutrient}', COALESCE({aggregate.format(nutrient)}, 0)" for nutrient in NUTRIENTS) + ')'
+
+AFFECTED_ITEMS = "SELECT DISTINCT item_id FROM gs_item_ingredient WHERE ingredient_id = ANY(%s)"
+AFFECTED_VARIETIES = "SELECT DISTINCT variety_id FROM gs_variety_ingredient WHERE ingredient_id = ANY(%s)"
+
+# Every requested item in one grouped pass over its ingredient rows; NULL
+# flags count as false, like the API reports them
+REFRESH_ITEMS = f"""
+INSERT INTO gs_item_nutrition (tenant_id, item_id, standard, minimum, maximum, computed_at)
+SELECT %(tenant_id)s::uuid, it.item_id,
+       {nutrient_totals("NOT COALESCE(ii.is_addon, false) AND NOT COALESCE(ii.is_extra, false)")},
+       {nutrient_totals("NOT COALESCE(ii.is_addon, false) AND NOT COALESCE(ii.is_extra, false) AND NOT COALESCE(ii.is_optional, false)")},
+       {nutrient_totals()},
+       now()
+  FROM gs_item it
+  LEFT JOIN gs_item_ingredient ii ON ii.item_id = it.item_id
+  LEFT JOIN gs_ingredient i ON i.ingredient_id = ii.ingredient_id
+ WHERE it.item_id = ANY(%(ids)s)
+ GROUP BY it.item_id
+    ON CONFLICT (tenant_id, item_id) DO UPDATE
+   SET standard = EXCLUDED.standard,
+       minimum = EXCLUDED.minimum,
+       maximum = EXCLUDED.maximum,
+       computed_at = EXCLUDED.computed_at
+RETURNING item_id, standard, minimum, maximum, computed_at"""
+
+REFRESH_VARIETIES = f"""
+INSERT INTO gs_variety_nutrition (tenant_id, variety_id, total, computed_at)
+SELECT %(tenant_id)s::uuid, v.variety_id, {nutrient_totals()}, now()
+  FROM gs_variety v
+  LEFT JOIN gs_variety_ingredient vi ON vi.variety_id = v.variety_id
+  LEFT JOIN gs_ingredient i ON i.ingredient_id = vi.ingredient_id
+ WHERE v.variety_id = ANY(%(ids)s)
+ GROUP BY v.variety_id
+    ON CONFLICT (tenant_id, variety_id) DO UPDATE
+   SET total = EXCLUDED.total,
+       computed_at = EXCLUDED.computed_at
+RETURNING variety_id, total, computed_at"""
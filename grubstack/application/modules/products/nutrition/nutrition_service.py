@@ -0,0 +1,98 @@
+import logging
+
+from flask import g, has_request_context
+
+from grubstack import gsdb
+from grubstack.tenant import get_tenant_id
+
+from .nutrition_utilities import format_item_nutrition, format_variety_nutrition
+from .nutrition_constants import AFFECTED_ITEMS, AFFECTED_VARIETIES, REFRESH_ITEMS, REFRESH_VARIETIES
+
+logger = logging.getLogger('grubstack')
+
+class NutritionService:
+  def __init__(self):
+    pass
+
+  def invalidate(self, kind: str, ids: list):
+    # Same contract as PublishingService.invalidate: resolved before the
+    # caller writes, recomputed once after the request for all its writes.
+    # The writes drop the stale rows themselves (0006 triggers), so a failed
+    # recompute leaves them to be computed on read
+    if len(ids) <= 0:
+      return
+
+    if kind == 'ingredient':
+      item_ids = [row['item_id'] for row in gsdb.fetchall(AFFECTED_ITEMS, (list(ids),)) or []]
+      variety_ids = [row['variety_id'] for row in gsdb.fetchall(AFFECTED_VARIETIES, (list(ids),)) or []]
+    elif kind == 'item':
+      item_ids, variety_ids = list(ids), []
+    else:
+      item_ids, variety_ids = [], list(ids)
+
+    if len(item_ids) <= 0 and len(variety_ids) <= 0:
+      return
+
+    if has_request_context():
+      stale = g.setdefault('stale_nutrition', {}).setdefault(get_tenant_id(), {'item': set(), 'variety': set()})
+      stale['item'].update(item_ids)
+      stale['variety'].update(variety_ids)
+    else:
+      self.refresh(item_ids, variety_ids)
+
+  def refresh_stale(self, succeeded: bool = True):
+    stale = g.pop('stale_nutrition', {})
+    if not succeeded:
+      return
+
+    for tenant_id, ids in stale.items():
+      self.refresh(sorted(ids['item']), sorted(ids['variety']), tenant_id)
+
+  def refresh(self, item_ids: list = None, variety_ids: list = None, tenant_id: str = None):
+    tenant_id = tenant_id or get_tenant_id()
+    item_ids = item_ids or []
+    variety_ids = variety_ids or []
+    try:
+      items, varieties = [], []
+      with gsdb.transaction(tenant_id) as tx:
+        if len(item_ids) > 0:
+          items = tx.fetchall(REFRESH_ITEMS, {'tenant_id': tenant_id, 'ids': list(item_ids)})
+        if len(variety_ids) > 0:
+          varieties = tx.fetchall(REFRESH_VARIETIES, {'tenant_id': tenant_id, 'ids': list(variety_ids)})
+
+      logger.info(f"[nutrition] [tenant:{tenant_id}] recomputed {len(items)} items, {len(varieties)} varieties")
+      return (items, varieties)
+
+    except Exception as e:
+      logger.exception(e)
+      return None
+
+  def get_items(self, item_ids: list):
+    # Items that predate the rollup (or whose refresh failed) are computed on
+    # first read, all missing ones in the same statement; if that fails too
+    # the request fails rather than leaving them out
+    rows = gsdb.fetchall("SELECT item_id, standard, minimum, maximum, computed_at FROM gs_item_nutrition WHERE item_id = ANY(%s)",
+                         (list(item_ids),)) or []
+
+    missing = set(item_ids) - set(row['item_id'] for row in rows)
+    if len(missing) > 0:
+      refreshed = self.refresh(sorted(missing), [])
+      if refreshed is None:
+        raise RuntimeError(f'Unable to compute nutrition for items {sorted(missing)}')
+      rows = rows + refreshed[0]
+
+    return [format_item_nutrition(row) for row in sorted(rows, key=lambda row: row['item_id'])]
+
+  def get_item(self, item_id: int):
+    items = self.get_items([item_id])
+    return items[0] if len(items) > 0 else None
+
+  def get_variety(self, variety_id: int):
+    row = gsdb.fetchone("SELECT variety_id, total, computed_at FROM gs_variety_nutrition WHERE variety_id = %s", (variety_id,))
+    if row is None:
+      refreshed = self.refresh([], [variety_id])
+      if refreshed is None:
+        raise RuntimeError(f'Unable to compute nutrition for variety {variety_id}')
+      row = refreshed[1][0] if len(refreshed[1]) > 0 else None
+
+    return format_variety_nutrition(row) if row is not None else None
@@ -0,0 +1,19 @@
+def format_item_nutrition(nutrition: dict):
+  json_data = {
+    "item_id": nutrition['item_id'],
+    "standard": nutrition['standard'],
+    "minimum": nutrition['minimum'],
+    "maximum": nutrition['maximum'],
+    "computed_at": nutrition['computed_at'].isoformat() if nutrition['computed_at'] is not None else None
+  }
+
+  return json_data
+
+def format_variety_nutrition(nutrition: dict):
+  json_data = {
+    "variety_id": nutrition['variety_id'],
+    "total": nutrition['total'],
+    "computed_at": nutrition['computed_at'].isoformat() if nutrition['computed_at'] is not None else None
+  }
+
+  return json_data
@@ -1,6 +1,9 @@
 from pypika import PostgreSQLQuery, Query, Table, Tables, Order, Parameter
 
 from grubstack import app, gsdb
+from grubstack.tenant import get_tenant_id
+from grubstack.application.modules.publishing.publishing_service import PublishingService
+from grubstack.application.modules.products.nutrition.nutrition_service import NutritionService
 
 from grubstack.application.modules.products.ingredients.ingredients_utilities import format_ingredient
 from grubstack.application.utilities.filters import generate_paginated_data
@@ -8,6 +11,9 @@ from grubstack.application.utilities.filters import generate_paginated_data
 from .varieties_utilities import format_variety
 from .varieties_constants import PER_PAGE, DEFAULT_FILTERS
 
+publishing_service = PublishingService()
+nutrition_service = NutritionService()
+
 class VarietyService:
   def __init__(self):
     pass
@@ -90,23 +96,26 @@ class VarietyService:
       return None
 
   def delete(self, variety_id: int):
-    gs_variety = Table('gs_variety')
-    qry = Query.from_(
-      gs_variety
-    ).delete().where(
-      gs_variety.variety_id == Parameter('%s')
-    )
+    publishing_service.invalidate('variety', [variety_id])
 
-    gsdb.execute(str(qry), (variety_id,))
+    with gsdb.transaction() as tx:
+      gs_variety = Table('gs_variety')
+      qry = Query.from_(
+        gs_variety
+      ).delete().where(
+        gs_variety.variety_id == Parameter('%s')
+      )
 
-    gs_item_variety = Table('gs_item_variety')
-    qry = Query.from_(
-      gs_item_variety
-    ).delete().where(
-      gs_item_variety.variety_id == Parameter('%s')
-    )
+      tx.execute(str(qry), (variety_id,))
 
-    gsdb.execute(str(qry), (variety_id,))
+      gs_item_variety = Table('gs_item_variety')
+      qry = Query.from_(
+        gs_item_variety
+      ).delete().where(
+        gs_item_variety.variety_id == Parameter('%s')
+      )
+
+      tx.execute(str(qry), (variety_id,))
 
   def create(self, params: dict = ()):
     name, description, thumbnail_url = params
@@ -120,7 +129,7 @@ class VarietyService:
       gs_variety.description,
       gs_variety.thumbnail_url
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s'),
       Parameter('%s')
@@ -129,6 +138,8 @@ class VarietyService:
     return gsdb.fetchone(str(qry), (name, description, thumbnail_url,))
 
   def update(self, variety_id: int, params: dict = ()):
+    publishing_service.invalidate('variety', [variety_id])
+
     name, description, thumbnail_url = params
 
     gs_variety = Table('gs_variety')
@@ -211,22 +222,30 @@ class VarietyService:
     return False
 
   def add_ingredient(self, variety_id: int, ingredient_id: int):
+    nutrition_service.invalidate('variety', [variety_id])
+
     gs_variety_ingredient = Table('gs_variety_ingredient')
-    qry = Query.into(
+    qry = PostgreSQLQuery.into(
       gs_variety_ingredient
     ).columns(
       gs_variety_ingredient.tenant_id,
       gs_variety_ingredient.variety_id,
       gs_variety_ingredient.ingredient_id
     ).insert(
-      app.config['TENANT_ID'],
+      get_tenant_id(),
       Parameter('%s'),
       Parameter('%s')
-    )
+    ).on_conflict(
+      gs_variety_ingredient.tenant_id,
+      gs_variety_ingredient.variety_id,
+      gs_variety_ingredient.ingredient_id
+    ).do_nothing()
 
     gsdb.execute(str(qry), (variety_id, ingredient_id,))
 
   def delete_ingredient(self, variety_id: int, ingredient_id: int):
+    nutrition_service.invalidate('variety', [variety_id])
+
     gs_variety_ingredient = Table('gs_variety_ingredient')
     qry = Query.from_(
       gs_variety_ingredient
@@ -0,0 +1 @@
+from . import publishing
\ No newline at end of file
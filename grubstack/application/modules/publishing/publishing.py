@@ -0,0 +1,70 @@
+import logging
+
+from flask import Blueprint, Response
+
+from grubstack import app, config, gsdb
+from grubstack.utilities import gs_make_response
+from grubstack.envelope import GStatusCode
+from grubstack.authentication import jwt_required, requires_permission
+
+from .publishing_service import PublishingService
+from .publishing_utilities import format_snapshot
+
+publishing = Blueprint('publishing', __name__)
+logger = logging.getLogger('grubstack')
+
+publishing_service = PublishingService()
+
+@app.after_request
+def publish_stale(response: Response) -> Response:
+  publishing_service.publish_stale(200 <= response.status_code < 300)
+  return response
+
+@publishing.route('/locations/<int:location_id>/published-menu', methods=['GET'])
+@jwt_required()
+@requires_permission("ViewLocations", "MaintainLocations")
+def get_published_menu(location_id: int):
+  try:
+    if not publishing_service.is_enabled():
+      return gs_make_response(message='Menu publishing is disabled',
+                              status=GStatusCode.ERROR,
+                              httpstatus=404)
+
+    snapshot = gsdb.fetchone("SELECT location_id, menus, version, published_at FROM gs_location_menu_snapshot WHERE location_id = %s", (location_id,))
+
+    if snapshot is None:
+      return gs_make_response(message='Location menu has not been published',
+                              status=GStatusCode.ERROR,
+                              httpstatus=404)
+
+    return gs_make_response(data=format_snapshot(snapshot))
+
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to retrieve published menu. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+@publishing.route('/publishing/menus', methods=['POST'])
+@jwt_required()
+@requires_permission("MaintainLocations")
+def publish_all():
+  try:
+    rows = gsdb.fetchall("SELECT location_id FROM gs_location")
+    published = publishing_service.publish([row['location_id'] for row in rows or []], force=True)
+
+    if published is None:
+      return gs_make_response(message='Unable to publish menus. Please try again',
+                              status=GStatusCode.ERROR,
+                              httpstatus=500)
+
+    return gs_make_response(message='Menus published',
+                            data=[{'location_id': location_id, 'version': version} for location_id, version in published])
+
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to publish menus. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
+app.register_blueprint(publishing, url_prefix=config.get('general', 'urlprefix', fallback='/'))
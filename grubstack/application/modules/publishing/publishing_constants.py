@@ -0,0 +1,110 @@
+# Locations whose published menus contain the given objects
+AFFECTED_LOCATIONS = {
+  'menu': """SELECT DISTINCT lm.location_id
+               FROM gs_location_menu lm
+              WHERE lm.menu_id = ANY(%s)""",
+  'item': """SELECT DISTINCT lm.location_id
+               FROM gs_menu_item mi
+              INNER JOIN gs_location_menu lm ON lm.menu_id = mi.menu_id
+              WHERE mi.item_id = ANY(%s)""",
+  'ingredient': """SELECT DISTINCT lm.location_id
+                     FROM gs_item_ingredient ii
+                    INNER JOIN gs_menu_item mi ON mi.item_id = ii.item_id
+                    INNER JOIN gs_location_menu lm ON lm.menu_id = mi.menu_id
+                    WHERE ii.ingredient_id = ANY(%s)""",
+  'variety': """SELECT DISTINCT lm.location_id
+                  FROM gs_item_variety iv
+                 INNER JOIN gs_menu_item mi ON mi.item_id = iv.item_id
+                 INNER JOIN gs_location_menu lm ON lm.menu_id = mi.menu_id
+                 WHERE iv.variety_id = ANY(%s)""",
+}
+
+# Builds the same document LocationService.get_menus_paginated returned when
+# it assembled it row by row, for every requested location in one statement,
+# and only bumps the version of snapshots whose content actually changed.
+# Unchanged snapshots are still touched to clear a pending mark
+PUBLISH_SNAPSHOTS = """
+WITH location_menus AS (
+  SELECT lm.location_id, lm.menu_id
+    FROM gs_location_menu lm
+   INNER JOIN gs_location l ON l.location_id = lm.location_id
+   WHERE lm.location_id = ANY(%(location_ids)s)
+), menu_items AS (
+  SELECT DISTINCT mi.item_id
+    FROM gs_menu_item mi
+   WHERE mi.menu_id IN (SELECT menu_id FROM location_menus)
+), ingredients AS (
+  SELECT ii.item_id,
+         jsonb_agg(jsonb_build_object('id', i.ingredient_id, 'name', i.name, 'description', i.description,
+                                      'thumbnail_url', i.thumbnail_url, 'calories', i.calories, 'fat', i.fat,
+                                      'saturated_fat', i.saturated_fat, 'trans_fat', i.trans_fat,
+                                      'cholesterol', i.cholesterol, 'sodium', i.sodium, 'carbs', i.carbs,
+                                      'protein', i.protein, 'sugar', i.sugar, 'fiber', i.fiber, 'price', i.price,
+                                      'is_optional', ii.is_optional, 'is_addon', ii.is_addon, 'is_extra', ii.is_extra)
+                   ORDER BY i.name) AS ingredients
+    FROM gs_item_ingredient ii
+   INNER JOIN gs_ingredient i ON i.ingredient_id = ii.ingredient_id
+   WHERE ii.item_id IN (SELECT item_id FROM menu_items)
+   GROUP BY ii.item_id
+), varieties AS (
+  SELECT iv.item_id,
+         jsonb_agg(jsonb_build_object('id', v.variety_id, 'name', v.name, 'description', v.description,
+                                      'thumbnail_url', v.thumbnail_url)
+                   ORDER BY v.name) AS varieties
+    FROM gs_item_variety iv
+   INNER JOIN gs_variety v ON v.variety_id = iv.variety_id
+   WHERE iv.item_id IN (SELECT item_id FROM menu_items)
+   GROUP BY iv.item_id
+), items AS (
+  SELECT mi.menu_id,
+         jsonb_agg(jsonb_build_object('id', it.item_id, 'name', it.name, 'description', it.description,
+                                      'thumbnail_url', it.thumbnail_url, 'slug', it.slug, 'price', mi.price,
+                                      'is_onsale', mi.is_onsale, 'sale_price', mi.sale_price,
+                                      'sale_start', mi.sale_start, 'sale_end', mi.sale_end,
+                                      'ingredients', COALESCE(ingredients.ingredients, '[]'::jsonb),
+                                      'varieties', COALESCE(varieties.varieties, '[]'::jsonb))
+                   ORDER BY it.name) AS items
+    FROM gs_menu_item mi
+   INNER JOIN gs_item it ON it.item_id = mi.item_id
+    LEFT JOIN ingredients ON ingredients.item_id = mi.item_id
+    LEFT JOIN varieties ON varieties.item_id = mi.item_id
+   WHERE mi.menu_id IN (SELECT menu_id FROM location_menus)
+   GROUP BY mi.menu_id
+), documents AS (
+  SELECT l.location_id,
+         COALESCE(jsonb_agg(jsonb_build_object('id', m.menu_id, 'name', m.name, 'description', m.description,
+                                               'thumbnail_url', m.thumbnail_url, 'slug', m.slug,
+                                               'items', COALESCE(items.items, '[]'::jsonb))
+                            ORDER BY m.name) FILTER (WHERE m.menu_id IS NOT NULL), '[]'::jsonb) AS menus
+    FROM gs_location l
+    LEFT JOIN location_menus lm ON lm.location_id = l.location_id
+    LEFT JOIN gs_menu m ON m.menu_id = lm.menu_id
+    LEFT JOIN items ON items.menu_id = m.menu_id
+   WHERE l.location_id = ANY(%(location_ids)s)
+   GROUP BY l.location_id
+)
+INSERT INTO gs_location_menu_snapshot (tenant_id, location_id, menus, version, published_at)
+SELECT %(tenant_id)s::uuid, location_id, menus, 1, now()
+  FROM documents
+    ON CONFLICT (tenant_id, location_id) DO UPDATE
+   SET menus = EXCLUDED.menus,
+       version = gs_location_menu_snapshot.version
+                 + CASE WHEN gs_location_menu_snapshot.menus IS DISTINCT FROM EXCLUDED.menus THEN 1 ELSE 0 END,
+       published_at = EXCLUDED.published_at,
+       pending_at = CASE WHEN gs_location_menu_snapshot.pending_at < statement_timestamp() THEN NULL
+                         ELSE gs_location_menu_snapshot.pending_at END
+ WHERE gs_location_menu_snapshot.menus IS DISTINCT FROM EXCLUDED.menus
+    OR gs_location_menu_snapshot.pending_at IS NOT NULL
+RETURNING location_id, version, menus, published_at"""
+
+# Set by a writing request once its writes have committed. A publish clears
+# it only if its statement started after the mark, so it saw those writes
+MARK_PENDING = """UPDATE gs_location_menu_snapshot
+                     SET pending_at = clock_timestamp()
+                   WHERE location_id = ANY(%s)"""
+
+# Snapshots of locations that no longer exist
+DELETE_ORPHANED_SNAPSHOTS = """DELETE FROM gs_location_menu_snapshot s
+                                WHERE s.location_id = ANY(%s)
+                                  AND NOT EXISTS (SELECT 1 FROM gs_location l WHERE l.location_id = s.location_id)
+                            RETURNING s.location_id"""
@@ -0,0 +1,200 @@
+import fcntl, json, logging, os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from flask import g, has_request_context
+
+from grubstack import app, config, gsdb
+from grubstack.database import GrubDatabase
+from grubstack.tenant import get_tenant_id
+from grubstack.application.modules.products.items.items_utilities import is_sale_active
+
+from .publishing_constants import AFFECTED_LOCATIONS, PUBLISH_SNAPSHOTS, DELETE_ORPHANED_SNAPSHOTS, MARK_PENDING
+from .publishing_utilities import format_snapshot, write_atomic, write_compressed, remove_files
+
+logger = logging.getLogger('grubstack')
+
+class PublishingService:
+  def __init__(self):
+    pass
+
+  def is_enabled(self):
+    return config.getboolean('publishing', 'menu_snapshots', fallback=True)
+
+  def invalidate(self, kind: str, ids: list):
+    # Resolved before the caller writes, so deleting a menu or item still
+    # finds the locations that showed it
+    if not self.is_enabled() or len(ids) <= 0:
+      return
+
+    if kind == 'location':
+      location_ids = list(ids)
+    else:
+      rows = gsdb.fetchall(AFFECTED_LOCATIONS[kind], (list(ids),))
+      location_ids = [row['location_id'] for row in rows or []]
+
+    if len(location_ids) <= 0:
+      return
+
+    # Within a request every write is collected and the affected locations
+    # are republished once, after the view has finished
+    if has_request_context():
+      stale = g.setdefault('stale_locations', {})
+      stale.setdefault(get_tenant_id(), set()).update(location_ids)
+    else:
+      self.publish(location_ids)
+
+  def invalidate_all(self):
+    if not self.is_enabled():
+      return
+
+    rows = gsdb.fetchall("SELECT location_id FROM gs_location")
+    self.invalidate('location', [row['location_id'] for row in rows or []])
+
+  def publish_stale(self, succeeded: bool = True):
+    # A failed request may have rolled its writes back, there is nothing new
+    # to publish then
+    stale = g.pop('stale_locations', {})
+    if not succeeded:
+      return
+
+    # Until the background publish lands, reads of these locations use the
+    # live query, so the writer never reads back its old menu
+    for tenant_id, location_ids in stale.items():
+      try:
+        with gsdb.transaction(tenant_id) as tx:
+          tx.execute(MARK_PENDING, (sorted(location_ids),))
+      except Exception as e:
+        logger.exception(e)
+
+      publisher.submit(self, sorted(location_ids), tenant_id)
+
+  def publish(self, location_ids: list, tenant_id: str = None, force: bool = False, db: GrubDatabase = None):
+    tenant_id = tenant_id or get_tenant_id()
+    db = db or gsdb
+    try:
+      with db.transaction(tenant_id) as tx:
+        removed = tx.fetchall(DELETE_ORPHANED_SNAPSHOTS, (location_ids,))
+        published = tx.fetchall(PUBLISH_SNAPSHOTS, {'tenant_id': tenant_id, 'location_ids': location_ids})
+
+      for row in published:
+        logger.info(f"[publish] [tenant:{tenant_id}] [location:{row['location_id']}] menu snapshot version {row['version']}")
+
+      if self.static_root() is not None:
+        # Unchanged snapshots are not returned by the upsert; a forced publish
+        # rewrites their files too, e.g. after static publishing is turned on
+        if force:
+          published = db.fetchall("SELECT location_id, version, menus, published_at FROM gs_location_menu_snapshot WHERE location_id = ANY(%s)",
+                                  (location_ids,)) or []
+        try:
+          self.write_static(tenant_id, published, [row['location_id'] for row in removed])
+        except Exception as e:
+          # The snapshot is committed either way; the files catch up on the
+          # next publish of these locations
+          logger.exception(e)
+
+      return [(row['location_id'], row['version']) for row in published]
+
+    except Exception as e:
+      logger.exception(e)
+      return None
+
+  def static_root(self):
+    root = config.get('publishing', 'static_root', fallback='').strip()
+    return root if root != '' else None
+
+  def static_path(self, tenant_id: str, *parts):
+    return os.path.join(self.static_root(), tenant_id, *parts)
+
+  def write_static(self, tenant_id: str, snapshots: list, removed_ids: list = []):
+    # Files are served by nginx straight from static_root, see
+    # nginx-backend.conf; Python is never involved in reading them
+    if len(snapshots) <= 0 and len(removed_ids) <= 0:
+      return
+
+    gzip_level = config.getint('publishing', 'static_gzip_level', fallback=9)
+    use_brotli = config.getboolean('publishing', 'static_brotli', fallback=True)
+
+    # Every uWSGI worker publishes, so writing the files and the manifest is
+    # serialised with a lock file, and a snapshot older than the one the
+    # manifest already lists is not written over it
+    os.makedirs(self.static_path(tenant_id), exist_ok=True)
+    with open(self.static_path(tenant_id, '.manifest.lock'), 'w') as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+
+      path = self.static_path(tenant_id, 'manifest.json')
+      manifest = {'locations': {}}
+      if os.path.exists(path):
+        with open(path, 'r') as f:
+          manifest = json.load(f)
+
+      for snapshot in snapshots:
+        listed = manifest['locations'].get(str(snapshot['location_id']))
+        if listed is not None and listed['version'] > snapshot['version']:
+          continue
+
+        write_compressed(self.static_path(tenant_id, 'locations', str(snapshot['location_id']), 'menu.json'),
+                         format_snapshot(snapshot), gzip_level, use_brotli)
+        manifest['locations'][str(snapshot['location_id'])] = {
+          'version': snapshot['version'],
+          'published_at': format_snapshot(snapshot)['published_at'],
+          'path': f"locations/{snapshot['location_id']}/menu.json"
+        }
+
+      for location_id in removed_ids:
+        remove_files(self.static_path(tenant_id, 'locations', str(location_id), 'menu.json'))
+        manifest['locations'].pop(str(location_id), None)
+
+      write_atomic(path, json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+
+  def get_menus(self, location_id: int):
+    # Published on first read for locations that predate snapshots
+    if not self.is_enabled():
+      return None
+
+    row = gsdb.fetchone("SELECT menus, pending_at FROM gs_location_menu_snapshot WHERE location_id = %s", (location_id,))
+    if row is None:
+      if self.publish([location_id]) is None:
+        return None
+      row = gsdb.fetchone("SELECT menus, pending_at FROM gs_location_menu_snapshot WHERE location_id = %s", (location_id,))
+
+    # A republish is still on its way; the caller reads the live tables
+    if row is None or row['pending_at'] is not None:
+      return None
+
+    # The document keeps the stored flag, whether the sale is on depends on
+    # when it is read
+    for menu in row['menus']:
+      for item in menu.get('items', []):
+        item['is_onsale'] = is_sale_active(item)
+
+    return row['menus']
+
+class BackgroundPublisher(object):
+  """
+  Runs the republishing collected during a request after its response has
+  gone out. One thread per worker process keeps publishes in order, and it
+  has a connection of its own so its transactions never interleave with a
+  request's on gsdb.
+  """
+  def __init__(self):
+    self.executor = None
+    self.db       = None
+    self.pid      = None
+    self.lock     = Lock()
+
+  def submit(self, service: PublishingService, location_ids: list, tenant_id: str):
+    # Created lazily so each uWSGI worker gets its own thread after fork
+    with self.lock:
+      if self.pid != os.getpid():
+        self.pid      = os.getpid()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='GrubStackPublisher')
+        self.db       = GrubDatabase(config)
+
+    self.executor.submit(self.run, service, location_ids, tenant_id)
+
+  def run(self, service: PublishingService, location_ids: list, tenant_id: str):
+    with app.app_context():
+      service.publish(location_ids, tenant_id, db=self.db)
+
+publisher = BackgroundPublisher()
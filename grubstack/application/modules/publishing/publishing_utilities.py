@@ -0,0 +1,47 @@
+import gzip, json, os, tempfile
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+def format_snapshot(snapshot: dict):
+  json_data = {
+    "location_id": snapshot['location_id'],
+    "version": snapshot['version'],
+    "published_at": snapshot['published_at'].isoformat() if snapshot['published_at'] is not None else None,
+    "menus": snapshot['menus']
+  }
+
+  return json_data
+
+def write_atomic(path: str, data: bytes):
+  # Readers (nginx) only ever see the old file or the complete new one
+  directory = os.path.dirname(path)
+  os.makedirs(directory, exist_ok=True)
+
+  fd, tmp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+  except Exception:
+    if os.path.exists(tmp):
+      os.remove(tmp)
+    raise
+
+def write_compressed(path: str, document: dict, gzip_level: int = 9, use_brotli: bool = True):
+  # Siblings first so gzip_static/brotli_static never pair a new plain file
+  # with a missing compressed one
+  data = json.dumps(document, separators=(',', ':'), default=str).encode('utf-8')
+
+  write_atomic(path + '.gz', gzip.compress(data, compresslevel=gzip_level, mtime=0))
+  if use_brotli and brotli is not None:
+    write_atomic(path + '.br', brotli.compress(data))
+  write_atomic(path, data)
+
+def remove_files(path: str):
+  for name in (path, path + '.gz', path + '.br'):
+    if os.path.exists(name):
+      os.remove(name)
@@ -4,14 +4,17 @@ from flask import Blueprint, url_for, request
 
 from grubstack import app, config
 from grubstack.utilities import gs_make_response
-from grubstack.authentication import jwt_required, requires_permission
+from grubstack.envelope import GStatusCode
+from grubstack.authentication import jwt_required, requires_permission, requires_all_permissions
 
 from .square_service import SquareService
+from .square_sync_service import SquareSyncService
 
 square = Blueprint('square', __name__)
 logger = logging.getLogger('grubstack')
 
 square_service = SquareService()
+square_sync_service = SquareSyncService(square_service, config.getint('square', 'sync_batch_size', fallback=100))
 
 @square.route('/square/locations', methods=['GET'])
 @jwt_required()
@@ -27,4 +30,19 @@ def get_all():
                             status=GStatusCode.ERROR,
                             httpstatus=500)
 
+@square.route('/square/sync', methods=['POST'])
+@jwt_required()
+@requires_all_permissions("MaintainMenus", "MaintainItems")
+def sync():
+  try:
+    full = request.args.get('full', 'false').lower() == 'true'
+    json_data = square_sync_service.sync(full)
+    return gs_make_response(message='Square catalog synced', data=json_data)
+
+  except Exception as e:
+    logger.exception(e)
+    return gs_make_response(message='Unable to sync square catalog. Please try again',
+                            status=GStatusCode.ERROR,
+                            httpstatus=500)
+
 app.register_blueprint(square, url_prefix=config.get('general', 'urlprefix', fallback='/'))
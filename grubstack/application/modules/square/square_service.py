@@ -1,28 +1,26 @@
-import requests
-
-from square.client import Client
-from square.http.auth.o_auth_2 import BearerAuthCredentials
+import logging, threading, time
 
 from pypika import Query, Table, Tables, Order, functions, Parameter
 
-from grubstack import app, gsprod
+from grubstack import app, config, gsprod
+from grubstack.tenant import get_tenant_id
+from grubstack.cache import cache_get, cache_set
 
 from .square_utilities import decrypt
 
+logger = logging.getLogger('grubstack')
+
 class SquareService:
-  def __init__(self, client = None):
-    with app.app_context():
-      access_token = self.get_access_token()
-      if access_token:
-        client = Client(
-          bearer_auth_credentials=BearerAuthCredentials(
-            access_token=access_token
-          ),
-          environment=app.config['SQUARE_ENVIRONMENT'])
-        self.client = client
-    
+  def __init__(self):
+    # Clients are created on first use and kept per tenant for the life of the
+    # process, so neither import nor each request pays for the token lookup
+    self.clients = {}
+    self.lock = threading.Lock()
+    self.token_ttl = config.getint('square', 'token_ttl', fallback=900)
+    self.locations_ttl = config.getint('square', 'locations_ttl', fallback=300)
+
   def get_access_token(self):
-    tenant_id = app.config['TENANT_ID']
+    tenant_id = get_tenant_id()
   
     gs_tenant_square = Table('gs_tenant_square')
 
@@ -40,11 +38,62 @@ class SquareService:
       return decrypt(access_token[0])
 
     return None
-  
+
+  def get_client(self, refresh: bool = False):
+    tenant_id = get_tenant_id()
+    client, expires = self.clients.get(tenant_id, (None, 0))
+    if client is not None and not refresh and time.monotonic() < expires:
+      return client
+
+    with self.lock:
+      client, expires = self.clients.get(tenant_id, (None, 0))
+      if client is None or refresh or time.monotonic() >= expires:
+        access_token = self.get_access_token()
+        client = None
+        if access_token:
+          # The SDK is a large import; only tenants using Square pay for it
+          from square.client import Client
+          from square.http.auth.o_auth_2 import BearerAuthCredentials
+
+          client = Client(
+            bearer_auth_credentials=BearerAuthCredentials(
+              access_token=access_token
+            ),
+            environment=app.config['SQUARE_ENVIRONMENT'])
+        self.clients[tenant_id] = (client, time.monotonic() + self.token_ttl)
+
+    return client
+
+  def call(self, request):
+    # Retries once with a freshly decrypted token when Square rejects the
+    # cached one, e.g. after the tenant re-authorized the integration
+    client = self.get_client()
+    if client is None:
+      return None
+
+    result = request(client)
+    if result.is_error() and result.status_code == 401:
+      logger.info(f"[square] [tenant:{get_tenant_id()}] access token rejected, refreshing")
+      client = self.get_client(refresh=True)
+      if client is None:
+        return None
+      result = request(client)
+
+    return result
+
   def get_locations(self):
-    if self.client is not None:
-      result = self.client.locations.list_locations()
-      if result.is_success():
-        return result.body['locations']
+    key = 'square_locations'
+    locations = cache_get(key)
+    if locations is not None:
+      return locations
+
+    result = self.call(lambda client: client.locations.list_locations())
+    if result is not None and result.is_success():
+      locations = result.body.get('locations', [])
+      cache_set(key, locations, self.locations_ttl)
+      return locations
+
+    return []
 
-    return []
\ No newline at end of file
+  def search_catalog(self, body: dict):
+    return self.call(lambda client: client.catalog.search_catalog_objects(body=body))
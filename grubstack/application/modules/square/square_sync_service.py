@@ -0,0 +1,303 @@
+import logging, re
+
+from grubstack import app, gsdb
+from grubstack.tenant import get_tenant_id
+from grubstack.application.modules.publishing.publishing_service import PublishingService
+
+logger = logging.getLogger('grubstack')
+
+publishing_service = PublishingService()
+
+class SquareSyncService:
+  """
+  Mirrors the tenant's Square catalog into GrubStack. Categories become menus,
+  items become items (priced on their category's menu) and item variations
+  become varieties. gs_square_object maps Square ids to local ids and versions
+  so unchanged objects are skipped, and gs_square_sync keeps the catalog time
+  of the last completed run so later runs only request what changed since.
+  """
+  def __init__(self, square_service, batch_size: int = 100):
+    self.square = square_service
+    self.batch_size = batch_size
+
+  def sync(self, full: bool = False):
+    tenant_id = get_tenant_id()
+    begin_time = None if full else self.get_begin_time()
+
+    objects, latest_time = self.fetch_changes(begin_time)
+    stats = {
+      'menus': { 'created': 0, 'updated': 0, 'deleted': 0 },
+      'items': { 'created': 0, 'updated': 0, 'deleted': 0 },
+      'varieties': { 'created': 0, 'updated': 0, 'deleted': 0 },
+    }
+
+    # Categories first so items in the same run can be placed on their menus
+    categories = [obj for obj in objects if obj['type'] == 'CATEGORY']
+    items = [obj for obj in objects if obj['type'] == 'ITEM']
+
+    for start in range(0, len(categories), self.batch_size):
+      self.apply_categories(categories[start:start + self.batch_size], stats)
+
+    for start in range(0, len(items), self.batch_size):
+      self.apply_items(items[start:start + self.batch_size], stats)
+
+    if len(objects) > 0:
+      publishing_service.invalidate_all()
+
+    # Only advance the cursor once every batch is committed; a failed run is
+    # simply repeated and already applied versions are skipped
+    if latest_time is not None:
+      gsdb.execute("""INSERT INTO gs_square_sync (tenant_id, begin_time, synced_at) VALUES (%s, %s, now())
+                      ON CONFLICT (tenant_id) DO UPDATE SET begin_time = EXCLUDED.begin_time, synced_at = EXCLUDED.synced_at""",
+                   (tenant_id, latest_time,))
+
+    logger.info(f'[square-sync] [tenant:{tenant_id}] [objects:{len(objects)}] [since:{begin_time}] ' +
+                ' '.join(f'[{kind}:{counts}]' for kind, counts in stats.items()))
+    return stats
+
+  def get_begin_time(self):
+    row = gsdb.fetchone("SELECT begin_time FROM gs_square_sync WHERE tenant_id = %s", (get_tenant_id(),))
+    if row is not None:
+      return row['begin_time']
+
+    return None
+
+  def fetch_changes(self, begin_time: str = None):
+    objects = []
+    cursor = None
+    latest_time = None
+
+    while True:
+      body = {
+        'object_types': ['CATEGORY', 'ITEM'],
+        'include_deleted_objects': begin_time is not None,
+        'limit': 1000,
+      }
+      if begin_time is not None:
+        body['begin_time'] = begin_time
+      if cursor is not None:
+        body['cursor'] = cursor
+
+      result = self.square.search_catalog(body)
+      if result is None:
+        raise RuntimeError('Square is not connected for this tenant')
+      if not result.is_success():
+        raise RuntimeError(f'Square catalog search failed: {result.errors}')
+
+      # latest_time of the first page marks the catalog state this run covers
+      if latest_time is None:
+        latest_time = result.body.get('latest_time')
+
+      objects.extend(result.body.get('objects', []))
+      cursor = result.body.get('cursor')
+      if not cursor:
+        return objects, latest_time
+
+  def get_mapped(self, tx, object_ids: list, parent_ids: list = []):
+    rows = tx.fetchall("""SELECT square_object_id, object_type, parent_object_id, local_id, version
+                            FROM gs_square_object
+                           WHERE square_object_id = ANY(%s) OR parent_object_id = ANY(%s)""",
+                       (list(object_ids), list(parent_ids),))
+    return { row['square_object_id']: row for row in rows or [] }
+
+  def allocate_ids(self, tx, table: str, column: str, count: int):
+    # Ids are drawn up front so every insert below can be written in one
+    # multi-row statement and still be mapped back to its Square object
+    if count <= 0:
+      return []
+
+    rows = tx.fetchall("SELECT nextval(pg_get_serial_sequence(%s, %s)) AS id FROM generate_series(1, %s)",
+                       (table, column, count,))
+    return [row['id'] for row in rows]
+
+  def save_mapping(self, tx, rows: list):
+    tx.execute_values("""INSERT INTO gs_square_object (tenant_id, square_object_id, object_type, parent_object_id, local_id, version)
+                         VALUES %s
+                         ON CONFLICT (tenant_id, square_object_id) DO UPDATE
+                         SET parent_object_id = EXCLUDED.parent_object_id, local_id = EXCLUDED.local_id, version = EXCLUDED.version""",
+                      rows, "(%s::uuid, %s, %s, %s, %s, %s)")
+
+  def delete_mapping(self, tx, object_ids: list):
+    if len(object_ids) > 0:
+      tx.execute("DELETE FROM gs_square_object WHERE square_object_id = ANY(%s)", (object_ids,))
+
+  def apply_categories(self, objects: list, stats: dict):
+    tenant_id = get_tenant_id()
+
+    with gsdb.transaction() as tx:
+      mapped = self.get_mapped(tx, [obj['id'] for obj in objects])
+      created, updated, deleted = split_changes(objects, mapped)
+
+      menu_ids = self.allocate_ids(tx, 'gs_menu', 'menu_id', len(created))
+      tx.execute_values("INSERT INTO gs_menu (tenant_id, menu_id, name, description, thumbnail_url, slug) VALUES %s",
+                        [(tenant_id, menu_id, category_name(obj), '', None, slugify(category_name(obj), obj['id']))
+                         for menu_id, obj in zip(menu_ids, created)],
+                        "(%s::uuid, %s, %s, %s, %s, %s)")
+
+      tx.execute_values("""UPDATE gs_menu m SET name = v.name
+                             FROM (VALUES %s) AS v (menu_id, name)
+                            WHERE m.menu_id = v.menu_id""",
+                        [(mapped[obj['id']]['local_id'], category_name(obj)) for obj in updated],
+                        "(%s::integer, %s)")
+
+      removed = [mapped[obj['id']]['local_id'] for obj in deleted]
+      if len(removed) > 0:
+        tx.execute("DELETE FROM gs_menu_item WHERE menu_id = ANY(%s)", (removed,))
+        tx.execute("DELETE FROM gs_location_menu WHERE menu_id = ANY(%s)", (removed,))
+        tx.execute("DELETE FROM gs_menu WHERE menu_id = ANY(%s)", (removed,))
+      self.delete_mapping(tx, [obj['id'] for obj in deleted])
+
+      self.save_mapping(tx, [(tenant_id, obj['id'], 'CATEGORY', None, menu_id, obj['version'])
+                             for menu_id, obj in zip(menu_ids, created)] +
+                            [(tenant_id, obj['id'], 'CATEGORY', None, mapped[obj['id']]['local_id'], obj['version'])
+                             for obj in updated])
+
+    stats['menus']['created'] += len(created)
+    stats['menus']['updated'] += len(updated)
+    stats['menus']['deleted'] += len(deleted)
+
+  def apply_items(self, objects: list, stats: dict):
+    tenant_id = get_tenant_id()
+    item_ids = [obj['id'] for obj in objects]
+    category_ids = [item_category(obj) for obj in objects if item_category(obj) is not None]
+    variation_ids = [variation['id'] for obj in objects for variation in item_variations(obj)]
+
+    with gsdb.transaction() as tx:
+      mapped = self.get_mapped(tx, item_ids + category_ids + variation_ids, item_ids)
+      created, updated, deleted = split_changes(objects, mapped)
+
+      # Items
+      new_item_ids = self.allocate_ids(tx, 'gs_item', 'item_id', len(created))
+      tx.execute_values("INSERT INTO gs_item (tenant_id, item_id, name, description, thumbnail_url, slug) VALUES %s",
+                        [(tenant_id, item_id, item_name(obj), item_description(obj), None, slugify(item_name(obj), obj['id']))
+                         for item_id, obj in zip(new_item_ids, created)],
+                        "(%s::uuid, %s, %s, %s, %s, %s)")
+
+      tx.execute_values("""UPDATE gs_item i SET name = v.name, description = v.description
+                             FROM (VALUES %s) AS v (item_id, name, description)
+                            WHERE i.item_id = v.item_id""",
+                        [(mapped[obj['id']]['local_id'], item_name(obj), item_description(obj)) for obj in updated],
+                        "(%s::integer, %s, %s)")
+
+      local_ids = { obj['id']: item_id for item_id, obj in zip(new_item_ids, created) }
+      local_ids.update({ obj['id']: mapped[obj['id']]['local_id'] for obj in updated })
+
+      # Varieties, including those that disappeared from a changed item
+      changed = created + updated
+      current = set(variation['id'] for obj in changed for variation in item_variations(obj))
+      new_variations = [(obj, variation) for obj in changed for variation in item_variations(obj) if variation['id'] not in mapped]
+      updated_variations = [variation for obj in updated for variation in item_variations(obj)
+                            if variation['id'] in mapped and variation.get('version', 0) > mapped[variation['id']]['version']]
+      removed_variations = [row for row in mapped.values()
+                            if row['object_type'] == 'ITEM_VARIATION' and
+                               ((row['parent_object_id'] in local_ids and row['square_object_id'] not in current) or
+                                row['parent_object_id'] in [obj['id'] for obj in deleted])]
+
+      variety_ids = self.allocate_ids(tx, 'gs_variety', 'variety_id', len(new_variations))
+      tx.execute_values("INSERT INTO gs_variety (tenant_id, variety_id, name, description, thumbnail_url) VALUES %s",
+                        [(tenant_id, variety_id, variation_name(variation), '', None)
+                         for variety_id, (obj, variation) in zip(variety_ids, new_variations)],
+                        "(%s::uuid, %s, %s, %s, %s)")
+      tx.execute_values("INSERT INTO gs_item_variety (tenant_id, item_id, variety_id) VALUES %s",
+                        [(tenant_id, local_ids[obj['id']], variety_id)
+                         for variety_id, (obj, variation) in zip(variety_ids, new_variations)],
+                        "(%s::uuid, %s, %s)")
+
+      tx.execute_values("""UPDATE gs_variety v SET name = u.name
+                             FROM (VALUES %s) AS u (variety_id, name)
+                            WHERE v.variety_id = u.variety_id""",
+                        [(mapped[variation['id']]['local_id'], variation_name(variation)) for variation in updated_variations],
+                        "(%s::integer, %s)")
+
+      removed = [row['local_id'] for row in removed_variations]
+      if len(removed) > 0:
+        tx.execute("DELETE FROM gs_item_variety WHERE variety_id = ANY(%s)", (removed,))
+        tx.execute("DELETE FROM gs_variety_ingredient WHERE variety_id = ANY(%s)", (removed,))
+        tx.execute("DELETE FROM gs_variety WHERE variety_id = ANY(%s)", (removed,))
+      self.delete_mapping(tx, [row['square_object_id'] for row in removed_variations])
+
+      # Menu placement: only memberships on Square-managed menus are replaced,
+      # items added to hand-made menus are left alone
+      if len(local_ids) > 0:
+        tx.execute("""DELETE FROM gs_menu_item
+                       WHERE item_id = ANY(%s)
+                         AND menu_id IN (SELECT local_id FROM gs_square_object WHERE object_type = 'CATEGORY')""",
+                   (list(local_ids.values()),))
+      tx.execute_values("INSERT INTO gs_menu_item (tenant_id, menu_id, item_id, price, sale_price, is_onsale) VALUES %s",
+                        [(tenant_id, mapped[item_category(obj)]['local_id'], local_ids[obj['id']], item_price(obj), 0.0, False)
+                         for obj in changed if item_category(obj) in mapped],
+                        "(%s::uuid, %s, %s, %s, %s, %s)")
+
+      # Deleted items
+      removed = [mapped[obj['id']]['local_id'] for obj in deleted]
+      if len(removed) > 0:
+        tx.execute("DELETE FROM gs_menu_item WHERE item_id = ANY(%s)", (removed,))
+        tx.execute("DELETE FROM gs_item_variety WHERE item_id = ANY(%s)", (removed,))
+        tx.execute("DELETE FROM gs_item_ingredient WHERE item_id = ANY(%s)", (removed,))
+        tx.execute("DELETE FROM gs_item WHERE item_id = ANY(%s)", (removed,))
+      self.delete_mapping(tx, [obj['id'] for obj in deleted])
+
+      self.save_mapping(tx, [(tenant_id, obj['id'], 'ITEM', None, local_ids[obj['id']], obj['version']) for obj in changed] +
+                            [(tenant_id, variation['id'], 'ITEM_VARIATION', obj['id'], variety_id, variation.get('version', 0))
+                             for variety_id, (obj, variation) in zip(variety_ids, new_variations)] +
+                            [(tenant_id, variation['id'], 'ITEM_VARIATION', mapped[variation['id']]['parent_object_id'],
+                              mapped[variation['id']]['local_id'], variation.get('version', 0))
+                             for variation in updated_variations])
+
+    stats['items']['created'] += len(created)
+    stats['items']['updated'] += len(updated)
+    stats['items']['deleted'] += len(deleted)
+    stats['varieties']['created'] += len(new_variations)
+    stats['varieties']['updated'] += len(updated_variations)
+    stats['varieties']['deleted'] += len(removed_variations)
+
+def split_changes(objects: list, mapped: dict):
+  created, updated, deleted = [], [], []
+  for obj in objects:
+    row = mapped.get(obj['id'])
+    if obj.get('is_deleted'):
+      if row is not None:
+        deleted.append(obj)
+    elif row is None:
+      created.append(obj)
+    elif obj.get('version', 0) > row['version']:
+      updated.append(obj)
+
+  return created, updated, deleted
+
+def slugify(name: str, object_id: str):
+  # Square names are not unique, the id suffix keeps the slug unique
+  slug = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+  return f'{slug}-{object_id[-6:].lower()}'
+
+def category_name(obj: dict):
+  return obj.get('category_data', {}).get('name', '')[:255]
+
+def item_name(obj: dict):
+  return obj.get('item_data', {}).get('name', '')[:255]
+
+def item_description(obj: dict):
+  data = obj.get('item_data', {})
+  return (data.get('description_plaintext') or data.get('description') or '')[:255]
+
+def item_category(obj: dict):
+  data = obj.get('item_data', {})
+  categories = data.get('categories') or []
+  if len(categories) > 0:
+    return categories[0]['id']
+
+  return data.get('category_id')
+
+def item_variations(obj: dict):
+  return [variation for variation in obj.get('item_data', {}).get('variations', []) if not variation.get('is_deleted')]
+
+def item_price(obj: dict):
+  for variation in item_variations(obj):
+    money = variation.get('item_variation_data', {}).get('price_money')
+    if money is not None:
+      return money.get('amount', 0) / 100
+
+  return 0.0
+
+def variation_name(variation: dict):
+  return variation.get('item_variation_data', {}).get('name', '')[:255]
@@ -1,4 +1,4 @@
-import json, requests, time
+import hmac, json, requests, time
 from datetime import datetime
 
 from six.moves.urllib.request import urlopen
@@ -8,7 +8,7 @@ from jose import jwt
 
 from pypika import Table, Query, Parameter
 
-from flask import request, _request_ctx_stack, Blueprint, Response, jsonify, make_response
+from flask import g, request, _request_ctx_stack, Blueprint, Response, jsonify, make_response
 from flask_jwt_extended import (
   verify_jwt_in_request,
   create_access_token,
@@ -26,9 +26,14 @@ from grubstack.envelope import GStatusCode
 from grubstack.user import GSUser
 
 from . import app, config, logger, gsprod, gsdb, jwt
+from .tenant import get_tenant_id
+from .cache import cache_get, cache_set
 
 authentication = Blueprint('auth', __name__)
 
+# What a request authenticated with the tenant access token may do
+ACCESS_TOKEN_PERMISSIONS = ['ViewFranchises', 'ViewLocations', 'ViewMenus', 'ViewItems']
+
 class AuthError(Exception):
   def __init__(self, error, status_code):
     self.error = error
@@ -68,20 +73,28 @@ def add_token_to_database(encoded_token: str, identity_claim: str, username: str
   gsprod.execute(str(qry))
 
 def fetch_user(user_id: int):
-  gs_user = Table('gs_user')
-  
-  qry = Query.from_(
-    gs_user
-  ).select(
-    '*',
-  ).where(
-    gs_user.user_id == Parameter('%s')
-  )
+  # Loaded for every authenticated request, while gs_user is only written
+  # by core, so the row is kept for a short while
+  key = f'user_{user_id}'
+  user = cache_get(key)
+  if user is None:
+    gs_user = Table('gs_user')
 
-  user = gsprod.fetchone(str(qry), (user_id,))
+    qry = Query.from_(
+      gs_user
+    ).select(
+      '*',
+    ).where(
+      gs_user.user_id == Parameter('%s')
+    )
 
-  if user is None:
-    return None
+    user = gsprod.fetchone(str(qry), (user_id,))
+
+    if user is None:
+      return None
+
+    user = dict(user)
+    cache_set(key, user, config.getint('caching', 'user_ttl', fallback=30))
 
   username = user['username']
   first_name = user['first_name']
@@ -104,13 +117,40 @@ def fetch_user(user_id: int):
     zip_code
   )
 
+def is_tenant_member(user_id: int, tenant_id: str) -> bool:
+  key = f'tenant_member_{user_id}'
+  is_member = cache_get(key)
+  if is_member is None:
+    row = gsprod.fetchone("SELECT 1 FROM gs_user_tenant WHERE user_id = %s AND tenant_id = %s", (user_id, tenant_id,))
+    is_member = row is not None
+    cache_set(key, is_member, config.getint('tenancy', 'membership_ttl', fallback=60))
+  return is_member
+
+def get_access_token(tenant_id: str) -> str:
+  # The configured token only opens the tenant this process is configured
+  # for; any other tenant (taken from a header or the host) needs its own
+  if tenant_id == app.config['TENANT_ID']:
+    return app.config['ACCESS_TOKEN']
+
+  key = f'access_token_{tenant_id}'
+  access_token = cache_get(key)
+  if access_token is None:
+    row = gsprod.fetchone("SELECT access_token FROM gs_tenant WHERE tenant_id = %s AND is_active = 't' AND is_suspended = 'f'", (tenant_id,))
+    access_token = row['access_token'] if row is not None else ''
+    cache_set(key, access_token, config.getint('tenancy', 'access_token_ttl', fallback=60))
+  return access_token
+
+def is_valid_access_token(auth_header: str) -> bool:
+  access_token = get_access_token(get_tenant_id())
+  return access_token != '' and hmac.compare_digest(auth_header.encode('utf-8'), f'Basic {access_token}'.encode('utf-8'))
+
 def jwt_required(optional=False, fresh=False, refresh=False, locations=None):
   def decorator(func):
     @wraps(func)
     def jwtrequired(*args, **kwargs):
       auth_header = request.headers.get('Authorization')
       if auth_header != None and auth_header.split()[0] == 'Basic':
-        if auth_header != 'Basic ' + app.config['ACCESS_TOKEN']:
+        if not is_valid_access_token(auth_header):
           raise AuthError({ "code": "invalid_tenant",
                     "description":"You do not have access to this tenant." }, 403)
         return func(*args, **kwargs)
@@ -118,6 +158,12 @@ def jwt_required(optional=False, fresh=False, refresh=False, locations=None):
       user = get_current_user()
       if config.getboolean('logging', 'log_requests'):
         logger.info(f"[user:{user.username if user is not None else 'Anonymous'}] [client:{request.remote_addr}] [request:{request}]")
+      # A tenant taken from a header or host is not vouched for by the token,
+      # so the user has to belong to it
+      if user is not None and g.get('tenant_source') in ('header', 'host') and not is_tenant_member(user.id, get_tenant_id()):
+        logger.error(f'[http:403] [user:{user.id}] [tenant:{get_tenant_id()}] [client:{request.remote_addr}] [request:{request.url}]')
+        raise AuthError({ "code": "invalid_tenant",
+                  "description":"You do not have access to this tenant." }, 403)
       if user is not None:
         return func(*args, **kwargs)
       elif optional:
@@ -128,6 +174,25 @@ def jwt_required(optional=False, fresh=False, refresh=False, locations=None):
     return jwtrequired
   return decorator
 
+def get_permissions() -> list:
+  # Names of the permissions the caller of the current request holds, for
+  # endpoints that serve several kinds of data and filter by permission
+  auth_header = request.headers.get('Authorization')
+  if auth_header != None and auth_header.split()[0] == 'Basic':
+    return ACCESS_TOKEN_PERMISSIONS
+
+  user_id = get_jwt_identity()
+  if user_id == None:
+    return []
+
+  is_owner = gsprod.fetchone("SELECT is_owner FROM gs_user_tenant WHERE tenant_id = %s AND user_id = %s and is_owner = 't'", (get_tenant_id(), user_id,))
+  if is_owner != None:
+    rows = gsprod.fetchall("SELECT name FROM gs_permission")
+  else:
+    rows = gsprod.fetchall("SELECT f.permission_id, name FROM gs_user_permission f LEFT JOIN gs_permission i USING (permission_id) WHERE f.user_id = %s AND f.tenant_id = %s ORDER BY name ASC", (user_id, get_tenant_id(),))
+
+  return [row['name'] for row in rows or []]
+
 def requires_all_permissions(*expected_args):
   def decorator(func):
     @wraps(func)
@@ -135,13 +200,13 @@ def requires_all_permissions(*expected_args):
       user_id = get_jwt_identity()
       if user_id != None:
         permissions = []  
-        row = gsprod.fetchall("SELECT f.permission_id, name FROM gs_user_permission f LEFT JOIN gs_permission i USING (permission_id) WHERE f.user_id = %s AND f.tenant_id = %s ORDER BY name ASC", (user_id, app.config['TENANT_ID'],))
+        row = gsprod.fetchall("SELECT f.permission_id, name FROM gs_user_permission f LEFT JOIN gs_permission i USING (permission_id) WHERE f.user_id = %s AND f.tenant_id = %s ORDER BY name ASC", (user_id, get_tenant_id(),))
         if row != None:
           for permission in row:
             permissions.append(permission['name'])
         if config.getboolean('logging', 'log_requests'):
           logger.info(f"[user:{user if user is not None else 'Anonymous'}] [client:{request.remote_addr}] [request:{request}]")
-        is_owner = gsprod.fetchone("SELECT is_owner FROM gs_user_tenant WHERE tenant_id = %s AND user_id = %s and is_owner = 't'", (app.config['TENANT_ID'], user_id,))
+        is_owner = gsprod.fetchone("SELECT is_owner FROM gs_user_tenant WHERE tenant_id = %s AND user_id = %s and is_owner = 't'", (get_tenant_id(), user_id,))
         if is_owner != None:
           return func(*args, **kwargs)
 
@@ -168,11 +233,11 @@ def requires_permission(*expected_args):
     def permissionsrequired(*args, **kwargs):
       auth_header = request.headers.get('Authorization')
       if auth_header != None and auth_header.split()[0] == 'Basic':
-        if auth_header != 'Basic ' + app.config['ACCESS_TOKEN']:
+        if not is_valid_access_token(auth_header):
           return gs_make_response(message='Forbidden',
                           status=GStatusCode.ERROR,
                           httpstatus=403)
-        permissions = ['ViewFranchises', 'ViewLocations', 'ViewMenus', 'ViewItems']
+        permissions = ACCESS_TOKEN_PERMISSIONS
         for expected_arg in expected_args:
           if expected_arg in permissions:
             return func(*args, **kwargs)
@@ -180,13 +245,13 @@ def requires_permission(*expected_args):
       user_id = get_jwt_identity()
       if user_id != None:
         permissions = []  
-        row = gsprod.fetchall("SELECT f.permission_id, name FROM gs_user_permission f LEFT JOIN gs_permission i USING (permission_id) WHERE f.user_id = %s AND f.tenant_id = %s ORDER BY name ASC", (user_id, app.config['TENANT_ID'],))
+        row = gsprod.fetchall("SELECT f.permission_id, name FROM gs_user_permission f LEFT JOIN gs_permission i USING (permission_id) WHERE f.user_id = %s AND f.tenant_id = %s ORDER BY name ASC", (user_id, get_tenant_id(),))
         if row != None:
           for permission in row:
             permissions.append(permission['name'])
         if config.getboolean('logging', 'log_requests'):
           logger.info(f"[user:{user if user is not None else 'Anonymous'}] [client:{request.remote_addr}] [request:{request}]")
-        is_owner = gsprod.fetchone("SELECT is_owner FROM gs_user_tenant WHERE tenant_id = %s AND user_id = %s and is_owner = 't'", (app.config['TENANT_ID'], user_id,))
+        is_owner = gsprod.fetchone("SELECT is_owner FROM gs_user_tenant WHERE tenant_id = %s AND user_id = %s and is_owner = 't'", (get_tenant_id(), user_id,))
         if is_owner != None:
           return func(*args, **kwargs)
         for expected_arg in expected_args:
@@ -203,7 +268,8 @@ def requires_permission(*expected_args):
 @jwt.additional_claims_loader
 def add_claims_to_access_token(user: GSUser) -> dict:
   return {
-    'id': user.id
+    'id': user.id,
+    config.get('tenancy', 'claim', fallback='tenant_id'): get_tenant_id()
   }
 
 @jwt.user_identity_loader
@@ -288,7 +354,7 @@ def whoami() -> Response:
 
     permissions = []
 
-    is_owner = gsprod.fetchone("SELECT is_owner FROM gs_user_tenant WHERE tenant_id = %s AND user_id = %s", (app.config['TENANT_ID'], get_jwt_identity(),))
+    is_owner = gsprod.fetchone("SELECT is_owner FROM gs_user_tenant WHERE tenant_id = %s AND user_id = %s", (get_tenant_id(), get_jwt_identity(),))
     if is_owner[0] == True:
       row = gsprod.fetchall("SELECT name FROM gs_permission")
       if row != None:
@@ -296,13 +362,13 @@ def whoami() -> Response:
           permissions.append(permission['name'])
 
     else:
-      row = gsprod.fetchall("SELECT f.permission_id, name FROM gs_user_permission f LEFT JOIN gs_permission i USING (permission_id) WHERE f.user_id = %s and f.tenant_id = %s ORDER BY name ASC", (get_jwt_identity(), app.config['TENANT_ID'],))
+      row = gsprod.fetchall("SELECT f.permission_id, name FROM gs_user_permission f LEFT JOIN gs_permission i USING (permission_id) WHERE f.user_id = %s and f.tenant_id = %s ORDER BY name ASC", (get_jwt_identity(), get_tenant_id(),))
       if row != None:
         for permission in row:
           permissions.append(permission['name'])
 
     user['permissions'] = permissions
-    user['tenant_id'] = app.config['TENANT_ID']
+    user['tenant_id'] = get_tenant_id()
 
     return gs_make_response(data=user)
   except Exception as e:
@@ -351,7 +417,7 @@ def refresh() -> Response:
 @authentication.route('/auth/verify_tenant', methods=['GET'])
 @jwt_required()
 def verify_tenant():
-  row = gsprod.fetchall("SELECT * FROM gs_user_tenant WHERE user_id = %s AND tenant_id = %s", (get_jwt_identity(), app.config['TENANT_ID'],))
+  row = gsprod.fetchall("SELECT * FROM gs_user_tenant WHERE user_id = %s AND tenant_id = %s", (get_jwt_identity(), get_tenant_id(),))
   if len(row) <= 0:
     raise AuthError({"code": "invalid_tenant",
                     "description": "You do not have access to this tenant app."}, 403)
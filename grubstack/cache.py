@@ -2,6 +2,8 @@ import json
 from flask_caching import Cache
 
 from . import app, config
+from .instrumentation import record_cache
+from .tenant import get_tenant_id
 
 cacheconfig = json.loads(config.get('caching', 'config', fallback='{"CACHE_TYPE": "null"}'))
 cache = Cache(app, config=cacheconfig)
@@ -9,6 +11,22 @@ cache = Cache(app, config=cacheconfig)
 def cachekey(*args, **kwargs) -> str:
   return ''.join(args)
 
+def tenantkey(key: str) -> str:
+  # Workers are shared between tenants, so every entry lives in the
+  # namespace of the tenant it was computed for
+  return f'{get_tenant_id()}:{key}'
+
 def clearcaches(caches: list) -> None:
-  cache.delete_many(*caches)
+  cache.delete_many(*[tenantkey(key) for key in caches])
   caches.clear()
+
+def cache_get(key: str):
+  value = cache.get(tenantkey(key))
+  record_cache(value is not None)
+  return value
+
+def cache_set(key: str, value, timeout: int = None) -> None:
+  cache.set(tenantkey(key), value, timeout=timeout)
+
+def cache_delete(key: str) -> None:
+  cache.delete(tenantkey(key))
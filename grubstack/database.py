@@ -1,56 +1,363 @@
-import logging, os
+import logging, os, re, time, traceback
 import psycopg2
 import psycopg2.extras
-from flask import current_app
+from psycopg2.extensions import AsIs, encodings
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+
+from .instrumentation import record_query, count_query_shape
+from .metrics import CONNECTIONS_IN_USE, CONNECTIONS_OPEN
+from .tenant import get_tenant_id
 
 logger = logging.getLogger("grubstack")
 
+LITERAL_PATTERNS = [
+  (re.compile(r"'(?:[^']|'')*'"), '?'),
+  (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+  (re.compile(r'%s|%\(\w+\)s'), '?'),
+  (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+  (re.compile(r'\s+'), ' '),
+]
+
+READ_ONLY_PATTERN = re.compile(r'^\s*\(?\s*(select|with)\b', re.I)
+WRITE_PATTERN = re.compile(r'\b(insert|update|delete|merge)\b|\bfor\s+(update|share|no\s+key\s+update|key\s+share)\b|\bnextval\s*\(', re.I)
+
+# Replication lag in seconds; 0 when the replica has replayed everything it
+# received, so an idle primary does not make its replicas look stale
+REPLICA_LAG_QUERY = """SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                                   ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"""
+
+READ_PRIMARY_COOKIE = '_grubstack_read_primary'
+
+def is_read_only(query) -> bool:
+  if isinstance(query, bytes):
+    query = query.decode('utf-8', 'replace')
+  query = str(query)
+  return READ_ONLY_PATTERN.match(query) is not None and WRITE_PATTERN.search(query) is None
+
+def mark_write() -> None:
+  if has_request_context():
+    g.db_wrote = True
+
+def prefers_primary() -> bool:
+  # Read-your-writes: once a session has written, its reads stay on the
+  # primary for the rest of the request and, via a short-lived cookie, for
+  # the next few seconds of follow-up requests
+  if not has_request_context():
+    return False
+
+  if g.get('db_wrote'):
+    return True
+
+  try:
+    return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+  except ValueError:
+    return False
+
+def normalize_query(query) -> str:
+  if isinstance(query, bytes):
+    query = query.decode('utf-8', 'replace')
+  query = str(query)
+  for pattern, replacement in LITERAL_PATTERNS:
+    query = pattern.sub(replacement, query)
+  return query.strip()
+
+def call_site() -> str:
+  # Innermost frame outside of the database layer, i.e. the service or route
+  # that issued the statement
+  for frame in reversed(traceback.extract_stack()[:-1]):
+    if frame.filename != __file__ and 'contextlib' not in frame.filename:
+      return f'{os.path.basename(frame.filename)}/{frame.name}/{frame.lineno}'
+  return 'unknown'
+
+def timed_execute(cur, query, params=None, db=None):
+  database = db.database if db is not None else None
+  in_use = CONNECTIONS_IN_USE.labels(database or 'default')
+  in_use.inc()
+  start = time.perf_counter()
+  try:
+    result = cur.execute(query, params)
+  finally:
+    duration = time.perf_counter() - start
+    record_query(duration, query, database)
+    in_use.dec()
+
+  if db is not None:
+    db.inspect_query(cur, query, params, duration)
+
+  return result
+
+class GrubTransaction(object):
+  """
+  Unit of work on a single GrubDatabase connection. Writes are queued and sent
+  together with BEGIN/COMMIT as one multi-statement round trip; reads flush the
+  queue and run in the same round trip so they see earlier writes.
+  """
+  def __init__(self, db, tenant_id=None):
+    self.db         = db
+    self.tenant_id  = tenant_id or get_tenant_id()
+    self.cursor     = db.get_cursor()
+    self.statements = []
+    self.started    = False
+
+    if self.cursor is None:
+      raise psycopg2.InterfaceError('Unable to get a database cursor for transaction')
+
+  def execute(self, query, params=None):
+    self.statements.append(self.cursor.mogrify(query, params))
+
+  def execute_batch(self, query, argslist, page_size=100):
+    for args in argslist:
+      self.execute(query, args)
+
+  def execute_values(self, query, argslist, template=None, page_size=100):
+    # Same contract as psycopg2.extras.execute_values: the query holds a single
+    # %s that is replaced by a multi-row VALUES list, one statement per page
+    argslist = list(argslist)
+    if len(argslist) <= 0:
+      return
+
+    if template is None:
+      template = '(' + ','.join(['%s'] * len(argslist[0])) + ')'
+
+    for start in range(0, len(argslist), page_size):
+      values = b','.join(self.cursor.mogrify(template, args) for args in argslist[start:start + page_size])
+      self.execute(query, (AsIs(values.decode(encodings[self.cursor.connection.encoding])),))
+
+  def fetchone(self, query, params=None):
+    self.flush(self.cursor.mogrify(query, params))
+    return self.cursor.fetchone()
+
+  def fetchall(self, query, params=None):
+    self.flush(self.cursor.mogrify(query, params))
+    return self.cursor.fetchall()
+
+  def flush(self, *trailing):
+    statements = self.statements + list(trailing)
+    self.statements = []
+
+    if not self.started:
+      statements = [b'BEGIN', self.cursor.mogrify("SET LOCAL app.tenant_id = %s", (self.tenant_id,))] + statements
+      self.started = True
+
+    timed_execute(self.cursor, b';\n'.join(statements), db=self.db)
+
+  def commit(self):
+    if self.started or len(self.statements) > 0:
+      self.flush(b'COMMIT')
+      self.started = False
+
+  def rollback(self):
+    self.statements = []
+    if self.started:
+      try:
+        timed_execute(self.cursor, 'ROLLBACK', db=self.db)
+      except Exception as e:
+        logger.exception(e)
+      self.started = False
+
+  def close(self):
+    if self.cursor is not None:
+      self.cursor.close()
+      self.cursor = None
+
 class GrubDatabase(object):
-  def __init__(self, config, server=None, database=None, port=None, user=None, password=None, ssl=None):
+  def __init__(self, config, server=None, database=None, port=None, user=None, password=None, ssl=None, dsn=None, replicas=None):
     self.config     = config
+    self.dsn        = dsn
     self.server     = server   or os.environ.get('DATABASE_HOST')
     self.database   = database or os.environ.get('DATABASE_NAME')
     self.port       = port     or os.environ.get('DATABASE_PORT')
     self.user       = user     or os.environ.get('DATABASE_USER')
     self.password   = password or os.environ.get('DATABASE_PASSWORD')
     self.ssl        = ssl      or os.environ.get('DATABASE_SSL')
-    self.connection = self.connect()
+
+    self.slow_query_ms        = config.getint('instrumentation', 'slow_query_ms', fallback=250)
+    self.explain_slow         = config.getboolean('instrumentation', 'explain_slow_queries',
+                                                  fallback=config.getboolean('general', 'debug', fallback=False))
+    self.repeated_query_limit = config.getint('instrumentation', 'repeated_query_limit', fallback=10)
+
+    # Opened on first use so importing the app (and forking uWSGI workers
+    # from a preloaded master) does not depend on the database
+    self.connection = None
+
+    self.replicas               = [GrubDatabase(config, database=f'{self.database}-replica{i}', dsn=replica)
+                                   for i, replica in enumerate(replicas or [])]
+    self.replica_index          = 0
+    self.max_replica_lag        = config.getfloat('database', 'max_replica_lag', fallback=5.0)
+    self.replica_check_interval = config.getfloat('database', 'replica_check_interval', fallback=10.0)
+    self.read_primary_ttl       = config.getint('database', 'read_your_writes_ttl', fallback=5)
+    self.lag                    = None
+    self.lag_checked            = 0
+
+    self.connect_timeout      = config.getint('database', 'connect_timeout', fallback=3)
+    self.connect_retries      = config.getint('database', 'connect_retries', fallback=1)
+    self.connect_backoff      = config.getfloat('database', 'connect_backoff', fallback=0.2)
+    self.statement_timeout_ms = config.getint('database', 'statement_timeout_ms', fallback=30000)
+    self.read_retries         = config.getint('database', 'read_retries', fallback=1)
+    self.breaker_threshold    = config.getint('database', 'breaker_threshold', fallback=3)
+    self.breaker_cooldown     = config.getfloat('database', 'breaker_cooldown', fallback=10.0)
+    self.failures             = 0
+    self.breaker_open_until   = 0
 
   def connect(self):
-    try:
-      con = psycopg2.connect(host=self.server,
-                             database=self.database,
-                             user=self.user,
-                             password=self.password,
-                             port=self.port,
-                             sslmode=self.ssl,
-                             connect_timeout=15)
-      con.autocommit = True
+    # Short connect timeout plus a couple of quick retries absorbs a blip;
+    # anything longer is left to the circuit breaker in reconnect()
+    options = f'-c statement_timeout={self.statement_timeout_ms}' if self.statement_timeout_ms > 0 else None
 
-    except Exception as e:
-      logger.exception(e)
-      return None
+    for attempt in range(self.connect_retries + 1):
+      try:
+        if self.dsn is not None:
+          con = psycopg2.connect(self.dsn, connect_timeout=self.connect_timeout, options=options)
+        else:
+          con = psycopg2.connect(host=self.server,
+                                 database=self.database,
+                                 user=self.user,
+                                 password=self.password,
+                                 port=self.port,
+                                 sslmode=self.ssl,
+                                 connect_timeout=self.connect_timeout,
+                                 options=options)
+        con.autocommit = True
+        return con
 
-    finally:
-      return con
+      except psycopg2.OperationalError as e:
+        logger.warning(f'[db] [database:{self.database}] [attempt:{attempt + 1}] connect failed: {str(e).strip()}')
+        if attempt < self.connect_retries:
+          time.sleep(self.connect_backoff * (2 ** attempt))
+
+      except Exception as e:
+        logger.exception(e)
+        return None
+
+    return None
 
-  def reconnect(self):
+  def reconnect(self) -> bool:
+    # Circuit breaker: after breaker_threshold failed reconnects the database
+    # is treated as down for breaker_cooldown seconds and callers fail fast
+    # instead of each waiting out connect timeouts. The first caller after
+    # the cooldown probes again.
+    now = time.monotonic()
+    if now < self.breaker_open_until:
+      return False
+
+    if self.failures >= self.breaker_threshold:
+      self.breaker_open_until = now + self.breaker_cooldown
+
+    if self.connection is not None and self.connection.closed == 0:
+      CONNECTIONS_OPEN.labels(self.database or 'default').dec()
     del self.connection
     self.connection = self.connect()
 
+    if self.connection is None:
+      self.failures += 1
+      if self.failures >= self.breaker_threshold:
+        self.breaker_open_until = time.monotonic() + self.breaker_cooldown
+        logger.error(f'[db] [database:{self.database}] [failures:{self.failures}] circuit open for {self.breaker_cooldown}s')
+      return False
+
+    if self.failures >= self.breaker_threshold:
+      logger.info(f'[db] [database:{self.database}] circuit closed')
+    self.failures = 0
+    self.breaker_open_until = 0
+    CONNECTIONS_OPEN.labels(self.database or 'default').inc()
+    return True
+
+  def reset(self):
+    # Drops a connection inherited from the parent process without closing
+    # it, as closing would terminate the session the parent still owns
+    self.connection = None
+    for replica in self.replicas:
+      replica.reset()
+
+  def is_fresh(self):
+    # Lag is sampled at most every replica_check_interval seconds; a replica
+    # that cannot be reached counts as stale until the next sample
+    if time.monotonic() - self.lag_checked >= self.replica_check_interval:
+      self.lag_checked = time.monotonic()
+      self.lag = None
+      try:
+        cur = self.get_cursor()
+        if cur is not None:
+          cur.execute(REPLICA_LAG_QUERY)
+          self.lag = float(cur.fetchone()[0])
+          cur.close()
+      except Exception as e:
+        logger.warning(f'[replica] [database:{self.database}] lag check failed: {e}')
+
+    return self.lag is not None and self.lag <= self.max_replica_lag
+
+  def reader(self, query):
+    if len(self.replicas) <= 0:
+      return self
+
+    if not is_read_only(query):
+      mark_write()
+      return self
+
+    if prefers_primary():
+      return self
+
+    for i in range(len(self.replicas)):
+      replica = self.replicas[self.replica_index % len(self.replicas)]
+      self.replica_index += 1
+      if replica.is_fresh():
+        return replica
+
+    return self
+
   def get_cursor(self):
-    try:
-      cur = self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-      if cur is not None:
-        return cur
-      else:
-        self.reconnect()
+    if self.connection is None or self.connection.closed != 0:
+      if not self.reconnect():
         return None
 
+    try:
+      return self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
     except Exception as e:
-      print(e)
+      logger.exception(e)
       return None
 
+  def inspect_query(self, cur, query, params, duration):
+    # Only the first repetition over the limit is reported so a loop of 500
+    # identical lookups produces a single N+1 warning per request
+    shape = normalize_query(query)
+    if shape.lower().startswith(('set ', 'rollback')):
+      return
+
+    if self.repeated_query_limit > 0 and count_query_shape(shape) == self.repeated_query_limit + 1:
+      logger.warning(f'[n+1] [database:{self.database}] [count:>{self.repeated_query_limit}] [site:{call_site()}] [query:{shape}]')
+
+    if self.slow_query_ms > 0 and duration * 1000 >= self.slow_query_ms:
+      logger.warning(f'[slow-query] [database:{self.database}] [ms:{round(duration * 1000, 2)}] [site:{call_site()}] [query:{shape}]')
+      if self.explain_slow and isinstance(query, str) and shape.lower().startswith(('select', 'with')):
+        self.explain(cur, query, params)
+
+  def explain(self, cur, query, params=None):
+    # Use a separate cursor so the caller's pending result set is untouched
+    try:
+      explain_cur = cur.connection.cursor()
+      explain_cur.execute('EXPLAIN ' + query, params)
+      plan = '\n'.join(row[0] for row in explain_cur.fetchall())
+      explain_cur.close()
+      logger.warning(f'[slow-query] [plan]\n{plan}')
+    except Exception as e:
+      logger.exception(e)
+
+  @contextmanager
+  def transaction(self, tenant_id=None):
+    if len(self.replicas) > 0:
+      mark_write()
+    tx = GrubTransaction(self, tenant_id)
+    try:
+      yield tx
+      tx.commit()
+    except Exception:
+      tx.rollback()
+      raise
+    finally:
+      tx.close()
+
   def test_connection(self):
     try:
       if not self.connection or self.connection.closed != 0:
@@ -59,64 +366,82 @@ class GrubDatabase(object):
       print(e)
       pass
 
-  def fetchone(self, query, params=None):
-    try:
-      cur = self.get_cursor()
-      if cur is not None:
-        cur.execute("SET app.tenant_id = %s", (current_app.config.get('TENANT_ID'),))
-        cur.execute(query, params)
-        row = cur.fetchone()
-        cur.close()
-        return row
-      else:
-        self.reconnect()
+  def run(self, query, params, fetch, retries=0):
+    for attempt in range(retries + 1):
+      cur = None
+      try:
+        cur = self.get_cursor()
+        if cur is None:
+          self.lag = None
+          return None
+
+        timed_execute(cur, "SET app.tenant_id = %s", (get_tenant_id(),), self)
+        result = timed_execute(cur, query, params, self)
+        return fetch(cur) if fetch is not None else result
+
+      except psycopg2.OperationalError as e:
+        # Only a dropped connection is worth another try, and only for reads;
+        # a statement timeout or a write of unknown outcome is not
+        lost = self.connection is None or self.connection.closed != 0
+        if lost and attempt < retries:
+          logger.warning(f'[db] [database:{self.database}] connection lost, retrying read: {str(e).strip()}')
+          continue
+
+        logger.exception(e)
+        self.lag = None
         return None
 
-    except Exception as e:
-      logger.exception(e)
-      return None
+      except Exception as e:
+        logger.exception(e)
+        self.lag = None
+        return None
 
-    finally:
-      if cur is not None:
-        cur.close()
-        del cur
+      finally:
+        if cur is not None:
+          cur.close()
+
+  def fetchone(self, query, params=None):
+    reader = self.reader(query)
+    if reader is not self:
+      result = reader.fetchone(query, params)
+      # A failed replica read marks the replica stale and is retried here
+      if reader.lag is not None:
+        return result
+
+    return self.run(query, params, lambda cur: cur.fetchone(),
+                    self.read_retries if is_read_only(query) else 0)
 
   def fetchall(self, query, params=None):
+    reader = self.reader(query)
+    if reader is not self:
+      result = reader.fetchall(query, params)
+      # A failed replica read marks the replica stale and is retried here
+      if reader.lag is not None:
+        return result
+
+    return self.run(query, params, lambda cur: cur.fetchall(),
+                    self.read_retries if is_read_only(query) else 0)
+
+  def execute(self, query, params=None):
+    if len(self.replicas) > 0:
+      mark_write()
+
+    return self.run(query, params, None)
+
+  def execute_batch(self, query, argslist, page_size=100):
     try:
-      cur = self.get_cursor()
-      if cur is not None:
-        cur.execute("SET app.tenant_id = %s", (current_app.config.get('TENANT_ID'),))
-        cur.execute(query, params)
-        return cur.fetchall()
-      else:
-        self.reconnect()
-        return None
+      with self.transaction() as tx:
+        tx.execute_batch(query, argslist, page_size)
 
     except Exception as e:
       logger.exception(e)
       return None
 
-    finally:
-      if cur is not None:
-        cur.close()
-        del cur
-
-  def execute(self, query, params=None):
+  def execute_values(self, query, argslist, template=None, page_size=100):
     try:
-      cur = self.get_cursor()
-      if cur is not None:
-        cur.execute("SET app.tenant_id = %s", (current_app.config.get('TENANT_ID'),))
-        return cur.execute(query, params)
-      else:
-        self.reconnect()
-        return None
+      with self.transaction() as tx:
+        tx.execute_values(query, argslist, template, page_size)
 
     except Exception as e:
       logger.exception(e)
       return None
-
-    finally:
-      if cur is not None:
-        cur.close()
-        del cur
-
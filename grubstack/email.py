@@ -1,23 +1,151 @@
-from threading import Thread
+from threading import Thread, Lock, Condition
 from grubstack import mail, app, config
 from flask_mail import Message
-import smtplib, logging
+from .metrics import MAIL_QUEUE_DEPTH, MAIL_MESSAGES
+import smtplib, socket, heapq, itertools, logging, os, queue, time, atexit
 
 logger = logging.getLogger("grubstack")
 
-def send_async_email(app, msg):
-  with app.app_context():
-    mail.send(msg)
+class MailQueue(object):
+  """
+  Bounded outgoing mail queue served by a fixed pool of workers. Each worker
+  keeps one SMTP connection open and sends consecutive messages over it.
+  Retries wait out their backoff in a separate heap, outside the queue bound,
+  and a scheduler thread moves them into the queue once they are due.
+  """
+  def __init__(self, workers=2, capacity=1000, batch_size=50, idle_timeout=5.0, retries=3, backoff=2.0):
+    self.queue         = queue.Queue(maxsize=capacity)
+    self.delayed       = []
+    self.pending       = Condition()
+    self.sequence      = itertools.count()
+    self.workers       = workers
+    self.batch_size    = batch_size
+    self.idle_timeout  = idle_timeout
+    self.retries       = retries
+    self.backoff       = backoff
+    self.threads       = []
+    self.pid           = None
+    self.lock          = Lock()
+
+  def start(self):
+    # Started lazily so every uWSGI worker process runs its own pool
+    with self.lock:
+      if self.pid != os.getpid():
+        self.pid = os.getpid()
+        self.delayed = []
+        self.threads = [Thread(target=self.schedule, name='GrubStackMailRetry', daemon=True)]
+        for i in range(self.workers):
+          self.threads.append(Thread(target=self.run, name=f'GrubStackMailer-{i}', daemon=True))
+        for thread in self.threads:
+          thread.start()
+
+  def put(self, msg) -> bool:
+    if self.pid != os.getpid():
+      self.start()
+
+    try:
+      self.queue.put_nowait((msg, 0))
+      MAIL_QUEUE_DEPTH.set(self.queue.qsize())
+      return True
+    except queue.Full:
+      MAIL_MESSAGES.labels('dropped').inc()
+      logger.error(f'[mail] queue full, dropping message to {msg.recipients}')
+      return False
+
+  def get(self, timeout=None):
+    msg, attempt = self.queue.get(timeout=timeout)
+    MAIL_QUEUE_DEPTH.set(self.queue.qsize())
+    return msg, attempt
+
+  def schedule(self):
+    # A retry that is due waits for room in the queue instead of being dropped
+    while True:
+      with self.pending:
+        while len(self.delayed) <= 0 or self.delayed[0][0] > time.monotonic():
+          self.pending.wait(self.delayed[0][0] - time.monotonic() if len(self.delayed) > 0 else None)
+        not_before, sequence, msg, attempt = heapq.heappop(self.delayed)
+
+      self.queue.put((msg, attempt))
+      MAIL_QUEUE_DEPTH.set(self.queue.qsize())
+
+  def run(self):
+    with app.app_context():
+      while True:
+        msg, attempt = self.get()
+        try:
+          self.send_batch(msg, attempt)
+        except Exception as e:
+          logger.exception(e)
+
+  def send_batch(self, msg, attempt):
+    # Keep sending over the same connection until the queue stays empty for
+    # idle_timeout or batch_size messages have gone out
+    try:
+      with mail.connect() as conn:
+        sent = 0
+        while msg is not None:
+          self.send(conn, msg, attempt)
+          msg, sent = None, sent + 1
+          if sent < self.batch_size:
+            try:
+              msg, attempt = self.get(timeout=self.idle_timeout)
+            except queue.Empty:
+              pass
+
+    except smtplib.SMTPException as e:
+      # Connecting or logging in failed, or the server hung up; the message
+      # in hand goes back unless the server refused it for good
+      if msg is not None:
+        self.retry(msg, attempt, e)
+    except (ConnectionError, socket.error) as e:
+      if msg is not None:
+        self.retry(msg, attempt, e)
+
+  def send(self, conn, msg, attempt):
+    try:
+      conn.send(msg)
+      MAIL_MESSAGES.labels('sent').inc()
+    except smtplib.SMTPRecipientsRefused:
+      MAIL_MESSAGES.labels('failed').inc()
+      logger.error(f'Could not send email to {msg.recipients}')
+    except smtplib.SMTPServerDisconnected:
+      raise
+    except smtplib.SMTPException as e:
+      self.retry(msg, attempt, e)
+
+  def retry(self, msg, attempt, error):
+    # 5xx replies (bad credentials, refused sender, rejected data) will not
+    # change on another attempt; 4xx and lost connections might
+    permanent = isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+    if permanent or attempt >= self.retries:
+      MAIL_MESSAGES.labels('failed').inc()
+      logger.error(f'[mail] giving up on message to {msg.recipients} after {attempt + 1} attempts: {error}')
+      return
+
+    MAIL_MESSAGES.labels('retried').inc()
+    with self.pending:
+      heapq.heappush(self.delayed, (time.monotonic() + self.backoff * (2 ** attempt), next(self.sequence), msg, attempt + 1))
+      self.pending.notify()
+
+  def drain(self, timeout):
+    # Give queued messages a chance to go out before the process exits
+    deadline = time.monotonic() + timeout
+    while self.pid == os.getpid() and (not self.queue.empty() or len(self.delayed) > 0) and time.monotonic() < deadline:
+      time.sleep(0.1)
+
+mailqueue = MailQueue(workers=config.getint('mail', 'workers', fallback=2),
+                      capacity=config.getint('mail', 'queue_size', fallback=1000),
+                      batch_size=config.getint('mail', 'messages_per_connection', fallback=50),
+                      idle_timeout=config.getfloat('mail', 'connection_idle_timeout', fallback=5.0),
+                      retries=config.getint('mail', 'retries', fallback=3),
+                      backoff=config.getfloat('mail', 'retry_backoff', fallback=2.0))
+atexit.register(mailqueue.drain, config.getfloat('mail', 'shutdown_timeout', fallback=10.0))
 
 def send_email(subject, sender, recipients, text_body, html_body):
   if config.getboolean('mail', 'enabled'):
     try:
       msg = Message(subject, sender=sender, recipients=recipients)
       msg.html = html_body
-      Thread(target=send_async_email, args=(app, msg)).start()
-    except smtplib.SMTPRecipientsRefused:
-      logger.error("Could not send email to " + recipients)
-    except smtplib.SMTPAuthenticationError:
-      logger.error("Authentication error when sending email")
+      mailqueue.put(msg)
     except Exception as e:
       logger.error(e)
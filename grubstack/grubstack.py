@@ -1,11 +1,15 @@
-import logging
-from datetime import datetime
-from flask import Blueprint, Response, g, jsonify
-from . import app, gsdb
+import logging, os, time, atexit, hmac
+from flask import Blueprint, Response, request, jsonify, g
+from . import app, config, gsdb, gsprod
 from .authentication import AuthError
+from .instrumentation import start_request, is_tracking, get_timings, format_server_timing
+from .metrics import observe_request, generate_metrics, mark_process_dead
+from .tenant import TenantResolver
+from .database import READ_PRIMARY_COOKIE
 
 gsapi = Blueprint('gsapi', __name__)
 logger = logging.getLogger('grubstack')
+tenant_resolver = TenantResolver(config, gsprod)
 
 @app.errorhandler(AuthError)
 def handle_auth_error(ex):
@@ -15,7 +19,8 @@ def handle_auth_error(ex):
 
 @app.before_request
 def before_request() -> None:
-  g.start = datetime.now().timestamp()
+  start_request()
+  g.tenant_id, g.tenant_source = tenant_resolver.resolve()
 
 @app.after_request
 def after_request(response: Response) -> Response:
@@ -25,13 +30,58 @@ def after_request(response: Response) -> Response:
   if 'Cache-Control' not in response.headers:
     response.headers['Cache-Control'] = 'no-store'
 
+  # Keep this client's reads on the primary briefly after a write so it sees
+  # its own changes while replicas catch up
+  if g.get('db_wrote') and len(gsdb.replicas) > 0:
+    response.set_cookie(READ_PRIMARY_COOKIE, str(time.time() + gsdb.read_primary_ttl),
+                        max_age=gsdb.read_primary_ttl, secure=True, httponly=True, samesite='None')
+
+  if is_tracking():
+    timings = get_timings()
+
+    if config.getboolean('metrics', 'enabled', fallback=True):
+      observe_request(request.blueprint,
+                      request.url_rule.rule if request.url_rule is not None else 'unmatched',
+                      request.method,
+                      response.status_code,
+                      timings['total_ms'] / 1000)
+
+    if config.getboolean('instrumentation', 'server_timing', fallback=True):
+      response.headers['Server-Timing'] = format_server_timing(timings)
+
+    if config.getboolean('instrumentation', 'log_timings', fallback=True):
+      logger.info(f"[timing] [method:{request.method}] [endpoint:{request.endpoint}] [status:{response.status_code}] " +
+                  ' '.join(f'[{key}:{value}]' for key, value in timings.items()))
+
   return response
 
+@gsapi.route('/metrics', methods=['GET'])
+def metrics():
+  if not config.getboolean('metrics', 'enabled', fallback=True):
+    return Response(status=404)
+
+  # Only served to a scraper holding the token, never anonymously
+  access_token = config.get('metrics', 'access_token', fallback='')
+  if access_token == '':
+    return Response(status=404)
+
+  if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), f'Bearer {access_token}'.encode('utf-8')):
+    logger.error(f'[http:403] [client:{request.remote_addr}] [request:{request.url}]')
+    return Response(status=403)
+
+  body, content_type = generate_metrics()
+  return Response(body, content_type=content_type)
+
+@atexit.register
+def markprocessdead():
+  mark_process_dead(os.getpid())
+
 try:
   from uwsgidecorators import postfork
   @postfork
-  def reconnectafterfork():
-    gsdb.reconnect()
+  def resetafterfork():
+    gsdb.reset()
+    gsprod.reset()
 except ImportError:
   pass
 
@@ -0,0 +1,60 @@
+import logging, time
+from flask import g, has_request_context
+
+from .metrics import observe_query, observe_cache
+
+logger = logging.getLogger('grubstack')
+
+def start_request() -> None:
+  g.start = time.perf_counter()
+  g.query_count = 0
+  g.db_time = 0.0
+  g.cache_hits = 0
+  g.cache_misses = 0
+  g.serialization_time = 0.0
+  g.query_shapes = {}
+
+def is_tracking() -> bool:
+  return has_request_context() and 'query_count' in g
+
+def record_query(duration: float, query=None, database=None) -> None:
+  observe_query(database, query, duration)
+  if is_tracking():
+    g.query_count += 1
+    g.db_time += duration
+
+def count_query_shape(shape: str) -> int:
+  if not is_tracking():
+    return 0
+  g.query_shapes[shape] = g.query_shapes.get(shape, 0) + 1
+  return g.query_shapes[shape]
+
+def record_cache(hit: bool) -> None:
+  observe_cache(hit)
+  if is_tracking():
+    if hit:
+      g.cache_hits += 1
+    else:
+      g.cache_misses += 1
+
+def record_serialization(duration: float) -> None:
+  if is_tracking():
+    g.serialization_time += duration
+
+def get_timings() -> dict:
+  return {
+    'total_ms': round((time.perf_counter() - g.start) * 1000, 2),
+    'db_ms': round(g.db_time * 1000, 2),
+    'queries': g.query_count,
+    'cache_hits': g.cache_hits,
+    'cache_misses': g.cache_misses,
+    'serialize_ms': round(g.serialization_time * 1000, 2),
+  }
+
+def format_server_timing(timings: dict) -> str:
+  return ', '.join([
+    f"db;dur={timings['db_ms']};desc=\"{timings['queries']} queries\"",
+    f"cache;desc=\"{timings['cache_hits']} hits, {timings['cache_misses']} misses\"",
+    f"serialize;dur={timings['serialize_ms']}",
+    f"total;dur={timings['total_ms']}",
+  ])
@@ -1,31 +1,126 @@
-from . import app
-import logging
-from grubstack import gsdb
+from . import app, config
+import logging, os, queue, threading, time
+from .database import GrubDatabase
+from .tenant import get_tenant_id
 
 class GrubStackLogHandler(logging.Handler):
+  """
+  Buffers records in a bounded queue and writes them to gs_log in multi-row
+  batches from a background thread, so logging never waits on the database.
+  The writer has a connection of its own; sharing gsdb's would let its
+  BEGIN/COMMIT end a transaction a request thread has open.
+  """
+  qry = """INSERT INTO gs_log(tenant_id, log_created, log_asctime, log_name, log_loglevel, log_loglevelname,
+                              log_message, log_module, log_funcname, log_lineno, log_exception,
+                              log_process, log_thread, log_threadname)
+           VALUES %s"""
+  template = "(%s::uuid, to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
 
-  def __init__(self):
+  def __init__(self, capacity=10000, batch_size=200, flush_interval=2.0):
     logging.Handler.__init__(self)
+    self.queue          = queue.Queue(maxsize=capacity)
+    self.batch_size     = batch_size
+    self.flush_interval = flush_interval
+    self.dropped        = 0
+    self.stopping       = threading.Event()
+    self.thread         = None
+    self.pid            = None
+    self.startlock      = threading.Lock()
+    self.local          = threading.local()
+    self.db             = None
+    self.dblock         = threading.Lock()
+
+  def start(self):
+    # Started lazily so each uWSGI worker gets its own writer after fork
+    with self.startlock:
+      if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+        self.pid = os.getpid()
+        self.db  = GrubDatabase(config)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name='GrubStackLogWriter', daemon=True)
+        self.thread.start()
 
   def emit(self, record):
-    qry = """INSERT INTO gs_log(tenant_id, log_created, log_asctime, log_name, log_loglevel, log_loglevelname,
-                                         log_message, log_module, log_funcname, log_lineno, log_exception,
-                                         log_process, log_thread, log_threadname) 
-                                 VALUES (%s, %(asctime)s, %(created)s, %(name)s, %(levelno)s, %(levelname)s,
-                                         %(message)s, %(module)s, %(funcName)s,  %(lineno)s,  %(exc_text)s,
-                                         %(process)s, %(thread)s, %(threadName)s);"""
-
-    if record.exc_info:
-      record.exc_text = logging._defaultFormatter.formatException(record.exc_info)
-      record.message = logging._defaultFormatter.formatException(record.exc_info)
-    else:
-      record.exc_text = ""
-
-    params = record.__dict__
-    msg = self.format(record)
+    # Records produced while writing (database errors, slow query warnings)
+    # would feed back into the queue forever
+    if getattr(self.local, 'writing', False):
+      return
+
+    if self.thread is None or self.pid != os.getpid():
+      self.start()
+
+    # Under pressure keep warnings and errors, shed everything else
+    if record.levelno < logging.WARNING and self.queue.qsize() >= self.queue.maxsize * 0.75:
+      self.dropped += 1
+      return
+
+    try:
+      self.queue.put_nowait(self.format_row(record))
+    except queue.Full:
+      self.dropped += 1
+    except Exception:
+      self.handleError(record)
+
+  def format_row(self, record):
+    self.format(record)
+    exc_text = record.exc_text or ''
+    message = exc_text if record.exc_info else record.getMessage()
 
+    return (get_tenant_id() or app.config['TENANT_ID'], record.created, getattr(record, 'asctime', ''),
+            record.name, record.levelno, record.levelname, message, record.module, record.funcName,
+            record.lineno, exc_text, record.process, str(record.thread), record.threadName)
+
+  def drain(self, block=True):
+    rows = []
     try:
-      params['tenant_id'] = app.config['TENANT_ID']
-      #gsdb.execute(qry, params)
+      rows.append(self.queue.get(block=block, timeout=self.flush_interval if block else None))
+      while len(rows) < self.batch_size:
+        rows.append(self.queue.get_nowait())
+    except queue.Empty:
+      pass
+    return rows
+
+  def write(self, rows):
+    if self.dropped > 0:
+      dropped, self.dropped = self.dropped, 0
+      rows.append((app.config['TENANT_ID'], time.time(), '', 'grubstack', logging.WARNING, 'WARNING',
+                   f'[log] dropped {dropped} records, database log queue was full', 'loghandler', 'write',
+                   0, '', os.getpid(), str(threading.get_ident()), threading.current_thread().name))
+
+    if len(rows) <= 0:
+      return
+
+    # Rows from several tenants can share a batch; each tenant's rows are
+    # written under its own app.tenant_id so row level security accepts them
+    tenants = {}
+    for row in rows:
+      tenants.setdefault(row[0], []).append(row)
+
+    # logging.shutdown() flushes from the main thread while the writer may
+    # still be running; both share the one connection in self.db
+    self.local.writing = True
+    try:
+      with self.dblock, app.app_context():
+        for tenant_id, tenant_rows in tenants.items():
+          with self.db.transaction(tenant_id) as tx:
+            tx.execute_values(self.qry, tenant_rows, self.template, self.batch_size)
     except Exception as e:
-      print(f'Error getting database cursor for logging! Message: {e}')
\ No newline at end of file
+      print(f'Error writing {len(rows)} log records to database! Message: {e}')
+    finally:
+      self.local.writing = False
+
+  def run(self):
+    while not self.stopping.is_set():
+      self.write(self.drain())
+
+  def flush(self):
+    while not self.queue.empty():
+      self.write(self.drain(block=False))
+
+  def close(self):
+    # Called from logging.shutdown() at interpreter exit
+    self.stopping.set()
+    if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+      self.thread.join(timeout=self.flush_interval + 1)
+    self.flush()
+    logging.Handler.close(self)
@@ -0,0 +1,81 @@
+import os, re
+from prometheus_client import (
+  CollectorRegistry,
+  Counter,
+  Gauge,
+  Histogram,
+  REGISTRY,
+  CONTENT_TYPE_LATEST,
+  generate_latest,
+  multiprocess
+)
+
+# uWSGI workers are separate processes, so when PROMETHEUS_MULTIPROC_DIR is set
+# (see uwsgi.ini) every worker writes its samples to that directory and the
+# /metrics endpoint aggregates them, whichever worker serves the scrape.
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+REQUEST_LATENCY = Histogram('grubstack_request_duration_seconds', 'HTTP request latency',
+                            ['blueprint', 'route', 'method'])
+REQUEST_ERRORS = Counter('grubstack_request_errors_total', 'HTTP responses with an error status',
+                         ['blueprint', 'route', 'method', 'status'])
+QUERY_LATENCY = Histogram('grubstack_db_query_duration_seconds', 'Database statement latency',
+                          ['database', 'statement'],
+                          buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0))
+CONNECTIONS_IN_USE = Gauge('grubstack_db_connections_in_use', 'Database connections currently executing a statement',
+                           ['database'], multiprocess_mode='livesum')
+CONNECTIONS_OPEN = Gauge('grubstack_db_connections_open', 'Open database connections',
+                         ['database'], multiprocess_mode='livesum')
+CACHE_REQUESTS = Counter('grubstack_cache_requests_total', 'Cache lookups by result', ['result'])
+MAIL_QUEUE_DEPTH = Gauge('grubstack_mail_queue_depth', 'Messages waiting in the outgoing mail queue',
+                         multiprocess_mode='livesum')
+MAIL_MESSAGES = Counter('grubstack_mail_messages_total', 'Outgoing mail by outcome', ['result'])
+
+TABLE_PATTERNS = {
+  'select': re.compile(r'\bFROM\s+"?(\w+)', re.I),
+  'insert': re.compile(r'\bINTO\s+"?(\w+)', re.I),
+  'update': re.compile(r'\bUPDATE\s+"?(\w+)', re.I),
+  'delete': re.compile(r'\bFROM\s+"?(\w+)', re.I),
+}
+
+def statement_name(query) -> str:
+  if isinstance(query, bytes):
+    query = query.decode('utf-8', 'replace')
+
+  words = query.split(None, 1)
+  if len(words) <= 0:
+    return 'other'
+
+  verb = words[0].lower().rstrip(';')
+  if verb == 'begin':
+    return 'transaction'
+
+  if verb not in TABLE_PATTERNS:
+    return verb if verb.isalpha() else 'other'
+
+  match = TABLE_PATTERNS[verb].search(query)
+  return f'{verb} {match.group(1)}' if match else verb
+
+def observe_request(blueprint: str, route: str, method: str, status: int, duration: float) -> None:
+  REQUEST_LATENCY.labels(blueprint or 'none', route, method).observe(duration)
+  if status >= 500:
+    REQUEST_ERRORS.labels(blueprint or 'none', route, method, str(status)).inc()
+
+def observe_query(database: str, query, duration: float) -> None:
+  QUERY_LATENCY.labels(database or 'default', statement_name(query)).observe(duration)
+
+def observe_cache(hit: bool) -> None:
+  CACHE_REQUESTS.labels('hit' if hit else 'miss').inc()
+
+def generate_metrics():
+  if MULTIPROCESS:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  else:
+    registry = REGISTRY
+
+  return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid: int) -> None:
+  if MULTIPROCESS:
+    multiprocess.mark_process_dead(pid)
@@ -0,0 +1,77 @@
+import logging, re, threading, time
+from flask import g, request, current_app, has_app_context, has_request_context
+from flask_jwt_extended import decode_token
+
+logger = logging.getLogger('grubstack')
+
+UUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+def get_tenant_id() -> str:
+  # The tenant resolved for the current request, falling back to the tenant
+  # the process was configured with (single-tenant deployments, CLI, jobs)
+  if has_request_context() and g.get('tenant_id') is not None:
+    return g.tenant_id
+
+  if has_app_context():
+    return current_app.config.get('TENANT_ID')
+
+  return None
+
+def is_valid_tenant_id(tenant_id: str) -> bool:
+  return tenant_id is not None and UUID_PATTERN.match(tenant_id) is not None
+
+class TenantResolver(object):
+  """
+  Works out which tenant a request belongs to from the sources listed in
+  [tenancy] sources, in order: a signed claim in the access token, a request
+  header set by a trusted proxy, or the request host looked up against the
+  tenant's app urls.
+  """
+  def __init__(self, config, db):
+    self.db        = db
+    self.sources   = [source.strip() for source in config.get('tenancy', 'sources', fallback='').split(',') if source.strip() != '']
+    self.header    = config.get('tenancy', 'header', fallback='X-Tenant-ID')
+    self.claim     = config.get('tenancy', 'claim', fallback='tenant_id')
+    self.hosts_ttl = config.getint('tenancy', 'hosts_ttl', fallback=300)
+    self.hosts     = {}
+    self.lock      = threading.Lock()
+
+  def resolve(self):
+    for source in self.sources:
+      tenant_id = getattr(self, f'from_{source}')()
+      if is_valid_tenant_id(tenant_id):
+        return tenant_id, source
+
+    return None, 'default'
+
+  def from_jwt(self):
+    token = request.cookies.get(current_app.config['JWT_ACCESS_COOKIE_NAME'])
+    auth_header = request.headers.get('Authorization')
+    if token is None and auth_header is not None and auth_header.startswith('Bearer '):
+      token = auth_header.split(None, 1)[1].strip()
+
+    if token is None:
+      return None
+
+    try:
+      return decode_token(token, allow_expired=True).get(self.claim)
+    except Exception:
+      return None
+
+  def from_header(self):
+    return request.headers.get(self.header)
+
+  def from_host(self):
+    host = request.host.split(':')[0].lower()
+    tenant_id, expires = self.hosts.get(host, (None, 0))
+    if time.monotonic() < expires:
+      return tenant_id
+
+    row = self.db.fetchone("SELECT tenant_id FROM gs_tenant_app WHERE app_url = %s OR app_url = %s LIMIT 1",
+                           (host, f'https://{host}',))
+    tenant_id = str(row['tenant_id']) if row is not None else None
+
+    with self.lock:
+      self.hosts[host] = (tenant_id, time.monotonic() + self.hosts_ttl)
+
+    return tenant_id
@@ -1,7 +1,8 @@
-import logging
+import logging, time
 from flask import Response
 
 from grubstack.envelope import GResponse, GStatusCode
+from grubstack.instrumentation import record_serialization
 
 logger = logging.getLogger('grubstack')
 
@@ -14,7 +15,11 @@ def gs_make_response(*args, **kwargs):
     kwargs.get('totalpages') or 0,
   )
 
-  r = Response(xr.tojson(), status=kwargs.get('httpstatus') or 200,
+  start = time.perf_counter()
+  body = xr.tojson()
+  record_serialization(time.perf_counter() - start)
+
+  r = Response(body, status=kwargs.get('httpstatus') or 200,
                headers=kwargs.get('headers'))
   r.headers['Content-Type'] = 'application/json'
   return r
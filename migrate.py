@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Applies the schema migrations in database/migrations in order. Each file is
+recorded in gs_schema_migration with a checksum, so edited or missing files
+are caught before anything runs.
+
+A file runs in a single transaction unless one of its leading comment lines
+is `-- migrate: no-transaction`. Those files run statement by statement in
+autocommit, which is what CREATE INDEX CONCURRENTLY needs. Their statements
+must be safe to re-run (IF NOT EXISTS) since a failure can leave the file
+half applied.
+
+Every statement runs under lock_timeout. A statement that cannot get its lock
+in time is retried instead of queueing behind long transactions and blocking
+the traffic behind it.
+
+Row level security is forced on most tables, so run this as a role with
+BYPASSRLS.
+"""
+import argparse, hashlib, os, re, sys, time
+import psycopg2
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'database', 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d+)_([\w-]+)\.sql$')
+NO_TRANSACTION = re.compile(r'^--\s*migrate:\s*no-transaction\s*$', re.I | re.M)
+CONCURRENT_INDEX = re.compile(r'^\s*create\s+(?:unique\s+)?index\s+concurrently\s+(?:if\s+not\s+exists\s+)?("?[\w.]+"?)', re.I)
+
+# Arbitrary key so two deploys never run migrations at the same time
+ADVISORY_LOCK = 4750221
+
+TRACKING_TABLE = """CREATE TABLE IF NOT EXISTS gs_schema_migration (
+                      version integer PRIMARY KEY NOT NULL,
+                      name text NOT NULL,
+                      checksum text NOT NULL,
+                      applied_at timestamp with time zone NOT NULL DEFAULT now(),
+                      duration_ms integer NOT NULL
+                    )"""
+
+class Migration(object):
+  def __init__(self, path):
+    match = MIGRATION_FILE.match(os.path.basename(path))
+    self.path    = path
+    self.version = int(match.group(1))
+    self.name    = match.group(2)
+    with open(path, 'r') as f:
+      self.sql = f.read()
+    self.checksum      = hashlib.sha256(self.sql.encode('utf-8')).hexdigest()
+    self.transactional = NO_TRANSACTION.search(leading_comments(self.sql)) is None
+
+  def __str__(self):
+    return f'{self.version:04d}_{self.name}'
+
+def leading_comments(sql):
+  lines = []
+  for line in sql.splitlines():
+    if line.strip() != '' and not line.strip().startswith('--'):
+      break
+    lines.append(line.strip())
+  return '\n'.join(lines)
+
+def split_statements(sql):
+  # Splits on semicolons outside quotes, comments and dollar-quoted bodies
+  statements, start, i, length = [], 0, 0, len(sql)
+  while i < length:
+    if sql.startswith('--', i):
+      i = sql.find('\n', i)
+      i = length if i < 0 else i
+    elif sql.startswith('/*', i):
+      i = sql.find('*/', i + 2)
+      i = length if i < 0 else i + 2
+    elif sql[i] in '\'"':
+      end = sql.find(sql[i], i + 1)
+      while end >= 0 and sql.startswith(sql[i], end + 1):
+        end = sql.find(sql[i], end + 2)
+      i = length if end < 0 else end + 1
+    elif sql[i] == '$' and re.match(r'\$\w*\$', sql[i:]):
+      tag = re.match(r'\$\w*\$', sql[i:]).group(0)
+      end = sql.find(tag, i + len(tag))
+      i = length if end < 0 else end + len(tag)
+    elif sql[i] == ';':
+      statements.append(sql[start:i])
+      start, i = i + 1, i + 1
+    else:
+      i += 1
+  statements.append(sql[start:])
+
+  # Leading comments are dropped so each statement starts with its keyword
+  statements = ['\n'.join(statement.strip().splitlines()[len(leading_comments(statement.strip()).splitlines()):]) for statement in statements]
+  return [statement.strip() for statement in statements if statement.strip() != '']
+
+def load_migrations(directory):
+  migrations = [Migration(os.path.join(directory, name)) for name in os.listdir(directory) if MIGRATION_FILE.match(name)]
+  migrations.sort(key=lambda migration: migration.version)
+  for previous, current in zip(migrations, migrations[1:]):
+    if previous.version == current.version:
+      raise SystemExit(f'ERROR: {previous} and {current} share version {current.version}')
+  return migrations
+
+def connect(args):
+  options = f'-c lock_timeout={args.lock_timeout} -c statement_timeout={args.statement_timeout}'
+  if args.dsn is not None:
+    con = psycopg2.connect(args.dsn, options=options, application_name='grubstack-migrate')
+  else:
+    con = psycopg2.connect(host=os.environ.get('DATABASE_HOST'),
+                           database=os.environ.get('DATABASE_NAME'),
+                           user=os.environ.get('DATABASE_USER'),
+                           password=os.environ.get('DATABASE_PASSWORD'),
+                           port=os.environ.get('DATABASE_PORT'),
+                           sslmode=os.environ.get('DATABASE_SSL'),
+                           options=options,
+                           application_name='grubstack-migrate')
+  con.autocommit = True
+  return con
+
+def applied_migrations(cur):
+  cur.execute(TRACKING_TABLE)
+  cur.execute("SELECT version, name, checksum FROM gs_schema_migration ORDER BY version")
+  return {version: (name, checksum) for version, name, checksum in cur.fetchall()}
+
+def verify(migrations, applied):
+  # Refuse to run anything if history no longer matches what is on disk
+  errors = []
+  known = {migration.version: migration for migration in migrations}
+  for version, (name, checksum) in applied.items():
+    migration = known.get(version)
+    if migration is None:
+      errors.append(f'{version:04d}_{name} is applied but missing from disk')
+    elif migration.checksum != checksum:
+      errors.append(f'{migration} changed after it was applied')
+  return errors
+
+def with_lock_retries(cur, statement, args):
+  for attempt in range(args.lock_retries + 1):
+    try:
+      cur.execute(statement)
+      return
+    except psycopg2.errors.LockNotAvailable:
+      if attempt >= args.lock_retries:
+        raise
+      print(f'  lock not available, retrying in {args.lock_backoff * (2 ** attempt):.1f}s')
+      time.sleep(args.lock_backoff * (2 ** attempt))
+
+def drop_invalid_index(cur, statement):
+  # A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind that IF
+  # NOT EXISTS would then silently accept; drop it so the build starts over
+  match = CONCURRENT_INDEX.match(statement)
+  if match is None:
+    return
+
+  cur.execute("""SELECT i.indisvalid FROM pg_index i
+                  WHERE i.indexrelid = to_regclass(%s)""", (match.group(1),))
+  row = cur.fetchone()
+  if row is not None and not row[0]:
+    print(f'  dropping invalid index {match.group(1)} left by an earlier attempt')
+    cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}')
+
+def apply(con, migration, args):
+  start = time.monotonic()
+  with con.cursor() as cur:
+    if migration.transactional:
+      for attempt in range(args.lock_retries + 1):
+        try:
+          cur.execute('BEGIN')
+          cur.execute(migration.sql)
+          break
+        except psycopg2.errors.LockNotAvailable:
+          cur.execute('ROLLBACK')
+          if attempt >= args.lock_retries:
+            raise
+          print(f'  lock not available, retrying in {args.lock_backoff * (2 ** attempt):.1f}s')
+          time.sleep(args.lock_backoff * (2 ** attempt))
+        except Exception:
+          cur.execute('ROLLBACK')
+          raise
+    else:
+      for statement in split_statements(migration.sql):
+        drop_invalid_index(cur, statement)
+        with_lock_retries(cur, statement, args)
+
+    duration_ms = int((time.monotonic() - start) * 1000)
+    cur.execute("INSERT INTO gs_schema_migration (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+                (migration.version, migration.name, migration.checksum, duration_ms,))
+    if migration.transactional:
+      cur.execute('COMMIT')
+
+  return duration_ms
+
+def status(migrations, applied):
+  for migration in migrations:
+    state = 'applied' if migration.version in applied else 'pending'
+    mode = '' if migration.transactional else ' (no transaction)'
+    print(f'{state:>8}  {migration}{mode}')
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Apply GrubStack schema migrations')
+  parser.add_argument('command', nargs='?', choices=['up', 'status'], default='up')
+  parser.add_argument('--dsn', dest='dsn', help='connection string, defaults to DATABASE_URL or the DATABASE_* variables')
+  parser.add_argument('--dir', dest='directory', default=MIGRATIONS_DIR, help='directory holding the migration files')
+  parser.add_argument('--target', dest='target', type=int, help='stop after this version')
+  parser.add_argument('--dry-run', dest='dry_run', action='store_true', help='list what would run without applying it')
+  parser.add_argument('--lock-timeout', dest='lock_timeout', default='5s', help='lock_timeout for every statement')
+  parser.add_argument('--statement-timeout', dest='statement_timeout', default='0', help='statement_timeout for every statement')
+  parser.add_argument('--lock-retries', dest='lock_retries', type=int, default=5, help='attempts after a lock timeout')
+  parser.add_argument('--lock-backoff', dest='lock_backoff', type=float, default=1.0, help='seconds before the first lock retry, doubled each time')
+  args = parser.parse_args()
+
+  # Read after .env is loaded so DATABASE_URL may come from it
+  load_dotenv()
+  if args.dsn is None:
+    args.dsn = os.environ.get('DATABASE_URL')
+  migrations = load_migrations(args.directory)
+  con = connect(args)
+
+  with con.cursor() as cur:
+    cur.execute("SELECT pg_try_advisory_lock(%s)", (ADVISORY_LOCK,))
+    if not cur.fetchone()[0]:
+      raise SystemExit('ERROR: another migration run holds the lock')
+
+    applied = applied_migrations(cur)
+
+  errors = verify(migrations, applied)
+  for error in errors:
+    print(f'ERROR: {error}')
+  if len(errors) > 0:
+    sys.exit(1)
+
+  if args.command == 'status':
+    status(migrations, applied)
+    sys.exit(0)
+
+  pending = [migration for migration in migrations
+             if migration.version not in applied and (args.target is None or migration.version <= args.target)]
+  if len(pending) <= 0:
+    print('INFO: Database is up to date.')
+
+  for migration in pending:
+    if args.dry_run:
+      print(f'would apply {migration}')
+      continue
+
+    print(f'applying {migration}' + ('' if migration.transactional else ' (no transaction)'))
+    try:
+      duration_ms = apply(con, migration, args)
+    except Exception as e:
+      print(f'ERROR: {migration} failed: {str(e).strip()}')
+      sys.exit(1)
+    print(f'  done in {duration_ms} ms')
+
+  con.close()
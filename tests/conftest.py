@@ -0,0 +1,6 @@
+import os
+
+# The app reads its configuration at import, so point it at the test config
+# before any test module imports grubstack
+os.environ.setdefault('GRUBSTACK_CONFIG_FILE', os.path.join(os.path.dirname(os.path.realpath(__file__)), 'grubstack.ini'))
+os.environ.setdefault('TENANT_ID', '11111111-1111-1111-1111-111111111111')
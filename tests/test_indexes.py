@@ -0,0 +1,86 @@
+"""
+Checks that the hot lookups are planned on the tenant-leading indexes from
+database/migrations. Needs a database with grubstack.sql and every migration
+applied, given as GRUBSTACK_TEST_DATABASE_URL; skipped otherwise.
+
+The tables in a test database are nearly empty, so sequential scans are
+switched off for each EXPLAIN. A query the index cannot serve still falls
+back to one and fails the test.
+"""
+import json, os
+
+import pytest
+
+DSN = os.environ.get('GRUBSTACK_TEST_DATABASE_URL')
+TENANT_ID = os.environ.get('TENANT_ID', '11111111-1111-1111-1111-111111111111')
+
+pytestmark = pytest.mark.skipif(DSN is None, reason='GRUBSTACK_TEST_DATABASE_URL is not set')
+
+# (query, index expected in the plan); tenant_id = %(tenant_id)s stands in
+# for the predicate tenant_isolation_policy adds to every statement
+HOT_QUERIES = [
+  ("SELECT item_id, price FROM gs_menu_item WHERE tenant_id = %(tenant_id)s AND menu_id = 1",
+   'gs_menu_item_tenant_menu_item_key'),
+  ("SELECT menu_id FROM gs_menu_item WHERE tenant_id = %(tenant_id)s AND item_id = 1",
+   'gs_menu_item_tenant_item_idx'),
+  ("SELECT ingredient_id FROM gs_item_ingredient WHERE tenant_id = %(tenant_id)s AND item_id = 1",
+   'gs_item_ingredient_tenant_item_ingredient_key'),
+  ("SELECT item_id FROM gs_item_ingredient WHERE tenant_id = %(tenant_id)s AND ingredient_id = 1",
+   'gs_item_ingredient_tenant_ingredient_idx'),
+  ("SELECT variety_id FROM gs_item_variety WHERE tenant_id = %(tenant_id)s AND item_id = 1",
+   'gs_item_variety_tenant_item_variety_key'),
+  ("SELECT item_id FROM gs_item_variety WHERE tenant_id = %(tenant_id)s AND variety_id = 1",
+   'gs_item_variety_tenant_variety_idx'),
+  ("SELECT ingredient_id FROM gs_variety_ingredient WHERE tenant_id = %(tenant_id)s AND variety_id = 1",
+   'gs_variety_ingredient_tenant_variety_ingredient_key'),
+  ("SELECT menu_id FROM gs_location_menu WHERE tenant_id = %(tenant_id)s AND location_id = 1",
+   'gs_location_menu_tenant_location_menu_key'),
+  ("SELECT location_id FROM gs_location_menu WHERE tenant_id = %(tenant_id)s AND menu_id = 1",
+   'gs_location_menu_tenant_menu_idx'),
+  ("SELECT order_type_id FROM gs_location_order_type WHERE tenant_id = %(tenant_id)s AND location_id = 1",
+   'gs_location_order_type_tenant_location_order_type_key'),
+  ("""SELECT day, open_hour, open_minute, close_hour, close_minute FROM gs_location_working_hour
+       WHERE tenant_id = %(tenant_id)s AND location_id = 1 AND working_hour_type_id = 1""",
+   'gs_location_working_hour_'),
+  ("SELECT menu_id, name FROM gs_menu WHERE tenant_id = %(tenant_id)s ORDER BY name LIMIT 10",
+   'gs_menu_tenant_name_idx'),
+  ("SELECT item_id, name FROM gs_item WHERE tenant_id = %(tenant_id)s ORDER BY name LIMIT 10",
+   'gs_item_tenant_name_idx'),
+  ("SELECT menu_id FROM gs_menu WHERE tenant_id = %(tenant_id)s AND slug = 'lunch'",
+   'gs_menu_tenant_slug_idx'),
+  ("SELECT item_id FROM gs_item WHERE tenant_id = %(tenant_id)s AND slug = 'burger'",
+   'gs_item_tenant_slug_idx'),
+  ("SELECT local_id FROM gs_square_object WHERE tenant_id = %(tenant_id)s AND object_type = 'CATEGORY'",
+   'gs_square_object_tenant_type_idx'),
+  ("SELECT log_id FROM gs_log WHERE tenant_id = %(tenant_id)s ORDER BY log_created DESC LIMIT 50",
+   'gs_log_tenant_created_idx'),
+]
+
+@pytest.fixture(scope='module')
+def connection():
+  import psycopg2
+  con = psycopg2.connect(DSN)
+  yield con
+  con.close()
+
+def plan_indexes(plan: dict) -> list:
+  indexes = [plan['Index Name']] if 'Index Name' in plan else []
+  for child in plan.get('Plans', []):
+    indexes.extend(plan_indexes(child))
+  return indexes
+
+@pytest.mark.parametrize('query, index', HOT_QUERIES, ids=[index for query, index in HOT_QUERIES])
+def test_hot_query_uses_tenant_index(connection, query, index):
+  with connection.cursor() as cur:
+    try:
+      cur.execute("SET LOCAL enable_seqscan = off")
+      cur.execute("SELECT set_config('app.tenant_id', %s, true)", (TENANT_ID,))
+      cur.execute("EXPLAIN (FORMAT JSON) " + query, { 'tenant_id': TENANT_ID })
+      plan = cur.fetchone()[0]
+    finally:
+      connection.rollback()
+
+  if isinstance(plan, str):
+    plan = json.loads(plan)
+  indexes = plan_indexes(plan[0]['Plan'])
+  assert any(name.startswith(index) for name in indexes), f'{index} not used, plan scans {indexes or "no index"}'
@@ -0,0 +1,108 @@
+import os, re
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from grubstack.application.modules.products.items.items_utilities import format_item, is_sale_active
+from grubstack.application.modules.products.menus import menus_service
+from grubstack.application.modules.products.menus.menus_service import MenuService
+
+DSN = os.environ.get('GRUBSTACK_TEST_DATABASE_URL')
+TENANT_ID = os.environ.get('TENANT_ID', '11111111-1111-1111-1111-111111111111')
+
+NOW = datetime(2026, 6, 1, 12, tzinfo=timezone.utc)
+
+class RecordingDatabase(object):
+  """
+  Stands in for gsdb: records the statements MenuService sends, rendered
+  with their parameters.
+  """
+  def __init__(self):
+    self.statements = []
+
+  def execute(self, query, params=None):
+    self.statements.append(query % tuple(repr(param) for param in params or ()))
+    return True
+
+class ConnectionDatabase(object):
+  """
+  Stands in for gsdb on a real connection, inside the test's transaction.
+  Unlike GrubDatabase it raises on errors, so a broken statement fails the
+  test instead of being logged.
+  """
+  def __init__(self, connection):
+    self.connection = connection
+
+  def execute(self, query, params=None):
+    with self.connection.cursor() as cur:
+      cur.execute(query, params)
+    return True
+
+  def fetchall(self, query, params=None):
+    import psycopg2.extras
+    with self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+      cur.execute(query, params)
+      return cur.fetchall()
+
+@pytest.fixture
+def no_publishing(monkeypatch):
+  monkeypatch.setattr(menus_service.publishing_service, 'invalidate', lambda kind, ids: None)
+
+def test_add_item_inserts_as_many_values_as_columns(monkeypatch, no_publishing):
+  db = RecordingDatabase()
+  monkeypatch.setattr(menus_service, 'gsdb', db)
+
+  MenuService().add_item(3, 5, {})
+
+  columns, values = re.search(r'INSERT INTO "gs_menu_item" \((.*?)\) VALUES \((.*?)\)', db.statements[0]).groups()
+  assert len(columns.split(',')) == len(values.split(','))
+
+@pytest.mark.skipif(DSN is None, reason='GRUBSTACK_TEST_DATABASE_URL is not set')
+def test_add_item_inserts_a_row(monkeypatch, no_publishing):
+  import psycopg2
+  connection = psycopg2.connect(DSN)
+  try:
+    with connection.cursor() as cur:
+      cur.execute("SELECT set_config('app.tenant_id', %s, true)", (TENANT_ID,))
+      cur.execute("INSERT INTO gs_tenant (tenant_id, slug, access_token) VALUES (%s, 'test', 'test') ON CONFLICT DO NOTHING", (TENANT_ID,))
+      cur.execute("""INSERT INTO gs_menu (tenant_id, name, description, thumbnail_url, slug)
+                     VALUES (%s, 'Test menu', '', '', 'test-menu') RETURNING menu_id""", (TENANT_ID,))
+      menu_id = cur.fetchone()[0]
+      cur.execute("""INSERT INTO gs_item (tenant_id, name, description, thumbnail_url, slug)
+                     VALUES (%s, 'Test item', '', '', 'test-item') RETURNING item_id""", (TENANT_ID,))
+      item_id = cur.fetchone()[0]
+
+    monkeypatch.setattr(menus_service, 'gsdb', ConnectionDatabase(connection))
+    service = MenuService()
+    service.add_item(menu_id, item_id, {})
+
+    items = service.get_items(menu_id)
+    assert [item['item_id'] for item in items] == [item_id]
+    assert items[0]['is_onsale'] is False
+    assert items[0]['sale_start'] is None and items[0]['sale_end'] is None
+  finally:
+    connection.rollback()
+    connection.close()
+
+@pytest.mark.parametrize('sale_start, sale_end, expected', [
+  (None, None, True),
+  (NOW - timedelta(days=1), None, True),
+  (NOW + timedelta(days=1), None, False),
+  (None, NOW - timedelta(seconds=1), False),
+  (None, NOW + timedelta(days=1), True),
+  ((NOW - timedelta(days=1)).isoformat(), (NOW + timedelta(days=1)).isoformat(), True),
+  (None, (NOW - timedelta(days=1)).isoformat(), False),
+])
+def test_sale_is_active_only_inside_its_window(sale_start, sale_end, expected):
+  item = {'is_onsale': True, 'sale_start': sale_start, 'sale_end': sale_end}
+  assert is_sale_active(item, NOW) is expected
+
+def test_sale_is_never_active_without_the_flag():
+  assert is_sale_active({'is_onsale': False, 'sale_start': None, 'sale_end': None}, NOW) is False
+
+def test_format_item_reports_an_ended_sale_as_off():
+  item = {'item_id': 5, 'name': 'x', 'description': '', 'thumbnail_url': '', 'slug': 'x', 'price': 10.0,
+          'sale_price': 8.0, 'is_onsale': True, 'sale_start': None, 'sale_end': datetime(2020, 1, 1, tzinfo=timezone.utc)}
+  json_data = format_item(item)
+  assert json_data['is_onsale'] is False
+  assert json_data['sale_end'] == '2020-01-01T00:00:00+00:00'
@@ -0,0 +1,298 @@
+import copy, re
+from contextlib import contextmanager
+
+import pytest
+
+from grubstack import app
+from grubstack.application.modules.square import square_sync_service
+from grubstack.application.modules.square.square_sync_service import SquareSyncService
+
+TENANT_ID = '11111111-1111-1111-1111-111111111111'
+
+class FakeResult(object):
+  def __init__(self, body, errors=None):
+    self.body = body
+    self.errors = errors
+
+  def is_success(self):
+    return self.errors is None
+
+class FakeSquare(object):
+  """
+  Stands in for SquareService: answers search_catalog from a list of pages,
+  following the cursor each page hands out, and records every request body.
+  """
+  def __init__(self):
+    self.pages = {}
+    self.requests = []
+    self.errors = None
+
+  def serve(self, pages: list, latest_time: str):
+    self.pages = {}
+    for i, objects in enumerate(pages):
+      body = { 'objects': objects }
+      if i == 0:
+        body['latest_time'] = latest_time
+      if i + 1 < len(pages):
+        body['cursor'] = f'page-{i + 1}'
+      self.pages[None if i == 0 else f'page-{i}'] = body
+
+  def search_catalog(self, body: dict):
+    self.requests.append(copy.deepcopy(body))
+    if self.errors is not None:
+      return FakeResult({}, self.errors)
+    return FakeResult(self.pages.get(body.get('cursor'), { 'objects': [] }))
+
+class FakeTransaction(object):
+  def __init__(self, db):
+    self.db = db
+
+  def fetchall(self, query, params=None):
+    if 'FROM gs_square_object' in query:
+      object_ids, parent_ids = params
+      return [dict(row) for row in self.db.mapping.values()
+              if row['square_object_id'] in object_ids or row['parent_object_id'] in parent_ids]
+
+    match = re.search(r'nextval', query)
+    if match is not None:
+      table, column, count = params
+      ids = []
+      for i in range(count):
+        self.db.sequences[table] = self.db.sequences.get(table, 0) + 1
+        ids.append(self.db.sequences[table])
+      return [{ 'id': id } for id in ids]
+
+    raise AssertionError(f'unexpected query: {query}')
+
+  def execute(self, query, params=None):
+    query = ' '.join(query.split())
+    if query.startswith('DELETE FROM gs_square_object'):
+      for object_id in params[0]:
+        self.db.mapping.pop(object_id, None)
+      return
+
+    if 'menu_id IN (SELECT local_id FROM gs_square_object' in query:
+      menu_ids = [row['local_id'] for row in self.db.mapping.values() if row['object_type'] == 'CATEGORY']
+      self.db.tables['gs_menu_item'] = [row for row in self.db.table('gs_menu_item')
+                                        if not (row['item_id'] in params[0] and row['menu_id'] in menu_ids)]
+      return
+
+    match = re.match(r'DELETE FROM (\w+) WHERE (\w+) = ANY\(%s\)$', query)
+    if match is None:
+      raise AssertionError(f'unexpected statement: {query}')
+    table, column = match.groups()
+    self.db.tables[table] = [row for row in self.db.table(table) if row[column] not in params[0]]
+
+  def execute_values(self, query, argslist, template=None, page_size=100):
+    query = ' '.join(query.split())
+    if len(argslist) <= 0:
+      return
+
+    if query.startswith('INSERT INTO gs_square_object'):
+      for tenant_id, object_id, object_type, parent_id, local_id, version in argslist:
+        self.db.mapping[object_id] = { 'square_object_id': object_id, 'object_type': object_type,
+                                       'parent_object_id': parent_id, 'local_id': local_id, 'version': version }
+      return
+
+    match = re.match(r'INSERT INTO (\w+) \(([^)]*)\) VALUES %s$', query)
+    if match is not None:
+      table, columns = match.group(1), match.group(2).split(', ')
+      self.db.table(table).extend(dict(zip(columns, row)) for row in argslist)
+      return
+
+    match = re.match(r'UPDATE (\w+) \w+ SET .* FROM \(VALUES %s\) AS \w+ \(([^)]*)\)', query)
+    if match is None:
+      raise AssertionError(f'unexpected statement: {query}')
+    table, columns = match.group(1), match.group(2).split(', ')
+    for values in argslist:
+      changes = dict(zip(columns, values))
+      for row in self.db.table(table):
+        if row[columns[0]] == changes[columns[0]]:
+          row.update(changes)
+
+class FakeDatabase(object):
+  """
+  In-memory stand-in for gsdb holding just the tables the sync touches. A
+  transaction that raises leaves everything as it was, like a rollback.
+  """
+  def __init__(self):
+    self.tables = {}
+    self.mapping = {}
+    self.sequences = {}
+    self.begin_time = None
+
+  def table(self, name: str):
+    return self.tables.setdefault(name, [])
+
+  @contextmanager
+  def transaction(self, tenant_id=None):
+    saved = copy.deepcopy((self.tables, self.mapping))
+    try:
+      yield FakeTransaction(self)
+    except Exception:
+      self.tables, self.mapping = saved
+      raise
+
+  def fetchone(self, query, params=None):
+    assert 'FROM gs_square_sync' in query
+    return None if self.begin_time is None else { 'begin_time': self.begin_time }
+
+  def execute(self, query, params=None):
+    assert 'INSERT INTO gs_square_sync' in query
+    self.begin_time = params[1]
+
+class FakePublishing(object):
+  def __init__(self):
+    self.invalidated = 0
+
+  def invalidate_all(self):
+    self.invalidated += 1
+
+@pytest.fixture
+def db(monkeypatch):
+  db = FakeDatabase()
+  monkeypatch.setattr(square_sync_service, 'gsdb', db)
+  return db
+
+@pytest.fixture
+def publishing(monkeypatch):
+  publishing = FakePublishing()
+  monkeypatch.setattr(square_sync_service, 'publishing_service', publishing)
+  return publishing
+
+@pytest.fixture
+def square():
+  return FakeSquare()
+
+@pytest.fixture
+def sync(db, publishing, square):
+  with app.app_context():
+    app.config['TENANT_ID'] = TENANT_ID
+    yield SquareSyncService(square, batch_size=2)
+
+def category(object_id: str, name: str, version: int = 1, is_deleted: bool = False):
+  return { 'type': 'CATEGORY', 'id': object_id, 'version': version, 'is_deleted': is_deleted,
+           'category_data': { 'name': name } }
+
+def variation(object_id: str, name: str, amount: int, version: int = 1):
+  return { 'type': 'ITEM_VARIATION', 'id': object_id, 'version': version,
+           'item_variation_data': { 'name': name, 'price_money': { 'amount': amount, 'currency': 'USD' } } }
+
+def item(object_id: str, name: str, category_id: str, variations: list, version: int = 1, is_deleted: bool = False):
+  return { 'type': 'ITEM', 'id': object_id, 'version': version, 'is_deleted': is_deleted,
+           'item_data': { 'name': name, 'description': f'{name} description',
+                          'categories': [{ 'id': category_id }], 'variations': variations } }
+
+BURGER = item('ITEM1', 'Burger', 'CAT1', [variation('VAR1', 'Single', 899), variation('VAR2', 'Double', 1199)])
+
+def test_first_sync_creates_and_maps_objects(sync, db, square, publishing):
+  square.serve([[category('CAT1', 'Lunch'), BURGER]], '2024-05-01T00:00:00Z')
+
+  stats = sync.sync()
+
+  assert stats['menus'] == { 'created': 1, 'updated': 0, 'deleted': 0 }
+  assert stats['items'] == { 'created': 1, 'updated': 0, 'deleted': 0 }
+  assert stats['varieties'] == { 'created': 2, 'updated': 0, 'deleted': 0 }
+
+  menu_id = db.mapping['CAT1']['local_id']
+  item_id = db.mapping['ITEM1']['local_id']
+  assert [menu['name'] for menu in db.table('gs_menu')] == ['Lunch']
+  assert [(row['menu_id'], row['item_id'], row['price']) for row in db.table('gs_menu_item')] == [(menu_id, item_id, 8.99)]
+  assert sorted(variety['name'] for variety in db.table('gs_variety')) == ['Double', 'Single']
+  assert all(row['item_id'] == item_id for row in db.table('gs_item_variety'))
+  assert db.mapping['VAR1']['parent_object_id'] == 'ITEM1'
+
+  assert square.requests[0]['include_deleted_objects'] is False
+  assert 'begin_time' not in square.requests[0]
+  assert db.begin_time == '2024-05-01T00:00:00Z'
+  assert publishing.invalidated == 1
+
+def test_follows_cursor_across_pages(sync, db, square):
+  square.serve([[category('CAT1', 'Lunch')],
+                [category('CAT2', 'Dinner')],
+                [category('CAT3', 'Drinks'), BURGER]], '2024-05-01T00:00:00Z')
+
+  stats = sync.sync()
+
+  assert [request.get('cursor') for request in square.requests] == [None, 'page-1', 'page-2']
+  assert stats['menus']['created'] == 3
+  assert stats['items']['created'] == 1
+  # The catalog time of the first page is what the run covers
+  assert db.begin_time == '2024-05-01T00:00:00Z'
+
+def test_incremental_sync_requests_changes_since_last_run(sync, db, square):
+  square.serve([[category('CAT1', 'Lunch'), BURGER]], '2024-05-01T00:00:00Z')
+  sync.sync()
+
+  square.serve([[]], '2024-05-02T00:00:00Z')
+  stats = sync.sync()
+
+  assert square.requests[-1]['begin_time'] == '2024-05-01T00:00:00Z'
+  assert square.requests[-1]['include_deleted_objects'] is True
+  assert stats['items'] == { 'created': 0, 'updated': 0, 'deleted': 0 }
+  assert db.begin_time == '2024-05-02T00:00:00Z'
+
+def test_full_sync_ignores_stored_cursor(sync, db, square):
+  db.begin_time = '2024-05-01T00:00:00Z'
+  square.serve([[category('CAT1', 'Lunch')]], '2024-05-03T00:00:00Z')
+
+  sync.sync(full=True)
+
+  assert 'begin_time' not in square.requests[0]
+  assert db.begin_time == '2024-05-03T00:00:00Z'
+
+def test_updates_newer_versions_and_skips_unchanged(sync, db, square):
+  square.serve([[category('CAT1', 'Lunch'), BURGER]], '2024-05-01T00:00:00Z')
+  sync.sync()
+  item_id = db.mapping['ITEM1']['local_id']
+
+  # Same category version, renamed item that lost its double variation
+  square.serve([[category('CAT1', 'Renamed but same version'),
+                 item('ITEM1', 'Cheeseburger', 'CAT1', [variation('VAR1', 'Single', 999, version=2)], version=2)]],
+               '2024-05-02T00:00:00Z')
+  stats = sync.sync()
+
+  assert stats['menus'] == { 'created': 0, 'updated': 0, 'deleted': 0 }
+  assert stats['items'] == { 'created': 0, 'updated': 1, 'deleted': 0 }
+  assert stats['varieties'] == { 'created': 0, 'updated': 1, 'deleted': 1 }
+
+  assert [menu['name'] for menu in db.table('gs_menu')] == ['Lunch']
+  assert [(row['item_id'], row['name']) for row in db.table('gs_item')] == [(item_id, 'Cheeseburger')]
+  assert [variety['name'] for variety in db.table('gs_variety')] == ['Single']
+  assert 'VAR2' not in db.mapping
+  assert [(row['item_id'], row['price']) for row in db.table('gs_menu_item')] == [(item_id, 9.99)]
+  assert db.mapping['ITEM1']['version'] == 2
+
+def test_deleted_objects_remove_local_rows_and_mapping(sync, db, square):
+  square.serve([[category('CAT1', 'Lunch'), BURGER]], '2024-05-01T00:00:00Z')
+  sync.sync()
+
+  square.serve([[category('CAT1', 'Lunch', version=2, is_deleted=True),
+                 item('ITEM1', 'Burger', 'CAT1', [], version=2, is_deleted=True)]], '2024-05-02T00:00:00Z')
+  stats = sync.sync()
+
+  assert stats['menus']['deleted'] == 1
+  assert stats['items']['deleted'] == 1
+  assert stats['varieties']['deleted'] == 2
+  for table in ['gs_menu', 'gs_menu_item', 'gs_item', 'gs_item_variety', 'gs_variety']:
+    assert db.table(table) == [], table
+  assert db.mapping == {}
+
+def test_deleted_object_never_synced_is_ignored(sync, db, square):
+  db.begin_time = '2024-05-01T00:00:00Z'
+  square.serve([[category('CAT9', 'Gone', is_deleted=True)]], '2024-05-02T00:00:00Z')
+
+  stats = sync.sync()
+
+  assert stats['menus'] == { 'created': 0, 'updated': 0, 'deleted': 0 }
+  assert db.table('gs_menu') == []
+
+def test_failed_search_keeps_cursor(sync, db, square):
+  db.begin_time = '2024-05-01T00:00:00Z'
+  square.errors = [{ 'code': 'UNAUTHORIZED' }]
+
+  with pytest.raises(RuntimeError):
+    sync.sync()
+
+  assert db.begin_time == '2024-05-01T00:00:00Z'
+  assert db.tables == {}